@@ -10,26 +10,52 @@ from sys import stderr
 
 import pygame as pg
 
+import game.packets  # Registers every packet before protocol checksums are compared.
 from client.netclient import NetClient
 from common.assets import load_node_asset
 from common.behaviours.camera import *  # type: ignore
 from common.behaviours.ui.canvas import Canvas
 from common.behaviours.ui.ui_button import UIButton
 from common.behaviours.ui.ui_label import UILabel
+from common.capture import CLIENT, PacketCapture
+from common.compression import load_dictionary
 from common.game import Game
+from common.net_metrics import MetricsExporter
+from common.network import set_compression_dictionary
 from common.node import Node
 
 
 async def main():
+    # The compression dictionary is part of the protocol checksum, so it must be
+    # loaded before the server compares protocol checksums with us.
+    set_compression_dictionary(load_dictionary())
     pg.init()
 
     game = Game(
         display=pg.display.set_mode((1280, 720), pg.RESIZABLE),
         scene=load_node_asset("scenes/client/main_menu.json"),
-        network=NetClient("localhost", 16214),
+        network=NetClient(
+            "localhost",
+            16214,
+            threaded_io=os.environ.get("MAGUS_NET_THREAD") == "1",
+        ),
         global_object=load_node_asset("client_global_object.json"),
     )
 
+    capture_path = os.environ.get("MAGUS_CAPTURE")
+    if capture_path:
+        game.network.start_capture(
+            PacketCapture(capture_path, CLIENT, lambda: game.simulation.tick_id)
+        )
+
+    metrics_target = os.environ.get("MAGUS_METRICS")
+    if metrics_target:
+        game.network.start_metrics_export(
+            MetricsExporter.from_target(
+                metrics_target, float(os.environ.get("MAGUS_METRICS_INTERVAL", 5))
+            )
+        )
+
     while not game.stopped:
         try:
             await game.iterate()
@@ -43,6 +69,8 @@ async def main():
             print(error_stack_trace, file=stderr)
 
     game.cleanup()
+    game.network.stop_capture()
+    game.network.stop_metrics_export()
 
 
 if __name__ == "__main__":
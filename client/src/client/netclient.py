@@ -1,30 +1,87 @@
+import time
+import traceback
 from sys import stderr
 from typing import Collection
 
 import enet
 
-from common.binary import ByteReader
-from common.network import DeliveryMode, NetPeer, Network, Packet
+from common.net_io import NetIOThread, wait_for_host
+from common.network import (
+    DeliveryMode,
+    NetPeer,
+    Network,
+    Packet,
+    decode_packet,
+    get_protocol_checksum,
+)
 
 
 class NetClient(Network):
-    def __init__(self, address: str, port: int):
+    def __init__(self, address: str, port: int, threaded_io: bool = False):
+        """
+        With threaded_io, the ENet host is serviced from a background thread once
+        connected, and poll only hands the received packets over to listeners.
+        """
         super().__init__()
-        self._host = enet.Host(None, 1, 2, 0, 0)
+        # A second peer lets a redirect connect while the previous server is still
+        # being disconnected from.
+        self._host = enet.Host(None, 2, 2, 0, 0)
         self._peer: NetPeer | None = None
+        self._io: NetIOThread | None = None
+        self._threaded_io = threaded_io
+        self._server_address = address
         self.connect(address, port)
+        self._start_io()
 
-    def connect(self, address: str, port: int):
+    def _start_io(self):
+        if not self._threaded_io:
+            return
+        self._io = NetIOThread(self._host, metrics=self.metrics)
+        self._io.start()
+        assert self._peer is not None
+        self._peer._io = self._io
+
+    def connect(self, address: str, port: int, timeout: float = 5.0):
         addr = enet.Address(address.encode("utf-8"), port)
-        peer = self._host.connect(addr, 2, 0)
-        event = self._host.service(5000)
+        # The server checks our protocol checksum before accepting us.
+        peer = self._host.connect(addr, 2, get_protocol_checksum())
 
-        if event.type != enet.EVENT_TYPE_CONNECT:
-            raise ConnectionError(f"Failed to connect to {address}:{port}")
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise ConnectionError(f"Failed to connect to {address}:{port}")
+            event = self._host.service(int(remaining * 1000))
+            # Events of a server we just left may still come through.
+            if event.type == enet.EVENT_TYPE_NONE or event.peer.address.port != port:
+                continue
+            if event.type == enet.EVENT_TYPE_CONNECT:
+                break
+            if event.type == enet.EVENT_TYPE_DISCONNECT:
+                self._handle_disconnect(event.data)
+                raise ConnectionError(f"Failed to connect to {address}:{port}")
 
         self._peer = NetPeer(peer)
+        self.add_peer(self._peer)
         print(f"Connected to {address}:{port}")
 
+    def redirect(self, port: int):
+        """
+        Leaves the server for another port of the same address, when the front door
+        of a sharded server hands us over to one of its workers.
+        """
+        if self._peer is not None:
+            self._peer.disconnect()
+            self._peer = None
+        if self._io is not None:
+            # Stopping the thread sends the disconnection, and connecting services
+            # the host from here.
+            self._io.stop()
+            self._io = None
+
+        self.connect(self._server_address, port)
+        self._start_io()
+
     def publish(
         self,
         packet: Packet,
@@ -37,31 +94,86 @@ class NetClient(Network):
         self._peer.send(packet, override_delivery_mode)
 
     def poll(self):
+        if self._io is not None:
+            for event_type, address, _, packet, data, event_data in self._io.drain():
+                if self._peer is None or address != self._peer.address:
+                    continue
+                if event_type == enet.EVENT_TYPE_RECEIVE:
+                    assert packet is not None
+                    self._receive(packet, data)
+                elif event_type == enet.EVENT_TYPE_DISCONNECT:
+                    self._handle_disconnect(event_data)
+                    break
+            return
+
         while True:
             event = self._host.service(0)
             if event.type == enet.EVENT_TYPE_NONE:
                 break
-            elif event.type == enet.EVENT_TYPE_RECEIVE:
-                raw_data, raw_peer = event.packet.data, event.peer
 
-                if self._peer is None or raw_peer.address.host != self._peer.address[0]:
+            address = (event.peer.address.host, event.peer.address.port)
+            if self._peer is None or address != self._peer.address:
+                # A server we were redirected away from.
+                continue
+
+            if event.type == enet.EVENT_TYPE_RECEIVE:
+                raw_data = event.packet.data
+                try:
+                    decoded = decode_packet(raw_data, self.metrics)
+                except Exception:
+                    print(
+                        f"Dropped undecodable packet from {address}: {traceback.format_exc()}",
+                        file=stderr,
+                    )
                     continue
 
-                reader = ByteReader(raw_data)
-                decoded = Packet.decode(reader)
-
-                self.notify(decoded, self._peer)
+                self._receive(decoded, raw_data)
 
             elif event.type == enet.EVENT_TYPE_DISCONNECT:
-                print("Disconnected from server.")
-                self._peer = None
+                self._handle_disconnect(event.data)
                 break
 
+    def _receive(self, packet: Packet, data: bytes):
+        assert self._peer is not None
+        if self._capture is not None:
+            self._capture.record_inbound(self._peer.address, packet.delivery_mode, data)
+        self.notify(packet, self._peer)
+
+    def _handle_disconnect(self, data: int):
+        if data != 0:
+            # The server turned us away and sent its own protocol checksum.
+            print(
+                f"Disconnected from server: its protocol checksum {hex(data)} does not "
+                f"match {hex(get_protocol_checksum())}",
+                file=stderr,
+            )
+        else:
+            print("Disconnected from server.")
+        if self._capture is not None and self._peer is not None:
+            self._capture.record_disconnect(self._peer.address)
+        self._peer = None
+
+    def flush(self):
+        if self._peer is None:
+            return
+
+        self._peer.flush(self.outbound_stats)
+        if self._io is not None:
+            self._io.flush()
+        else:
+            self._host.flush()
+        self._export_metrics()
+
     def disconnect(self):
         if self._peer is None:
             return
 
         self._peer.disconnect()
+        if self._io is not None:
+            self._io.stop()
+
+    async def wait(self, timeout: float):
+        await wait_for_host(self._host, self._io, timeout)
 
     def is_server(self) -> bool:
         return False
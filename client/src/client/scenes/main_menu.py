@@ -1,6 +1,7 @@
 from sys import stderr
 from typing import cast
 
+from client.netclient import NetClient
 from common.assets import load_node_asset
 from common.behaviour import Behaviour
 from common.behaviours.network_entity_manager import NetworkEntityManager
@@ -32,6 +33,17 @@ class MainMenu(Behaviour):
         self.game.network.publish(JoinGameRequest())
         response = await self.game.network.expect(JoinGameResponse)
 
+        if response is not None and response.redirect_port is not None:
+            # The front door of a sharded server picked a worker for us.
+            network = cast(NetClient, self.game.network)
+            try:
+                network.redirect(response.redirect_port)
+            except ConnectionError as e:
+                print(f"Failed to join game: {e}", file=stderr)
+                return
+            network.publish(JoinGameRequest())
+            response = await network.expect(JoinGameResponse)
+
         if response is None:
             print(
                 "Failed to get response from server when trying to join game.",
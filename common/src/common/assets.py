@@ -75,9 +75,12 @@ def load_image_asset(path: str) -> ImageAsset:
         if cached:
             return cached
 
-        surface = pg.image.load(full_path).convert_alpha()
+        surface = pg.image.load(full_path)
         if surface is None:
             raise Exception("Image not found.")
+        # Headless games never open a display, and never blit what they load.
+        if pg.display.get_surface() is not None:
+            surface = surface.convert_alpha()
 
         image_asset = ImageAsset(surface, path)
         _image_asset_cache[full_path] = image_asset
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import math
 from dataclasses import dataclass
 from typing import Any
 
@@ -31,12 +32,15 @@ class Collider(Behaviour):
         self._shape: CollisionShape = RectCollisionShape(Vector2(100, 100))
         self._bounding_rect = None
         self._last_world_bounding_rect = None
-        self._last_position = self.transform.position.copy()
-        self._last_scale = self.transform.scale.copy()
-        self._last_rotation = self.transform.local_rotation
+        # Version of the transform the bounding rect was last refreshed for.
+        self._synced_version = -1
+        # Shape scaled by the transform, along with the version it was scaled at.
+        self._scaled_shape: tuple[int, CollisionShape] | None = None
         self._world = None
+        self.transform.listen_changed(self._on_transform_changed)
 
     def on_pre_start(self):
+        self._synced_version = self.transform.version
         self._refresh_bounding_rect()
         self._resolve_world()
         assert self.world
@@ -49,17 +53,27 @@ class Collider(Behaviour):
     @base_shape.setter
     def base_shape(self, shape: CollisionShape):
         self._shape = shape
+        self._scaled_shape = None
         self._refresh_bounding_rect()
 
     @property
-    def scaled_shape(self):
-        scale = self.transform.scale
+    def scaled_shape(self) -> CollisionShape:
+        """The shape scaled by the transform, which must not be modified."""
+        transform = self.transform
+        version = transform.version
+        cached = self._scaled_shape
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        scale = transform.scale
         s = self._shape
+        shape: CollisionShape
         if isinstance(s, RectCollisionShape):
-            size = s.size.elementwise() * scale
-            return RectCollisionShape(size)
-        r = max(scale.x, scale.y)
-        return CircleCollisionShape(s.radius * r)
+            shape = RectCollisionShape(s.size.elementwise() * scale)
+        else:
+            shape = CircleCollisionShape(s.radius * max(scale.x, scale.y))
+        self._scaled_shape = (version, shape)
+        return shape
 
     @scaled_shape.setter
     def scaled_shape(self, shape: CollisionShape):
@@ -115,24 +129,24 @@ class Collider(Behaviour):
             self._world = w
 
     def get_bounding_rect(self, offset: Vector2 | None = None) -> Rect:
+        self.sync_transform()
         rect = self._bounding_rect or self._refresh_bounding_rect()
         if offset is not None:
             return Rect(rect.center + offset, rect.size)
         return rect.copy()
 
-    def on_tick(self, tick_id: int):
-        p = self.transform.position
-        r = self.transform.rotation
-        s = self.transform.scale
-        if (
-            p != self._last_position
-            or r != self._last_rotation
-            or s != self._last_scale
-        ):
+    def _on_transform_changed(self):
+        if self._world is not None:
+            self._world.collider_moved(self)
+
+    def sync_transform(self):
+        """
+        Follows the transform right away, rather than once the world is queried.
+        """
+        version = self.transform.version
+        if version != self._synced_version:
+            self._synced_version = version
             self._refresh_bounding_rect()
-            self._last_position = p.copy()
-            self._last_rotation = r
-            self._last_scale = s.copy()
 
     def on_serialize(self, out_dict: dict):
         out_dict["offset"] = self._offset.serialize()
@@ -211,6 +225,7 @@ class Collider(Behaviour):
         )
 
     def on_destroy(self):
+        self.transform.unlisten_changed(self._on_transform_changed)
         if self._world and self._last_world_bounding_rect:
             self._world.unregister_collider(self)
 
@@ -266,3 +281,147 @@ def _circle_rect(cpos: Vector2, r: float, rpos: Vector2, rsize: Vector2):
     dx = cx - nx
     dy = cy - ny
     return dx * dx + dy * dy <= r * r
+
+
+def shape_time_of_impact(
+    a: tuple[Vector2, CollisionShape],
+    motion: Vector2,
+    b: tuple[Vector2, CollisionShape],
+) -> tuple[float, Vector2] | None:
+    """
+    Returns when shape a, moving by motion, first touches the static shape b, as a
+    fraction of motion, along with the normal of b's surface there. Shapes that
+    overlap already touch at 0, unless motion takes them apart.
+    """
+    pos_a, sh_a = a
+    pos_b, sh_b = b
+    ox, oy = pos_a.x - pos_b.x, pos_a.y - pos_b.y
+    dx, dy = motion.x, motion.y
+
+    hit: tuple[float, float, float] | None
+    if isinstance(sh_a, RectCollisionShape) and isinstance(sh_b, RectCollisionShape):
+        hx = (sh_a.size.x + sh_b.size.x) * 0.5
+        hy = (sh_a.size.y + sh_b.size.y) * 0.5
+        if abs(ox) <= hx and abs(oy) <= hy:
+            hit = _box_overlap(ox, oy, dx, dy, hx, hy)
+        else:
+            hit = _ray_box(ox, oy, dx, dy, hx, hy)
+    elif isinstance(sh_a, CircleCollisionShape) and isinstance(
+        sh_b, CircleCollisionShape
+    ):
+        hit = _ray_circle(ox, oy, dx, dy, sh_a.radius + sh_b.radius)
+    elif isinstance(sh_a, CircleCollisionShape) and isinstance(
+        sh_b, RectCollisionShape
+    ):
+        hit = _ray_rounded_box(
+            ox, oy, dx, dy, sh_a.radius, sh_b.size.x * 0.5, sh_b.size.y * 0.5
+        )
+    elif isinstance(sh_a, RectCollisionShape) and isinstance(
+        sh_b, CircleCollisionShape
+    ):
+        # The circle moving the other way against the rect.
+        hit = _ray_rounded_box(
+            -ox, -oy, -dx, -dy, sh_b.radius, sh_a.size.x * 0.5, sh_a.size.y * 0.5
+        )
+        if hit is not None:
+            hit = (hit[0], -hit[1], -hit[2])
+    else:
+        raise TypeError
+
+    if hit is None:
+        return None
+    return hit[0], Vector2(hit[1], hit[2])
+
+
+# Swept tests below work on the motion of a point, starting at (ox, oy) and moving by
+# (dx, dy), against shapes centered on the origin. They return the fraction of the
+# motion at which the point hits, and the normal of the surface it hits there.
+
+
+def _ray_circle(ox: float, oy: float, dx: float, dy: float, r: float):
+    b = ox * dx + oy * dy
+    c = ox * ox + oy * oy - r * r
+    if c <= 0:
+        if b >= 0:
+            return None
+        length = math.sqrt(ox * ox + oy * oy)
+        return 0.0, ox / length, oy / length
+
+    a = dx * dx + dy * dy
+    if b >= 0 or a == 0:
+        return None
+    disc = b * b - a * c
+    if disc < 0:
+        return None
+    t = (-b - math.sqrt(disc)) / a
+    if t > 1:
+        return None
+    return t, (ox + dx * t) / r, (oy + dy * t) / r
+
+
+def _ray_box(ox: float, oy: float, dx: float, dy: float, hx: float, hy: float):
+    """Only for points starting outside of the box."""
+    t_enter = -math.inf
+    t_exit = math.inf
+    nx = ny = 0.0
+    if dx == 0:
+        if abs(ox) > hx:
+            return None
+    else:
+        t1 = (-hx - ox) / dx
+        t2 = (hx - ox) / dx
+        t_enter, t_exit = min(t1, t2), max(t1, t2)
+        nx = -math.copysign(1.0, dx)
+    if dy == 0:
+        if abs(oy) > hy:
+            return None
+    else:
+        t1 = (-hy - oy) / dy
+        t2 = (hy - oy) / dy
+        if min(t1, t2) > t_enter:
+            t_enter = min(t1, t2)
+            nx, ny = 0.0, -math.copysign(1.0, dy)
+        t_exit = min(t_exit, max(t1, t2))
+    if t_enter > t_exit or t_enter > 1 or t_enter < 0:
+        return None
+    return t_enter, nx, ny
+
+
+def _box_overlap(ox: float, oy: float, dx: float, dy: float, hx: float, hy: float):
+    """Points inside of the box hit it right away when going deeper."""
+    if hx - abs(ox) < hy - abs(oy):
+        if ox * dx < 0:
+            return 0.0, math.copysign(1.0, ox), 0.0
+    elif oy * dy < 0:
+        return 0.0, 0.0, math.copysign(1.0, oy)
+    return None
+
+
+def _ray_rounded_box(
+    ox: float, oy: float, dx: float, dy: float, r: float, hw: float, hh: float
+):
+    """Against the box grown by r, with corners rounded with radius r."""
+    ex = ox - clamp(ox, -hw, hw)
+    ey = oy - clamp(oy, -hh, hh)
+    if ex * ex + ey * ey <= r * r:
+        if ex == 0 and ey == 0:
+            return _box_overlap(ox, oy, dx, dy, hw, hh)
+        if ex * dx + ey * dy >= 0:
+            return None
+        length = math.sqrt(ex * ex + ey * ey)
+        return 0.0, ex / length, ey / length
+
+    x, y = ox, oy
+    if abs(ox) > hw + r or abs(oy) > hh + r:
+        hit = _ray_box(ox, oy, dx, dy, hw + r, hh + r)
+        if hit is None:
+            return None
+        t = hit[0]
+        x, y = ox + dx * t, oy + dy * t
+        if abs(x) <= hw or abs(y) <= hh:
+            return hit
+
+    # In a corner of the grown box, where the rounded one only has a quarter of a
+    # circle around the corner of the box.
+    cx, cy = math.copysign(hw, x), math.copysign(hh, y)
+    return _ray_circle(ox - cx, oy - cy, dx, dy, r)
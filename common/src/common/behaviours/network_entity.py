@@ -10,12 +10,24 @@ import pygame as pg
 
 from common.behaviour import Behaviour
 from common.binary import ByteReader, ByteWriter
+from common.interpolation import InterpolationBuffer
 from common.network import DeliveryMode, NetPeer, Packet
+from common.prediction import PredictionHandler
 
 if TYPE_CHECKING:
     from common.behaviours.network_entity_manager import NetworkEntityManager
 
 from common.primitives import Vector2
+from common.schema import VARUINT, angle, optional, quantized
+
+# Precision of replicated transforms on the wire.
+POSITION_PRECISION = 1 / 16
+SCALE_PRECISION = 1 / 256
+ROTATION_STEPS = 256
+
+POSITION_TYPE = quantized(POSITION_PRECISION)
+SCALE_TYPE = quantized(SCALE_PRECISION)
+ROTATION_TYPE = angle(ROTATION_STEPS)
 
 
 class _PacketListenerState:
@@ -52,21 +64,34 @@ class NetworkEntity(Behaviour):
 
     def on_init(self):
         self._id: int = -1
-        self._last_recv_pos = Vector2(0, 0)
         self._prev_sent_pos = Vector2(0, 0)
         self._prev_sent_rot = 0
         self._prev_sent_scale = Vector2(0, 0)
-        self._approx_speed = Vector2(0, 0)
-        self._last_updated_tick = 0
+        # Version of the transform last replicated, and captured in a snapshot along
+        # with its state.
+        self._sent_transform_version = -1
+        self._captured_transform: (
+            tuple[int, tuple[float, float, float, float, float]] | None
+        ) = None
+        # Client-side transforms received from the server, which the entity is
+        # rendered at with a delay. Created along with the first one.
+        self._interpolation: InterpolationBuffer | None = None
+        self._interpolated_sample: tuple | None = None
+        # Behaviours that may predict the entity or one of its parents instead,
+        # along with whether they are on this entity, found with the first transform
+        # received.
+        self._prediction_handlers: list[tuple[PredictionHandler, bool]] | None = None
         self._packet_listeners: dict[type[EntityPacket], list[_PacketListenerState]] = (
             {}
         )
         self._sync_vars: list[SyncVar] = []
-        self._reached = True
         self._next_sync_var_id = 0
         self._require_sync_var_creation_sync = False
         self._started = False
         self._pre_start_packet_queue: list[tuple[EntityPacket, NetPeer]] | None = []
+        self._snapshot_replicated = False
+        # Peers this entity is not replicated to, set by the area of interest.
+        self._uninterested_peers: list[NetPeer] | None = None
 
     @property
     def id(self):
@@ -106,6 +131,9 @@ class NetworkEntity(Behaviour):
             self.listen(
                 ScaleUpdate, lambda msg, peer: self._handle_scale_update(msg, peer)
             )
+            self.listen(
+                TeleportUpdate, lambda msg, peer: self._handle_teleport(msg, peer)
+            )
             self.listen(
                 SyncVarUpdate, lambda msg, peer: self._handle_sync_var_update(msg, peer)
             )
@@ -124,53 +152,118 @@ class NetworkEntity(Behaviour):
         self._pre_start_packet_queue = None
         self._started = True
 
+    def teleport(self, position: Vector2):
+        """
+        Moves the entity on the server, and has clients jump it there instead of
+        moving it there.
+        """
+        assert self.game
+        self.transform.position = position
+        if self.game.network.is_server():
+            self.game.network.publish(
+                TeleportUpdate(
+                    self.game.simulation.tick_id, self.id, position.x, position.y
+                ),
+                exclude_peers=self._uninterested_peers,
+            )
+
     def _handle_rotation_update(self, packet: RotationUpdate, peer: NetPeer):
-        self.transform.local_rotation = packet.rotation
+        self._receive_transform(packet.tick_id, rotation=packet.rotation)
 
     def _handle_scale_update(self, packet: ScaleUpdate, peer: NetPeer):
         self.transform.local_scale = Vector2(packet.x, packet.y)
 
     def _handle_pos_update(self, packet: PositionUpdate, peer: NetPeer):
-        assert self.game
+        self._receive_transform(packet.tick_id, Vector2(packet.x, packet.y))
 
-        if packet.tick_id < self._last_updated_tick:
+    def _handle_teleport(self, packet: TeleportUpdate, peer: NetPeer):
+        if self._forward_to_prediction(
+            packet.tick_id, Vector2(packet.x, packet.y), None
+        ):
             return
 
-        # We want to deal with two different scenarios here, and
-        # the system needs to be a little bit smart to decide which
-        # of the two we're in right now.
-        #
-        # Scenario 1: The entity is moving. Here, we want to estimate
-        # the speed and predict the motion in the client-side.
-        #
-        # Scenario 2: The entity is being teleported. The position update
-        # in this case must be instant.
-        #
-        # When we receive a packet out of the blue, it is impossible to decide
-        # on 1 or 2. However, if we've been receiving continuous packets in recent
-        # ticks, we can assume it's scenario 1. For this reason, we'll
-        # use this rule to decide on one vs the other.
-
-        new_pos = Vector2(packet.x, packet.y)
-        time_diff = (
-            packet.tick_id - self._last_updated_tick
-        ) / self.game.simulation.tick_rate
-        time_diff = max(time_diff, 0.00001)  # Prevent division by zero errors
-
-        self._last_updated_tick = packet.tick_id
-
-        if time_diff < 0.3:
-            # Scenario 1: we're moving.
-            space_diff = new_pos - self._last_recv_pos
-            self._approx_speed = space_diff / time_diff
-            self._reached = False
-        else:
-            # Scenario 2: teleporting
-            self._approx_speed = Vector2(0, 0)
-            self._reached = True
-            self.transform.position = new_pos
+        buffer = self._get_interpolation_buffer()
+        rotation = self.transform.local_rotation
+        newest = buffer.newest
+        if newest is not None:
+            rotation = newest[3]
+        buffer.push_teleport(packet.tick_id, packet.x, packet.y, rotation)
+
+    def _get_interpolation_buffer(self) -> InterpolationBuffer:
+        buffer = self._interpolation
+        if buffer is None:
+            buffer = self._interpolation = InterpolationBuffer()
+        return buffer
+
+    def _forward_to_prediction(
+        self, tick_id: int, position: Vector2 | None, rotation: float | None
+    ) -> bool:
+        """
+        Hands a transform received for a predicted entity to the behaviour that
+        predicts it, and returns whether it did. Entities spawned under a predicted
+        one move along with it instead.
+        """
+        handlers = self._prediction_handlers
+        if handlers is None:
+            handlers = self._prediction_handlers = []
+            node = self.node
+            while node is not None:
+                handlers.extend(
+                    (b, node is self.node)
+                    for b in node.behaviours
+                    if isinstance(b, PredictionHandler)
+                )
+                node = node.parent
+
+        predicted = self._predicted_by()
+        if predicted is None:
+            return False
+        handler, own = predicted
+        if own:
+            handler.on_authoritative_transform(tick_id, position, rotation)
+        return True
+
+    def _predicted_by(self) -> tuple[PredictionHandler, bool] | None:
+        if not self._prediction_handlers:
+            return None
+        for handler, own in self._prediction_handlers:
+            if handler.is_predicted():
+                # The entity no longer follows the states of the server.
+                self._interpolation = None
+                self._interpolated_sample = None
+                return handler, own
+        return None
+
+    def _receive_transform(
+        self,
+        tick_id: int,
+        position: Vector2 | None = None,
+        rotation: float | None = None,
+        still_at: int | None = None,
+    ):
+        """
+        Adds the transform the server sent for tick_id to the ones the entity is
+        interpolated between, unless the entity is predicted. Missing fields keep
+        their last received value.
+        """
+        self._entity_manager.interpolation.observe(tick_id)
+
+        if self._forward_to_prediction(tick_id, position, rotation):
+            return
 
-        self._last_recv_pos = new_pos
+        buffer = self._get_interpolation_buffer()
+        newest = buffer.newest
+        if newest is not None:
+            x, y, last_rotation = newest[1], newest[2], newest[3]
+        else:
+            transform = self.transform
+            pos = transform.position
+            x, y, last_rotation = pos.x, pos.y, transform.local_rotation
+        if position is not None:
+            x, y = position.x, position.y
+        buffer.push(
+            tick_id, x, y, last_rotation if rotation is None else rotation, still_at
+        )
 
     def _handle_sync_var_update(self, update: SyncVarUpdate, peer: NetPeer):
         for p in self._sync_vars:
@@ -182,72 +275,103 @@ class NetworkEntity(Behaviour):
                 continue
 
             p._current_value = update.value
-
-            if self.game:
-                p._last_recv_tick = self.game.simulation.tick_id
-            else:
-                p._last_recv_tick = 0
+            # Compared with the server ticks of later updates. The tick of the
+            # client is ahead of them, and would make the next ones look stale.
+            p._last_recv_tick = update.tick_id
             break
 
+    def _capture_snapshot_state(self):
+        transform = self.transform
+        version = transform.version
+        captured = self._captured_transform
+        if captured is None or captured[0] != version:
+            pos = transform.position
+            scale = transform.scale
+            captured = self._captured_transform = (
+                version,
+                (pos.x, pos.y, transform.rotation, scale.x, scale.y),
+            )
+        return (*captured[1], self._capture_sync_values())
+
+    def _capture_sync_values(self):
+        return tuple(
+            v.copy() if isinstance(v, Vector2) else v
+            for v in (sv._current_value for sv in self._sync_vars)
+        )
+
     def on_tick(self, tick_id: int) -> Any:
         assert self.game
-        if self.game.network.is_server():
+        if self._snapshot_replicated:
+            # State is replicated by the entity manager instead.
+            return
+
+        if not self.game.network.is_server():
+            return
+
+        version = self.transform.version
+        if version != self._sent_transform_version:
+            self._sent_transform_version = version
             pos = self.transform.position
             if pos != self._prev_sent_pos:
                 self._prev_sent_pos = pos
                 self.game.network.publish(
-                    PositionUpdate(tick_id, self.id, pos.x, pos.y)
+                    PositionUpdate(tick_id, self.id, pos.x, pos.y),
+                    exclude_peers=self._uninterested_peers,
                 )
 
             scale = self.transform.scale
             if scale != self._prev_sent_scale:
                 self._prev_sent_scale = scale
                 self.game.network.publish(
-                    ScaleUpdate(tick_id, self.id, scale.x, scale.y)
+                    ScaleUpdate(tick_id, self.id, scale.x, scale.y),
+                    exclude_peers=self._uninterested_peers,
                 )
 
             rotation = self.transform.rotation
             if rotation != self._prev_sent_rot:
                 self._prev_sent_rot = rotation
-                self.game.network.publish(RotationUpdate(tick_id, self.id, rotation))
+                self.game.network.publish(
+                    RotationUpdate(tick_id, self.id, rotation),
+                    exclude_peers=self._uninterested_peers,
+                )
 
-            for sv in self._sync_vars:
-                current_tick = self.game.simulation.tick_id
-                delivery_mode = sv._delivery_mode
-                if sv._current_value == sv._last_sent_value:
-                    # If the value is the same, we might still want to send periodic updates.
-                    if sv._next_auto_tick > current_tick:
-                        continue
+        for sv in self._sync_vars:
+            current_tick = self.game.simulation.tick_id
+            delivery_mode = sv._delivery_mode
+            if sv._current_value == sv._last_sent_value:
+                # If the value is the same, we might still want to send periodic updates.
+                if sv._next_auto_tick > current_tick:
+                    continue
 
-                    delivery_mode = DeliveryMode.UNRELIABLE
+                delivery_mode = DeliveryMode.UNRELIABLE
 
-                sv._last_sent_value = sv._current_value
-                self.game.network.publish(
-                    SyncVarUpdate(
-                        self.id, tick_id, sv._id, sv._current_value, delivery_mode
-                    )
-                )
+            sv._last_sent_value = sv._current_value
+            self.game.network.publish(
+                SyncVarUpdate(
+                    self.id, tick_id, sv._id, sv._current_value, delivery_mode
+                ),
+                exclude_peers=self._uninterested_peers,
+            )
 
-                # We add a random value so that we don't get a single tick with a huge batch
-                # of auto sync var updates.
-                sv._next_auto_tick = current_tick + random.randint(256, 512)
+            # We add a random value so that we don't get a single tick with a huge batch
+            # of auto sync var updates.
+            sv._next_auto_tick = current_tick + random.randint(256, 512)
 
     def on_update(self, dt: float):
-        assert self.game
+        buffer = self._interpolation
+        if buffer is None or self._predicted_by() is not None:
+            return
 
-        if self.game.network.is_client():
-            if self._reached:
-                return
+        sample = buffer.sample(self._entity_manager.interpolation.render_tick)
+        # Entities at rest keep getting the same sample, which is already applied.
+        if sample is self._interpolated_sample or sample is None:
+            return
+        self._interpolated_sample = sample
 
-            pos = self.transform.position
-            new_pos = pos + self._approx_speed * dt
-            if (self._last_recv_pos - pos).length_squared() > (
-                self._last_recv_pos - new_pos
-            ).length_squared():
-                self.transform.position = new_pos
-            else:
-                self.transform.position = self._last_recv_pos
-                self._reached = True
+        transform = self.transform
+        transform.position = Vector2(sample[1], sample[2])
+        if transform.local_rotation != sample[3]:
+            transform.local_rotation = sample[3]
 
     def _handle_entity_packet(self, packet: EntityPacket, peer: NetPeer):
         if not self._started:
@@ -290,31 +414,18 @@ class NetworkEntity(Behaviour):
 
 
 class EntityPacket(Packet, ABC):
+    fields = {"entity_id": VARUINT, "tick_id": optional(VARUINT)}
+
     def __init__(self, entity_id: int, tick_id: int | None = None):
         self.entity_id = entity_id
         self.tick_id = tick_id
 
-    def on_write(self, writer: ByteWriter):
-        if self.tick_id is not None:
-            writer.write_int32(-self.entity_id)
-            writer.write_uint32(self.tick_id)
-        else:
-            writer.write_int32(self.entity_id)
-
-    def on_read(self, reader: ByteReader):
-        self.entity_id = reader.read_int32()
-        if self.entity_id < 0:
-            self.entity_id = -self.entity_id
-            self.tick_id = reader.read_uint32()
-        else:
-            self.tick_id = None
-
 
 _sync_var_writers: dict[
     type[PlausibleSyncVarType], Callable[[Any, ByteWriter], Any]
 ] = {
     bool: lambda x, writer: writer.write_bool(x),
-    int: lambda x, writer: writer.write_int32(x),
+    int: lambda x, writer: writer.write_varint(x),
     float: lambda x, writer: writer.write_float32(x),
     str: lambda x, writer: writer.write_str(x),
     Vector2: lambda x, writer: (
@@ -326,7 +437,7 @@ _sync_var_writers: dict[
 
 _sync_var_readers: dict[type[PlausibleSyncVarType], Callable[[ByteReader], Any]] = {
     bool: lambda reader: reader.read_bool(),
-    int: lambda reader: reader.read_int32(),
+    int: lambda reader: reader.read_varint(),
     float: lambda reader: reader.read_float32(),
     str: lambda reader: reader.read_str(),
     Vector2: lambda reader: Vector2(reader.read_float32(), reader.read_float32()),
@@ -338,6 +449,9 @@ _sync_var_type_ids = {bool: 0, int: 1, float: 2, str: 3, Vector2: 4}
 
 _sync_var_id_types = [bool, int, float, str, Vector2]
 
+# Sync var type ids fit in the low bits of the sync var header.
+_SYNC_VAR_TYPE_BITS = 3
+
 
 class SyncVarUpdate(EntityPacket):
 
@@ -356,18 +470,20 @@ class SyncVarUpdate(EntityPacket):
 
     def on_write(self, writer: ByteWriter):
         super().on_write(writer)
-        writer.write_uint8(self.sync_var_id)
 
         t = type(self.value)
-        writer.write_uint8(_sync_var_type_ids[t])
+        writer.write_varuint(
+            (self.sync_var_id << _SYNC_VAR_TYPE_BITS) | _sync_var_type_ids[t]
+        )
 
         _sync_var_writers[t](self.value, writer)
 
     def on_read(self, reader: ByteReader):
         super().on_read(reader)
-        self.sync_var_id = reader.read_uint8()
+        header = reader.read_varuint()
+        self.sync_var_id = header >> _SYNC_VAR_TYPE_BITS
 
-        t = _sync_var_id_types[reader.read_uint8()]
+        t = _sync_var_id_types[header & ((1 << _SYNC_VAR_TYPE_BITS) - 1)]
 
         self.value = _sync_var_readers[t](reader)
         self._delivery_mode = DeliveryMode.UNRELIABLE
@@ -379,25 +495,13 @@ class SyncVarUpdate(EntityPacket):
 
 class PositionUpdate(EntityPacket):
     tick_id: int
+    fields = {"x": POSITION_TYPE, "y": POSITION_TYPE}
 
     def __init__(self, tick_id: int, id: int, x: float, y: float):
         super().__init__(id, tick_id)
-        self.tick_id = tick_id
         self.x = x
         self.y = y
 
-    def on_write(self, writer: ByteWriter):
-        super().on_write(writer)
-        writer.write_uint32(self.tick_id)
-        writer.write_float32(self.x)
-        writer.write_float32(self.y)
-
-    def on_read(self, reader: ByteReader):
-        super().on_read(reader)
-        self.tick_id = reader.read_uint32()
-        self.x = reader.read_float32()
-        self.y = reader.read_float32()
-
     @property
     def delivery_mode(self) -> DeliveryMode:
         return DeliveryMode.UNRELIABLE
@@ -405,25 +509,13 @@ class PositionUpdate(EntityPacket):
 
 class ScaleUpdate(EntityPacket):
     tick_id: int
+    fields = {"x": SCALE_TYPE, "y": SCALE_TYPE}
 
     def __init__(self, tick_id: int, id: int, x: float, y: float):
         super().__init__(id, tick_id)
-        self.tick_id = tick_id
         self.x = x
         self.y = y
 
-    def on_write(self, writer: ByteWriter):
-        super().on_write(writer)
-        writer.write_uint32(self.tick_id)
-        writer.write_float32(self.x)
-        writer.write_float32(self.y)
-
-    def on_read(self, reader: ByteReader):
-        super().on_read(reader)
-        self.tick_id = reader.read_uint32()
-        self.x = reader.read_float32()
-        self.y = reader.read_float32()
-
     @property
     def delivery_mode(self) -> DeliveryMode:
         return DeliveryMode.RELIABLE
@@ -431,21 +523,25 @@ class ScaleUpdate(EntityPacket):
 
 class RotationUpdate(EntityPacket):
     tick_id: int
+    fields = {"rotation": ROTATION_TYPE}
 
     def __init__(self, tick_id: int, id: int, rot: float):
         super().__init__(id, tick_id)
-        self.tick_id = tick_id
         self.rotation = rot
 
-    def on_write(self, writer: ByteWriter):
-        super().on_write(writer)
-        writer.write_uint32(self.tick_id)
-        writer.write_float32(self.rotation)
+    @property
+    def delivery_mode(self) -> DeliveryMode:
+        return DeliveryMode.RELIABLE
 
-    def on_read(self, reader: ByteReader):
-        super().on_read(reader)
-        self.tick_id = reader.read_uint32()
-        self.rotation = reader.read_float32()
+
+class TeleportUpdate(EntityPacket):
+    tick_id: int
+    fields = {"x": POSITION_TYPE, "y": POSITION_TYPE}
+
+    def __init__(self, tick_id: int, id: int, x: float, y: float):
+        super().__init__(id, tick_id)
+        self.x = x
+        self.y = y
 
     @property
     def delivery_mode(self) -> DeliveryMode:
@@ -3,14 +3,63 @@ from __future__ import annotations
 from abc import ABC
 from dataclasses import dataclass
 from sys import stderr
-from typing import Callable, cast
+from typing import Any, Callable, cast
+
+import numpy as np
 
 from common.assets import load_node_asset
 from common.behaviour import Behaviour
-from common.behaviours.network_entity import EntityPacket, NetworkEntity, PositionUpdate
-from common.binary import ByteReader, ByteWriter
+from common.behaviours.network_entity import (
+    EntityPacket,
+    NetworkEntity,
+    PositionUpdate,
+    SyncVarUpdate,
+)
+from common.binary import ByteWriter
+from common.interest import AreaOfInterest
+from common.interpolation import DEFAULT_INTERPOLATION_DELAY, InterpolationTimeline
 from common.network import DeliveryMode, MultiPacket, NetPeer, Packet
 from common.node import Node
+from common.primitives import Vector2
+from common.schema import STR, VARUINT, optional
+from common.snapshot import (
+    POSITION,
+    ROTATION,
+    SCALE,
+    SYNC_VARS,
+    EntitySnapshot,
+    EntityState,
+    SnapshotAck,
+    diff_snapshots,
+    diff_state,
+    merge_snapshot,
+)
+from common.transform_store import TransformStore
+
+# Number of past snapshots kept on each side. A peer that has not acknowledged any
+# of the last SNAPSHOT_HISTORY snapshots sent to it gets a complete snapshot.
+SNAPSHOT_HISTORY = 32
+
+# Ticks between two area of interest updates.
+INTEREST_UPDATE_INTERVAL = 4
+
+# How much of the difference to each new measure the view lag of a peer covers,
+# which averages out jitter, unless the difference is larger than VIEW_LAG_SNAP_TICKS.
+VIEW_LAG_SMOOTHING = 0.1
+VIEW_LAG_SNAP_TICKS = 8.0
+
+
+def _forget_ticks(history: dict[int, Any], oldest: int):
+    """
+    Removes the entries of ticks up to oldest from history, whose ticks were
+    inserted in increasing order. Ticks are not consecutive when the simulation
+    catches up on several of them in one iteration.
+    """
+    while history:
+        tick_id = next(iter(history))
+        if tick_id > oldest:
+            break
+        del history[tick_id]
 
 
 class NetworkEntityManager(Behaviour):
@@ -22,6 +71,38 @@ class NetworkEntityManager(Behaviour):
         self._entities = getattr(self, "_entities", {})
         self._next_entity_id = 1
 
+        # Maps every entity to the id of the root entity it was spawned under.
+        # Entities are replicated to a peer along with their whole root.
+        self._entity_roots: dict[int, int] = {}
+
+        # When enabled, the server replicates entity transforms and sync vars
+        # through per-tick delta snapshots instead of per-entity update packets.
+        self.snapshot_replication = False
+
+        # Server-side snapshot state.
+        self._snapshot_history: dict[int, dict[int, EntityState]] = {}
+        self._peer_baselines: dict[NetPeer, tuple[int, dict[int, EntityState]]] = {}
+        self._peer_last_sent_tick: dict[NetPeer, int] = {}
+        self._last_snapshot_tick = -1
+        # Ticks between the present and what each peer sees, as of its inputs.
+        self._peer_view_lag: dict[NetPeer, float] = {}
+
+        # Client-side snapshot state.
+        self._received_snapshots: dict[int, dict[int, EntityState]] = {}
+        self._applied_snapshot: dict[int, EntityState] = {}
+        self._last_applied_snapshot_tick = -1
+        # Tick that client entities are rendered at, behind the server.
+        self.interpolation = InterpolationTimeline()
+
+        # Server-side area of interest. When enabled, each peer is only sent the
+        # root entities relevant to it, and the entities spawned under them.
+        self.area_of_interest: AreaOfInterest | None = None
+        self._spawn_records: dict[int, tuple[SpawnEntity, list[Packet]]] = {}
+        # Root entities known by each peer, or None if the peer knows them all.
+        # These sets are never mutated, so snapshots can refer to them later on.
+        self._peer_interest: dict[NetPeer, frozenset[int] | None] = {}
+        self._peer_sent_interest: dict[NetPeer, dict[int, frozenset[int] | None]] = {}
+
     def on_pre_start(self):
         assert self.game
 
@@ -32,7 +113,30 @@ class NetworkEntityManager(Behaviour):
                 EntityPacket, lambda msg, peer: self._handle_entity_packet(msg, peer)
             ),
         )
+        if self.game.network.is_server():
+            self._snapshot_ack_listener = getattr(
+                self,
+                "_snapshot_ack_listener",
+                self.game.network.listen(
+                    SnapshotAck, lambda msg, peer: self._handle_snapshot_ack(msg, peer)
+                ),
+            )
+            self._snapshot_disconnect_listener = getattr(
+                self,
+                "_snapshot_disconnect_listener",
+                self.game.network.listen_disconnected(
+                    lambda peer: self._forget_snapshot_peer(peer)
+                ),
+            )
         if self.game.network.is_client():
+            self._snapshot_listener = getattr(
+                self,
+                "_snapshot_listener",
+                self.game.network.listen(
+                    EntitySnapshot,
+                    lambda msg, peer: self._handle_entity_snapshot(msg, peer),
+                ),
+            )
             self._spawn_entity_listener = getattr(
                 self,
                 "_spawn_entity_listener",
@@ -65,6 +169,7 @@ class NetworkEntityManager(Behaviour):
         )
         entity = self._do_spawn_entity(spawn_entity_packet)
 
+        extra_packets = include_packets(entity.id) if include_packets else []
         full_packet = MultiPacket(
             [
                 spawn_entity_packet,
@@ -74,14 +179,28 @@ class NetworkEntityManager(Behaviour):
                     entity.transform.position.x,
                     entity.transform.position.y,
                 ),
+                *extra_packets,
             ],
             DeliveryMode.RELIABLE_ORDERED,
         )
 
-        if include_packets is not None:
-            full_packet.packets += include_packets(entity.id)
+        excluded_peers = None
+        if self.area_of_interest is not None:
+            self._spawn_records[entity.id] = (spawn_entity_packet, extra_packets)
 
-        self.game.network.publish(full_packet)
+            # Positions are usually set after spawning, so new root entities are
+            # sent to everyone and left to the next interest update.
+            root_id = self._entity_roots[entity.id]
+            excluded_peers = []
+            for peer, interest in self._peer_interest.items():
+                if interest is None:
+                    continue
+                if root_id == entity.id:
+                    self._peer_interest[peer] = interest | {root_id}
+                elif root_id not in interest:
+                    excluded_peers.append(peer)
+
+        self.game.network.publish(full_packet, exclude_peers=excluded_peers)
 
         return entity
 
@@ -111,27 +230,41 @@ class NetworkEntityManager(Behaviour):
             node = Node()
         node.parent = parent
         entity = node.get_or_add_behaviour(NetworkEntity)
-        entity._entity_manager = self
 
-        self._next_entity_id = self._fill_node_ids(p.id, entity.node)
+        root_id = p.id
+        if p.parent_id is not None:
+            root_id = self._entity_roots.get(p.parent_id, p.id)
+
+        self._next_entity_id = self._fill_node_ids(p.id, entity.node, root_id)
 
         return entity
 
-    def _fill_node_ids(self, entity_id: int, node: Node) -> int:
+    def _fill_node_ids(self, entity_id: int, node: Node, root_id: int) -> int:
         entity = node.get_behaviour(NetworkEntity)
         if entity is not None:
             entity._id = entity_id
+            entity._entity_manager = self
+            entity._snapshot_replicated = self.snapshot_replication
             self._entities[entity_id] = entity
+            self._entity_roots[entity_id] = root_id
 
         for c in node.children:
             entity_id += 1
-            entity_id = self._fill_node_ids(entity_id, c)
+            entity_id = self._fill_node_ids(entity_id, c, root_id)
         return entity_id
 
     def _do_destroy_entity(self, entity: NetworkEntity):
+        # Entities in children are destroyed along with the node.
+        destroyed = entity.node.get_behaviours_in_children(
+            NetworkEntity, recursive=True
+        )
         entity.node.destroy()
-        if entity.id in self._entities:
-            del self._entities[entity.id]
+        for e in destroyed:
+            entity_id = e.id
+            if self._entities.get(entity_id) is e:
+                del self._entities[entity_id]
+                self._entity_roots.pop(entity_id, None)
+                self._spawn_records.pop(entity_id, None)
 
     def _handle_entity_packet(self, p: EntityPacket, peer: NetPeer):
         entity = self._entities.get(p.entity_id)
@@ -144,7 +277,16 @@ class NetworkEntityManager(Behaviour):
         entity._handle_entity_packet(p, peer)
 
     def _handle_spawn_entity(self, p: SpawnEntity):
-        self._do_spawn_entity(p)
+        entity = self._do_spawn_entity(p)
+
+        # Snapshots may have described these entities before they were spawned here.
+        for e in entity.node.get_behaviours_in_children(NetworkEntity, recursive=True):
+            state = self._applied_snapshot.get(e.id)
+            if state is not None:
+                mask, sync_mask = diff_state(None, state)
+                self._apply_snapshot_state(
+                    e, self._last_applied_snapshot_tick, state, mask, sync_mask
+                )
 
     def _handle_destroy_entity(self, p: DestroyEntity):
         entity = self.get_entity_by_id(p.id)
@@ -152,11 +294,327 @@ class NetworkEntityManager(Behaviour):
             return
         self._do_destroy_entity(entity)
 
+    def on_update(self, dt: float):
+        assert self.game
+        simulation = self.game.simulation
+        if self.game.network.is_client():
+            self.interpolation.advance(dt, simulation.tick_rate, simulation.server_tick)
+
+        # Snapshots are taken once every behaviour ran its tick, so that they hold
+        # the state at the end of it, which clients predict their entities up to.
+        tick_id = simulation.tick_id - 1
+        if (
+            self.snapshot_replication
+            and tick_id > self._last_snapshot_tick
+            and self.game.network.is_server()
+        ):
+            self._last_snapshot_tick = tick_id
+            self._publish_snapshot(tick_id)
+
+    def on_tick(self, tick_id: int):
+        assert self.game
+        if not self.game.network.is_server():
+            return
+
+        if (
+            self.area_of_interest is not None
+            and tick_id % INTEREST_UPDATE_INTERVAL == 0
+        ):
+            self._update_interest(tick_id)
+
+    def _update_interest(self, tick_id: int):
+        assert self.game
+        assert self.area_of_interest is not None
+
+        roots = [
+            e
+            for entity_id, e in self._entities.items()
+            if self._entity_roots.get(entity_id) == entity_id
+        ]
+        peers = self.game.network.connected_peers
+        relevant = self.area_of_interest.compute(roots, peers, self._peer_interest)
+
+        all_roots = frozenset(e.id for e in roots)
+        for peer in peers:
+            known = self._peer_interest.get(peer)
+            known_roots = known if known is not None else all_roots
+            new_interest = relevant[peer]
+            new_roots = (
+                frozenset(new_interest) if new_interest is not None else all_roots
+            )
+
+            for root_id in known_roots - new_roots:
+                peer.send(DestroyEntity(root_id))
+            for root_id in sorted(new_roots - known_roots):
+                peer.send(self._build_respawn_packet(root_id, tick_id))
+
+            self._peer_interest[peer] = new_roots if new_interest is not None else None
+
+        if not self.snapshot_replication:
+            for entity_id, entity in self._entities.items():
+                root_id = self._entity_roots[entity_id]
+                entity._uninterested_peers = [
+                    peer
+                    for peer, interest in self._peer_interest.items()
+                    if interest is not None and root_id not in interest
+                ] or None
+
+    def _build_respawn_packet(self, root_id: int, tick_id: int) -> MultiPacket:
+        """
+        Rebuilds the packets spawning a root entity, and every entity spawned under
+        it since, for a peer it just became relevant to.
+        """
+        packets: list[Packet] = []
+        spawned = sorted(
+            entity_id
+            for entity_id in self._spawn_records
+            if self._entity_roots.get(entity_id) == root_id
+        )
+        for entity_id in spawned:
+            spawn_packet, extra_packets = self._spawn_records[entity_id]
+            entity = self._entities[entity_id]
+            pos = entity.transform.position
+            packets.append(spawn_packet)
+            packets.append(PositionUpdate(tick_id, entity_id, pos.x, pos.y))
+            packets += extra_packets
+
+            if not self.snapshot_replication:
+                for e in entity.node.get_behaviours_in_children(
+                    NetworkEntity, recursive=True
+                ):
+                    for sv in e._sync_vars:
+                        packets.append(
+                            SyncVarUpdate(
+                                e.id,
+                                tick_id,
+                                sv._id,
+                                sv._current_value,
+                                sv._delivery_mode,
+                            )
+                        )
+
+        return MultiPacket(packets, DeliveryMode.RELIABLE_ORDERED)
+
+    def _publish_snapshot(self, tick_id: int):
+        assert self.game
+
+        store = self.game.transform_store
+        if store is not None:
+            current = self._capture_stored_snapshot(store)
+        else:
+            current = {
+                entity_id: entity._capture_snapshot_state()
+                for entity_id, entity in self._entities.items()
+            }
+        self._snapshot_history[tick_id] = current
+        _forget_ticks(self._snapshot_history, tick_id - SNAPSHOT_HISTORY)
+
+        # Peers that acknowledged the same snapshot, and know the same entities,
+        # share the same encoded delta.
+        encoded: dict[tuple[int | None, int], bytes | None] = {}
+        for peer in self.game.network.connected_peers:
+            interest = self._peer_interest.get(peer)
+            sent_interest = self._peer_sent_interest.setdefault(peer, {})
+            sent_interest[tick_id] = interest
+            _forget_ticks(sent_interest, tick_id - SNAPSHOT_HISTORY)
+
+            baseline_tick: int | None = None
+            baseline: dict[int, EntityState] | None = None
+
+            peer_baseline = self._peer_baselines.get(peer)
+            last_sent = self._peer_last_sent_tick.get(peer, tick_id)
+            if (
+                peer_baseline is not None
+                and last_sent - peer_baseline[0] < SNAPSHOT_HISTORY
+            ):
+                baseline_tick, baseline = peer_baseline
+
+            key = (baseline_tick, id(interest))
+            if key not in encoded:
+                changes, removed = diff_snapshots(
+                    baseline, self._filter_snapshot(current, interest)
+                )
+                if not changes and not removed:
+                    encoded[key] = None
+                else:
+                    writer = ByteWriter()
+                    EntitySnapshot(tick_id, baseline_tick, changes, removed).encode(
+                        writer
+                    )
+                    encoded[key] = writer.data
+
+            data = encoded[key]
+            if data is None:
+                continue
+
+            peer.queue_raw(data, DeliveryMode.UNRELIABLE)
+            self._peer_last_sent_tick[peer] = tick_id
+
+    def _capture_stored_snapshot(self, store: TransformStore):
+        """Captures the transforms of entities from the columns of their store."""
+        entities = self._entities
+        slots = np.fromiter(
+            (e.transform._slot for e in entities.values()), np.intp, len(entities)
+        )
+        if len(slots) and slots.min() < 0:
+            # Some entity is outside of the scene, and so of the store.
+            return {
+                entity_id: entity._capture_snapshot_state()
+                for entity_id, entity in entities.items()
+            }
+
+        store.refresh()
+        transforms = zip(
+            store.x[slots].tolist(),
+            store.y[slots].tolist(),
+            store.rotation[slots].tolist(),
+            store.scale_x[slots].tolist(),
+            store.scale_y[slots].tolist(),
+        )
+        return {
+            entity_id: (*transform, entity._capture_sync_values())
+            for (entity_id, entity), transform in zip(entities.items(), transforms)
+        }
+
+    def _filter_snapshot(
+        self, snapshot: dict[int, EntityState], interest: frozenset[int] | None
+    ) -> dict[int, EntityState]:
+        if interest is None:
+            return snapshot
+        roots = self._entity_roots
+        return {
+            entity_id: state
+            for entity_id, state in snapshot.items()
+            if roots.get(entity_id) in interest
+        }
+
+    def view_tick(self, peer: NetPeer) -> float | None:
+        """
+        Server-side. Tick the peer saw its entities at, when it sent what is being
+        received from it now. None until the peer acknowledged a snapshot.
+        """
+        assert self.game
+        lag = self._peer_view_lag.get(peer)
+        if lag is None:
+            return None
+        return self.game.simulation.tick_time - lag
+
+    def _handle_snapshot_ack(self, ack: SnapshotAck, peer: NetPeer):
+        assert self.game
+        # Acks leave along with the inputs of the peer, so whatever arrives with
+        # them was given while looking at that tick.
+        lag = self.game.simulation.tick_time - (ack.tick_id - ack.view_delay)
+        previous = self._peer_view_lag.get(peer)
+        if previous is not None and abs(lag - previous) < VIEW_LAG_SNAP_TICKS:
+            lag = previous + (lag - previous) * VIEW_LAG_SMOOTHING
+        self._peer_view_lag[peer] = lag
+
+        snapshot = self._snapshot_history.get(ack.tick_id)
+        sent_interest = self._peer_sent_interest.get(peer, {})
+        if snapshot is None or ack.tick_id not in sent_interest:
+            return
+
+        peer_baseline = self._peer_baselines.get(peer)
+        if peer_baseline is None or peer_baseline[0] < ack.tick_id:
+            self._peer_baselines[peer] = (
+                ack.tick_id,
+                self._filter_snapshot(snapshot, sent_interest[ack.tick_id]),
+            )
+
+    def _forget_snapshot_peer(self, peer: NetPeer):
+        self._peer_baselines.pop(peer, None)
+        self._peer_last_sent_tick.pop(peer, None)
+        self._peer_interest.pop(peer, None)
+        self._peer_sent_interest.pop(peer, None)
+        self._peer_view_lag.pop(peer, None)
+
+    def _handle_entity_snapshot(self, snapshot: EntitySnapshot, peer: NetPeer):
+        assert self.game
+
+        if snapshot.tick_id <= self._last_applied_snapshot_tick:
+            return
+
+        baseline = None
+        if snapshot.baseline_tick is not None:
+            baseline = self._received_snapshots.get(snapshot.baseline_tick)
+            if baseline is None:
+                # We no longer know the baseline. The server will eventually fall
+                # back to a complete snapshot.
+                return
+
+        current = merge_snapshot(baseline, snapshot.changes, snapshot.removed)
+        self._received_snapshots[snapshot.tick_id] = current
+        while len(self._received_snapshots) > 2 * SNAPSHOT_HISTORY:
+            del self._received_snapshots[min(self._received_snapshots)]
+
+        # Entities that did not change in the previous snapshot were at rest then.
+        still_at = self._last_applied_snapshot_tick
+        for entity_id, state in current.items():
+            previous = self._applied_snapshot.get(entity_id)
+            if previous == state:
+                continue
+
+            entity = self._entities.get(entity_id)
+            if entity is None:
+                continue
+
+            mask, sync_mask = diff_state(previous, state)
+            self._apply_snapshot_state(
+                entity, snapshot.tick_id, state, mask, sync_mask, still_at
+            )
+
+        self._applied_snapshot = current
+        self._last_applied_snapshot_tick = snapshot.tick_id
+        view_delay = max(0.0, snapshot.tick_id - self.interpolation.render_tick)
+        self.game.network.publish(SnapshotAck(snapshot.tick_id, view_delay))
+
+    def _apply_snapshot_state(
+        self,
+        entity: NetworkEntity,
+        tick_id: int,
+        state: EntityState,
+        mask: int,
+        sync_mask: int,
+        still_at: int | None = None,
+    ):
+        if mask & (POSITION | ROTATION):
+            entity._receive_transform(
+                tick_id,
+                Vector2(state[0], state[1]) if mask & POSITION else None,
+                state[2] if mask & ROTATION else None,
+                still_at,
+            )
+        if mask & SCALE:
+            entity.transform.local_scale = Vector2(state[3], state[4])
+        if mask & SYNC_VARS:
+            sync_vars = entity._sync_vars
+            for i, value in enumerate(state[5]):
+                if sync_mask & (1 << i) and i < len(sync_vars) and value is not None:
+                    sync_vars[i]._current_value = value
+
     def on_serialize(self, out_dict: dict):
         out_dict["templates"] = self._templates
+        out_dict["snapshot_replication"] = self.snapshot_replication
+        out_dict["interpolation_delay"] = self.interpolation.delay
+        if self.area_of_interest is not None:
+            view_size = self.area_of_interest.view_size
+            out_dict["area_of_interest"] = {
+                "view_size": [view_size.x, view_size.y],
+                "hysteresis": self.area_of_interest.hysteresis,
+            }
 
     def on_deserialize(self, in_dict: dict):
         self._templates = in_dict.get("templates", {})
+        self.snapshot_replication = in_dict.get("snapshot_replication", False)
+        self.interpolation.delay = in_dict.get(
+            "interpolation_delay", DEFAULT_INTERPOLATION_DELAY
+        )
+        interest = in_dict.get("area_of_interest")
+        if interest is not None:
+            self.area_of_interest = AreaOfInterest(
+                Vector2(interest["view_size"]) if "view_size" in interest else None,
+                interest.get("hysteresis", 1.25),
+            )
         print(f"Loaded net entity templates: {self._templates}")
 
     def get_entity_by_id(self, entity_id: int):
@@ -167,53 +625,24 @@ class NetworkEntityManager(Behaviour):
 
 
 class SpawnEntity(Packet):
+    fields = {"id": VARUINT, "parent_id": optional(VARUINT), "template": optional(STR)}
+
     def __init__(self, id: int, template: str | None, parent_id: int | None = None):
         self.id = id
         self.parent_id = parent_id
         self.template = template
 
-    def on_write(self, writer: ByteWriter):
-        if self.parent_id:
-            writer.write_int32(-self.id)
-            writer.write_int32(self.parent_id)
-        else:
-            writer.write_int32(self.id)
-
-        if self.template is not None:
-            writer.write_bool(True)
-            writer.write_str(self.template)
-        else:
-            writer.write_bool(False)
-
-    def on_read(self, reader: ByteReader):
-        self.id = reader.read_int32()
-        if self.id < 0:
-            self.id = -self.id
-            self.parent_id = reader.read_int32()
-        else:
-            self.parent_id = None
-
-        has_template = reader.read_bool()
-        if has_template:
-            self.template = reader.read_str()
-        else:
-            self.template = None
-
     @property
     def delivery_mode(self) -> DeliveryMode:
         return DeliveryMode.RELIABLE_ORDERED
 
 
 class DestroyEntity(Packet):
+    fields = {"id": VARUINT}
+
     def __init__(self, id: int):
         self.id = id
 
-    def on_write(self, writer: ByteWriter):
-        writer.write_int32(self.id)
-
-    def on_read(self, reader: ByteReader):
-        self.id = reader.read_int32()
-
     @property
     def delivery_mode(self) -> DeliveryMode:
         return DeliveryMode.RELIABLE_ORDERED
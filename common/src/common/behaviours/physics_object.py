@@ -7,8 +7,24 @@ from typing import TYPE_CHECKING, Any
 import pygame as pg
 
 from common.behaviour import Behaviour
-from common.behaviours.collider import Collider, shape_collides
-from common.primitives import Vector2
+from common.behaviours.collider import (
+    Collider,
+    CollisionShape,
+    shape_time_of_impact,
+)
+from common.primitives import Rect, Vector2
+
+if TYPE_CHECKING:
+    from common.behaviours.physics_world import PhysicsWorld
+
+# Distance kept between objects that hit each other.
+CONTACT_SKIN = 0.01
+
+# Times that motion goes on along what it hit, for objects that slide.
+MAX_SLIDES = 3
+
+# Impacts that close to the first one happen along with it, as a fraction of motion.
+_SIMULTANEOUS_IMPACT = 1e-6
 
 
 @dataclass
@@ -43,6 +59,9 @@ class PhysicsObject(Behaviour):
         self.mass: float = 1
         self._pending_motion = Vector2()
         self._contacts: set[Collider] = set()
+        # When set, motion that hits something goes on along its surface instead of
+        # stopping there.
+        self.slide = False
 
     def on_pre_start(self):
         self.collider = self.node.get_or_add_behaviour(Collider)
@@ -54,6 +73,19 @@ class PhysicsObject(Behaviour):
     def move_and_collide(self, motion: Vector2):
         self._pending_motion += motion
 
+    def move_and_collide_now(self, motion: Vector2, predicted: bool = False):
+        """
+        Moves right away rather than on the next tick, so that the object can be
+        moved several times in a row, as when replaying predicted ticks.
+
+        Predicted motion still stops at and slides along what it hits, but neither
+        pushes other objects nor fires collision events: the server decides those,
+        and predicted ticks may be replayed many times.
+        """
+        self.collider.sync_transform()
+        self._perform_motion(motion, predicted)
+        self.collider.sync_transform()
+
     def on_tick(self, tick_id: int):
         if self._pending_motion.length_squared() == 0:
             return
@@ -61,76 +93,60 @@ class PhysicsObject(Behaviour):
         self._perform_motion(self._pending_motion)
         self._pending_motion = Vector2(0, 0)
 
-    def _perform_motion(self, motion: Vector2):
-        SQ_TOL = 0.1 * 0.1
+    def _perform_motion(self, motion: Vector2, predicted: bool = False):
         world = self.world
         if world is None:
             return
 
-        old_rect = self.collider.get_bounding_rect()
-        sq_error = motion.length_squared()
-
-        new_pos = old_rect.center + motion
-        new_rect = self.collider.get_bounding_rect(motion)
-
+        collider = self.collider
+        shape = collider.scaled_shape
+        start = collider.get_bounding_rect()
+        travelled = Vector2(0, 0)
+        remaining = motion
         new_contacts: set[Collider] = set()
-        collision: Collision | None = None
 
-        for other in world.get_potential_contacts(new_rect):
-            if other is self.collider:
-                continue
-
-            other_rect = other.get_bounding_rect()
-            other_pos = other_rect.center
-
-            collides = shape_collides(
-                (new_pos, self.collider.scaled_shape),
-                (other_pos, other.scaled_shape),
+        for _ in range(MAX_SLIDES + 1):
+            time, hits, normal = self._sweep(
+                world, start.center + travelled, start.size, shape, remaining
             )
-
-            if not collides:
-                continue
-
-            new_contacts.add(other)
-
-            lb, ub = 0.0, 1.0
-            mid = 0.5
-
-            while sq_error > SQ_TOL:
-                if collides:
-                    ub = mid
-                else:
-                    lb = mid
-
-                sq_error /= 4
-                new_pos = old_rect.center + motion * mid
-
-                collides = shape_collides(
-                    (new_pos, self.collider.scaled_shape),
-                    (other_pos, other.scaled_shape),
+            length = remaining.length()
+            # Stops short of what was hit, so as not to start the next motion on it.
+            stop = max(0.0, time - CONTACT_SKIN / length) if hits else time
+            travelled += remaining * stop
+            rest = remaining * (1 - time)
+
+            for other in hits:
+                if predicted or other in new_contacts:
+                    continue
+                new_contacts.add(other)
+
+                other_po = other.node.get_behaviour(PhysicsObject)
+                collision = Collision(
+                    this_physics_object=self,
+                    this_collider=collider,
+                    other_collider=other,
+                    other_physics_object=other_po,
                 )
 
-                mid = (lb + ub) * 0.5
+                if other not in self._contacts:
+                    self._fire_collision_enter(collision)
+                    if other_po:
+                        other_po._fire_collision_enter(collision.inverted())
 
-            other_po = other.node.get_behaviour(PhysicsObject)
-            collision = Collision(
-                this_physics_object=self,
-                this_collider=self.collider,
-                other_collider=other,
-                other_physics_object=other_po,
-            )
-
-            if other not in self._contacts:
-                self._fire_collision_enter(collision)
-                if other_po:
-                    other_po._fire_collision_enter(collision.inverted())
+                if other_po is not None:
+                    push = rest * (self.mass / other_po.mass)
+                    other_po.move_and_collide(push)
 
-            if other_po is not None:
-                remaining_motion = motion - motion * mid
-                push = remaining_motion * (self.mass / other_po.mass)
-                other_po.move_and_collide(push)
+            if normal is None or not self.slide:
+                break
+            # Goes on along the surface that was hit.
+            remaining = rest - normal * rest.dot(normal)
+            if remaining.length_squared() < CONTACT_SKIN * CONTACT_SKIN:
+                break
 
-        self.transform.position = new_pos
+        self.transform.position = self.transform.position + travelled
+        if predicted:
+            return
 
         for prev in self._contacts:
             if prev not in new_contacts:
@@ -141,6 +157,46 @@ class PhysicsObject(Behaviour):
 
         self._contacts = new_contacts
 
+    def _sweep(
+        self,
+        world: PhysicsWorld,
+        center: Vector2,
+        size: Vector2,
+        shape: CollisionShape,
+        motion: Vector2,
+    ) -> tuple[float, list[Collider], Vector2 | None]:
+        """
+        Returns the fraction of motion after which shape first hits colliders, the
+        colliders it hits then, and the normal of the surface of the first one.
+        """
+        swept = Rect(
+            center + motion * 0.5,
+            Vector2(size.x + abs(motion.x), size.y + abs(motion.y)),
+        )
+        earliest = 1.0
+        hits: list[Collider] = []
+        normal: Vector2 | None = None
+        for other in world.get_potential_contacts(swept):
+            if other is self.collider:
+                continue
+
+            impact = shape_time_of_impact(
+                (center, shape),
+                motion,
+                (other.get_bounding_rect().center, other.scaled_shape),
+            )
+            if impact is None:
+                continue
+
+            time, other_normal = impact
+            if normal is None or time < earliest - _SIMULTANEOUS_IMPACT:
+                earliest = time
+                hits = [other]
+                normal = other_normal
+            elif time <= earliest + _SIMULTANEOUS_IMPACT:
+                hits.append(other)
+        return earliest, hits, normal
+
     def _fire_collision_enter(self, collision: Collision):
         assert self.game
         for b in self.node.behaviours:
@@ -7,10 +7,21 @@ from typing import TYPE_CHECKING, Any, cast
 import pygame as pg
 
 from common.behaviour import Behaviour
-from common.primitives import Rect
+from common.collider_history import (
+    ABSENT,
+    CIRCLE,
+    RECT,
+    ColliderHistory,
+    ColliderState,
+)
+from common.primitives import Rect, Vector2
 
 if TYPE_CHECKING:
-    from common.behaviours.collider import Collider
+    from common.behaviours.collider import Collider, CollisionShape
+
+# Seconds of collider history servers keep, for queries of the world as clients saw
+# it. Clients render remote entities that far in the past at most.
+LAG_COMPENSATION_SECONDS = 1.0
 
 
 class PhysicsWorld(Behaviour):
@@ -20,8 +31,23 @@ class PhysicsWorld(Behaviour):
         )
         self.cell_w = 200
         self.cell_h = 200
+        self._colliders: set[Collider] = set()
+        # Colliders whose transform changed since their bounding rect was refreshed,
+        # which is done before the world is queried.
+        self._moved_colliders: set[Collider] = set()
+        self.lag_compensation_seconds = LAG_COMPENSATION_SECONDS
+        # Server-side history of colliders, created along with the first tick.
+        self.history: ColliderHistory | None = None
+
+    def get_potential_contacts(self, rect: Rect, tick: float | None = None):
+        """
+        Returns the colliders whose bounding rect may overlap rect, or did at tick on
+        servers, which keep a history of colliders.
+        """
+        if tick is not None and self.history is not None:
+            return [c for c, _, _ in self.history.query(rect, tick)]
 
-    def get_potential_contacts(self, rect: Rect):
+        self._sync_moved_colliders()
         result = set()
         for cell in self._get_rect_grid_cells(rect):
             result.update(self._collision_grid[cell])
@@ -40,10 +66,63 @@ class PhysicsWorld(Behaviour):
             for y in range(start_y, end_y + 1):
                 yield cast(tuple[int, int], (x, y))
 
+    def get_overlapping_colliders(
+        self, position: Vector2, shape: CollisionShape, tick: float | None = None
+    ) -> list[tuple[Collider, Vector2]]:
+        """
+        Returns the colliders that overlap shape at position, along with where they
+        are, or where they were at tick on servers.
+        """
+        from common.behaviours.collider import (
+            CircleCollisionShape,
+            RectCollisionShape,
+            shape_collides,
+        )
+
+        if isinstance(shape, RectCollisionShape):
+            rect = Rect(position, shape.size)
+        else:
+            rect = Rect(position, Vector2(shape.radius * 2, shape.radius * 2))
+
+        states: list[ColliderState]
+        if tick is not None and self.history is not None:
+            states = self.history.query(rect, tick)
+        else:
+            # Colliders of the present have their own shape.
+            states = [
+                (c, c.get_bounding_rect(), ABSENT)
+                for c in self.get_potential_contacts(rect)
+            ]
+
+        result = []
+        for collider, other_rect, kind in states:
+            if kind == ABSENT:
+                other_shape = collider.scaled_shape
+            elif kind == CIRCLE:
+                other_shape = CircleCollisionShape(other_rect.width * 0.5)
+            else:
+                other_shape = RectCollisionShape(other_rect.size)
+            if shape_collides((position, shape), (other_rect.center, other_shape)):
+                result.append((collider, other_rect.center))
+        return result
+
+    def collider_moved(self, collider: Collider):
+        self._moved_colliders.add(collider)
+
+    def _sync_moved_colliders(self):
+        moved = self._moved_colliders
+        while moved:
+            moved.pop().sync_transform()
+
     def register_collider(self, collider: Collider):
+        self._colliders.add(collider)
         self.update_collider_rect(collider, None, collider.get_bounding_rect())
 
     def unregister_collider(self, collider: Collider):
+        self._colliders.discard(collider)
+        self._moved_colliders.discard(collider)
+        if self.history is not None:
+            self.history.remove(collider)
         self.update_collider_rect(collider, collider.get_bounding_rect(), None)
 
     def update_collider_rect(
@@ -55,3 +134,32 @@ class PhysicsWorld(Behaviour):
         if new_rect:
             for c in self._get_rect_grid_cells(new_rect):
                 self._collision_grid[c].add(collider)
+
+    def on_update(self, dt: float):
+        assert self.game
+        if not self.game.network.is_server() or self.lag_compensation_seconds <= 0:
+            return
+
+        simulation = self.game.simulation
+        history = self.history
+        if history is None:
+            ticks = math.ceil(self.lag_compensation_seconds * simulation.tick_rate)
+            history = self.history = ColliderHistory(ticks + 1)
+
+        # Recorded once every behaviour ran its tick, as snapshots are.
+        tick_id = simulation.tick_id - 1
+        if tick_id <= history.newest_tick:
+            return
+        history.record(tick_id, self._collider_states())
+
+    def _collider_states(self):
+        from common.behaviours.collider import CircleCollisionShape
+
+        self._sync_moved_colliders()
+        for collider in self._colliders:
+            kind = (
+                CIRCLE
+                if isinstance(collider.base_shape, CircleCollisionShape)
+                else RECT
+            )
+            yield collider, collider.get_bounding_rect(), kind
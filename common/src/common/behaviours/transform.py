@@ -1,94 +1,295 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any, Callable
 
 import pygame as pg
 
 if TYPE_CHECKING:
     from common.node import Node
+    from common.transform_store import TransformStore
 
 from common.behaviour import Behaviour
 from common.primitives import Vector2
 
+# Shared by the transforms kept in a store, in place of vectors of their own.
+_ORIGIN = Vector2(0, 0)
+_UNIT = Vector2(1, 1)
+
 
 class Transform(Behaviour):
+    """
+    Local position, rotation and scale of a node, relative to its parent.
+
+    World values are cached, and recomputed on access once a local value of the
+    transform or of one of its ancestors changed. Vectors returned by the
+    properties are shared with the transform, and must be assigned rather than
+    mutated in place.
+
+    Transforms of a game with a TransformStore keep their values in a slot of the
+    store instead, and their properties return new vectors.
+    """
+
     def __init__(self, node: Node):
         super().__init__(node)
         self._local_position = Vector2(0, 0)
         self._local_scale = Vector2(1, 1)
         self._local_rotation = 0.0
+        self._position = Vector2(0, 0)
+        self._scale = Vector2(1, 1)
+        self._rotation = 0.0
+        self._dirty = True
+        self._version = 0
+        self._change_listeners: list[Callable[[], Any]] = []
+        self._store: TransformStore | None = None
+        self._slot = -1
 
     @property
-    def local_scale(self):
+    def version(self) -> int:
+        """
+        Increases whenever the world transform changes, so that an unchanged
+        version means an unchanged position, rotation and scale.
+        """
+        if self._dirty:
+            self._refresh()
+        return self._version
+
+    def _invalidate(self):
+        """Marks the world transform of the node and its descendants as stale."""
+        pending = [self.node]
+        while pending:
+            node = pending.pop()
+            transform = node.transform
+            # Descendants of a stale transform are stale already.
+            if transform._dirty:
+                continue
+            transform._dirty = True
+            transform._version += 1
+            if transform._store is not None:
+                transform._store._stale.append(transform._slot)
+            for listener in transform._change_listeners:
+                listener()
+            pending.extend(node._children)
+
+    def listen_changed(self, listener: Callable[[], Any]):
+        self._change_listeners.append(listener)
+
+    def unlisten_changed(self, listener: Callable[[], Any]):
+        self._change_listeners.remove(listener)
+
+    def _refresh(self):
+        parent = self.parent
+        store = self._store
+        if store is not None:
+            self._refresh_slot(store, self._slot, parent)
+            return
+        if parent is None:
+            self._position = Vector2(self._local_position)
+            self._scale = Vector2(self._local_scale)
+            self._rotation = self._local_rotation
+        else:
+            parent_transform = parent.transform
+            parent_rotation = parent_transform.rotation
+            self._position = (
+                self._local_position.rotate(parent_rotation) + parent_transform.position
+            )
+            self._scale = self._local_scale.elementwise() * parent_transform.scale
+            self._rotation = self._local_rotation + parent_rotation
+        self._dirty = False
+
+    def _refresh_slot(self, store: TransformStore, slot: int, parent: Node | None):
+        local_position = Vector2(store.local_x.item(slot), store.local_y.item(slot))
+        local_scale_x = store.local_scale_x.item(slot)
+        local_scale_y = store.local_scale_y.item(slot)
+        local_rotation = store.local_rotation.item(slot)
+        if parent is None:
+            position = local_position
+            scale_x, scale_y = local_scale_x, local_scale_y
+            rotation = local_rotation
+        else:
+            parent_transform = parent.transform
+            parent_rotation = parent_transform.rotation
+            parent_scale = parent_transform.scale
+            position = (
+                local_position.rotate(parent_rotation) + parent_transform.position
+            )
+            scale_x = local_scale_x * parent_scale.x
+            scale_y = local_scale_y * parent_scale.y
+            rotation = local_rotation + parent_rotation
+        store.x[slot] = position.x
+        store.y[slot] = position.y
+        store.rotation[slot] = rotation
+        store.scale_x[slot] = scale_x
+        store.scale_y[slot] = scale_y
+        self._dirty = False
+
+    def _update_storage(self):
+        """
+        Moves the transforms of the node and its descendants into the store of their
+        scene, or out of it, and links stored transforms to their parent's slot.
+        Nodes are stored along with their parent, and roots when their game has a
+        store.
+        """
+        pending = [self.node]
+        while pending:
+            node = pending.pop()
+            transform = node.transform
+            parent = node.parent
+            if parent is not None:
+                store = parent.transform._store
+            else:
+                game = node.game
+                store = game.transform_store if game is not None else None
+
+            if store is not transform._store:
+                transform._move_to(store)
+            if store is not None:
+                slot = transform._slot
+                if parent is None:
+                    store.parent[slot] = -1
+                    store.depth[slot] = 0
+                else:
+                    parent_slot = parent.transform._slot
+                    store.parent[slot] = parent_slot
+                    store.depth[slot] = store.depth[parent_slot] + 1
+            pending.extend(node._children)
+
+    def _move_to(self, store: TransformStore | None):
+        old = self._store
+        if old is not None:
+            slot = self._slot
+            self._local_position = Vector2(old.local_x[slot], old.local_y[slot])
+            self._local_rotation = old.local_rotation.item(slot)
+            self._local_scale = Vector2(
+                old.local_scale_x[slot], old.local_scale_y[slot]
+            )
+            self._position = Vector2(old.x[slot], old.y[slot])
+            self._rotation = old.rotation.item(slot)
+            self._scale = Vector2(old.scale_x[slot], old.scale_y[slot])
+            old._release(slot)
+            self._store = None
+            self._slot = -1
+
+        if store is not None:
+            slot = store._allocate(self)
+            store.local_x[slot], store.local_y[slot] = self._local_position
+            store.local_rotation[slot] = self._local_rotation
+            store.local_scale_x[slot], store.local_scale_y[slot] = self._local_scale
+            store.x[slot], store.y[slot] = self._position
+            store.rotation[slot] = self._rotation
+            store.scale_x[slot], store.scale_y[slot] = self._scale
+            if self._dirty:
+                store._stale.append(slot)
+            self._store = store
+            self._slot = slot
+            # The vectors of the transform go unused until it leaves the store.
+            self._local_position = self._position = _ORIGIN
+            self._local_scale = self._scale = _UNIT
+
+    @property
+    def local_scale(self) -> Vector2:
+        store = self._store
+        if store is not None:
+            slot = self._slot
+            return Vector2(store.local_scale_x[slot], store.local_scale_y[slot])
         return self._local_scale
 
     @local_scale.setter
     def local_scale(self, value: Vector2):
-        self._local_scale = value
+        store = self._store
+        if store is not None:
+            store.local_scale_x[self._slot], store.local_scale_y[self._slot] = value
+        else:
+            self._local_scale = value
+        self._invalidate()
 
     @property
-    def scale(self):
-        scale = self._local_scale
-        if self.parent != None:
-            scale = self.local_scale.elementwise() * self.parent.transform.scale
-        return scale
+    def scale(self) -> Vector2:
+        if self._dirty:
+            self._refresh()
+        store = self._store
+        if store is not None:
+            slot = self._slot
+            return Vector2(store.scale_x[slot], store.scale_y[slot])
+        return self._scale
 
     @property
-    def local_position(self):
+    def local_position(self) -> Vector2:
+        store = self._store
+        if store is not None:
+            slot = self._slot
+            return Vector2(store.local_x[slot], store.local_y[slot])
         return self._local_position
 
     @local_position.setter
     def local_position(self, new_pos: Vector2):
-        self._local_position = new_pos
+        store = self._store
+        if store is not None:
+            store.local_x[self._slot], store.local_y[self._slot] = new_pos
+        else:
+            self._local_position = new_pos
+        self._invalidate()
 
     @property
     def position(self) -> Vector2:
-        if self.parent is not None:
-            parent_position = self.parent.transform.position
-            parent_rotation = self.parent.transform.rotation
-            local_pos_offset = self.local_position.rotate(parent_rotation)
-            return local_pos_offset + parent_position
-        else:
-            return self._local_position
+        if self._dirty:
+            self._refresh()
+        store = self._store
+        if store is not None:
+            slot = self._slot
+            return Vector2(store.x[slot], store.y[slot])
+        return self._position
 
     @position.setter
     def position(self, new_pos: Vector2):
         delta = new_pos - self.position
-        self.local_position += delta
+        parent = self.parent
+        if parent is not None:
+            # The local position is rotated along with the parent.
+            delta.rotate_ip(-parent.transform.rotation)
+        self.local_position = self.local_position + delta
 
     @property
     def local_rotation(self) -> float:
+        store = self._store
+        if store is not None:
+            return store.local_rotation.item(self._slot)
         return self._local_rotation
 
     @local_rotation.setter
     def local_rotation(self, rot: float):
-        self._local_rotation = rot
+        store = self._store
+        if store is not None:
+            store.local_rotation[self._slot] = rot
+        else:
+            self._local_rotation = rot
+        self._invalidate()
 
     @property
-    def rotation(self):
-        rotation = self._local_rotation
-        if self.parent is not None:
-            rotation += self.parent.transform.rotation
-        return rotation
+    def rotation(self) -> float:
+        if self._dirty:
+            self._refresh()
+        store = self._store
+        if store is not None:
+            return store.rotation.item(self._slot)
+        return self._rotation
 
     @rotation.setter
     def rotation(self, value: float):
         delta = value - self.rotation
-        self._local_rotation += delta
+        self.local_rotation = self.local_rotation + delta
 
     def on_serialize(self, out_dict: dict):
-        out_dict["local_position"] = {
-            "x": self._local_position.x,
-            "y": self._local_position.y,
-        }
-        out_dict["local_scale"] = {"x": self._local_scale.x, "y": self._local_scale.y}
-        out_dict["rotation"] = self._local_rotation
+        local_position = self.local_position
+        local_scale = self.local_scale
+        out_dict["local_position"] = {"x": local_position.x, "y": local_position.y}
+        out_dict["local_scale"] = {"x": local_scale.x, "y": local_scale.y}
+        out_dict["rotation"] = self.local_rotation
 
     def on_deserialize(self, in_dict: dict):
-        self._local_position = Vector2(0, 0)
+        self.local_position = Vector2(0, 0)
         local_pos_dict = in_dict.get("local_position")
         if local_pos_dict:
-            self._local_position = Vector2(
+            self.local_position = Vector2(
                 local_pos_dict.get("x", 0), local_pos_dict.get("y", 0)
             )
         else:
@@ -96,10 +297,13 @@ class Transform(Behaviour):
             if pos_dict:
                 self.position = Vector2(pos_dict.get("x", 0), pos_dict.get("y", 0))
 
-        self._local_scale = Vector2(1, 1)
+        self.local_scale = Vector2(1, 1)
         scale_dict = in_dict.get("local_scale")
         if scale_dict:
-            self._local_scale.x = scale_dict["x"]
-            self._local_scale.y = scale_dict["y"]
+            self.local_scale = Vector2(scale_dict["x"], scale_dict["y"])
+
+        self.local_rotation = in_dict.get("rotation", 0)
 
-        self._local_rotation = in_dict.get("rotation", 0)
+    def on_destroy(self):
+        if self._store is not None:
+            self._move_to(None)
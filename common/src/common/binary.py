@@ -1,104 +1,288 @@
 import struct
 from io import BytesIO
-from typing import cast
+from typing import Any, Callable
+
+_INT8 = struct.Struct("<b")
+_INT16 = struct.Struct("<h")
+_INT32 = struct.Struct("<i")
+_INT64 = struct.Struct("<q")
+_UINT8 = struct.Struct("<B")
+_UINT16 = struct.Struct("<H")
+_UINT32 = struct.Struct("<I")
+_UINT64 = struct.Struct("<Q")
+_FLOAT32 = struct.Struct("<f")
+_FLOAT64 = struct.Struct("<d")
+
+Buffer = bytes | bytearray | memoryview
+
+
+def zigzag_encode(i: int) -> int:
+    """Maps signed integers to unsigned ones, so that small magnitudes stay small."""
+    return i << 1 if i >= 0 else ((-i) << 1) - 1
+
+
+def zigzag_decode(i: int) -> int:
+    return i >> 1 if not i & 1 else -((i + 1) >> 1)
+
+
+def quantize(f: float, precision: float) -> int:
+    return round(f / precision)
+
+
+def dequantize(i: int, precision: float) -> float:
+    return i * precision
 
 
 class ByteReader:
-    def __init__(self, data: bytes | BytesIO | None = None):
+    """
+    Reads little-endian values from a buffer without copying it. The buffer is
+    wrapped in a memoryview and values are unpacked in place at a moving offset.
+    """
+
+    def __init__(self, data: Buffer | BytesIO | None = None):
         if data is None:
-            data = BytesIO()
-        elif isinstance(data, bytes):
-            data = BytesIO(data)
-        self._stream = cast(BytesIO, data)
+            data = b""
+        elif isinstance(data, BytesIO):
+            data = data.getvalue()
+        self._view = memoryview(data)
+        self._offset = 0
+        # Called with (packet, encoded size) for every packet decoded from this
+        # reader, nested ones included.
+        self.decode_observer: Callable[[Any, int], None] | None = None
+
+    @property
+    def offset(self):
+        return self._offset
+
+    @property
+    def remaining(self):
+        return len(self._view) - self._offset
+
+    def _unpack(self, s: struct.Struct):
+        offset = self._offset
+        (value,) = s.unpack_from(self._view, offset)
+        self._offset = offset + s.size
+        return value
 
     def read_int8(self) -> int:
-        return int.from_bytes(self._stream.read(1), byteorder="little", signed=True)
+        return self._unpack(_INT8)
 
     def read_int16(self) -> int:
-        return int.from_bytes(self._stream.read(2), byteorder="little", signed=True)
+        return self._unpack(_INT16)
 
     def read_int32(self) -> int:
-        return int.from_bytes(self._stream.read(4), byteorder="little", signed=True)
+        return self._unpack(_INT32)
 
     def read_int64(self) -> int:
-        return int.from_bytes(self._stream.read(8), byteorder="little", signed=True)
+        return self._unpack(_INT64)
 
     def read_float32(self) -> float:
-        return struct.unpack("<f", self._stream.read(4))[0]
+        return self._unpack(_FLOAT32)
 
     def read_float64(self) -> float:
-        return struct.unpack("<d", self._stream.read(8))[0]
+        return self._unpack(_FLOAT64)
 
     def read_str(self) -> str:
         n = self.read_int16()
-        return self._stream.read(n).decode()
+        return str(self.read_bytes(n), "utf-8")
 
     def read_uint8(self) -> int:
-        return int.from_bytes(self._stream.read(1), byteorder="little", signed=False)
+        # Indexing the view skips the tuple struct.unpack_from would allocate.
+        offset = self._offset
+        try:
+            value = self._view[offset]
+        except IndexError:
+            raise struct.error("read_uint8 requires 1 byte, 0 left") from None
+        self._offset = offset + 1
+        return value
 
     def read_uint16(self) -> int:
-        return int.from_bytes(self._stream.read(2), byteorder="little", signed=False)
+        return self._unpack(_UINT16)
 
     def read_uint32(self) -> int:
-        return int.from_bytes(self._stream.read(4), byteorder="little", signed=False)
+        return self._unpack(_UINT32)
 
     def read_uint64(self) -> int:
-        return int.from_bytes(self._stream.read(8), byteorder="little", signed=False)
+        return self._unpack(_UINT64)
 
     def read_bool(self) -> bool:
-        return bool(self.read_uint8())
+        return self.read_uint8() != 0
+
+    def read_varuint(self) -> int:
+        """Reads an unsigned LEB128 varint."""
+        view = self._view
+        offset = self._offset
+        end = len(view)
+        if offset < end and view[offset] < 0x80:
+            self._offset = offset + 1
+            return view[offset]
+
+        result = 0
+        shift = 0
+        while True:
+            if offset >= end:
+                raise struct.error("varint runs past the end of the buffer")
+            b = view[offset]
+            offset += 1
+            result |= (b & 0x7F) << shift
+            if b < 0x80:
+                break
+            shift += 7
+        self._offset = offset
+        return result
+
+    def read_varint(self) -> int:
+        """Reads a zigzag-encoded signed varint."""
+        return zigzag_decode(self.read_varuint())
+
+    def read_quantized(self, precision: float) -> float:
+        return self.read_varint() * precision
+
+    def read_struct(self, s: struct.Struct) -> tuple:
+        """Unpacks every field of a precompiled struct in a single call."""
+        offset = self._offset
+        values = s.unpack_from(self._view, offset)
+        self._offset = offset + s.size
+        return values
+
+    def read_bytes(self, n: int) -> memoryview:
+        """Returns a view over the next n bytes, without copying them."""
+        start = self._offset
+        end = start + n
+        if end > len(self._view):
+            raise struct.error(
+                f"read_bytes requires {n} bytes, {len(self._view) - start} left"
+            )
+        self._offset = end
+        return self._view[start:end]
 
     @property
     def data(self):
-        return self._stream.getbuffer().tobytes()
+        return self._view.tobytes()
 
 
 class ByteWriter:
-    def __init__(self, data: bytes | BytesIO | None = None):
+    """
+    Writes little-endian values into a growable bytearray. Values are packed
+    in place with precompiled structs, and the written payload can be taken
+    either as a bytes copy (data) or as a zero-copy memoryview (view()).
+    """
+
+    def __init__(
+        self, data: Buffer | BytesIO | None = None, initial_capacity: int = 64
+    ):
         if data is None:
-            data = BytesIO()
-        elif isinstance(data, bytes):
-            data = BytesIO(data)
-        self._stream = cast(BytesIO, data)
+            buffer = bytearray(initial_capacity)
+        elif isinstance(data, bytearray):
+            buffer = data
+        elif isinstance(data, BytesIO):
+            buffer = bytearray(data.getvalue())
+        else:
+            buffer = bytearray(data)
+        self._buffer = buffer
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _reserve(self, n: int) -> int:
+        offset = self._size
+        required = offset + n
+        capacity = len(self._buffer)
+        if required > capacity:
+            self._buffer.extend(bytes(max(required - capacity, capacity)))
+        self._size = required
+        return offset
+
+    def _pack(self, s: struct.Struct, value):
+        s.pack_into(self._buffer, self._reserve(s.size), value)
 
     def write_int8(self, i: int):
-        self._stream.write(i.to_bytes(1, byteorder="little", signed=True))
+        self._pack(_INT8, i)
 
     def write_int16(self, i: int):
-        self._stream.write(i.to_bytes(2, byteorder="little", signed=True))
+        self._pack(_INT16, i)
 
     def write_int32(self, i: int):
-        self._stream.write(i.to_bytes(4, byteorder="little", signed=True))
+        self._pack(_INT32, i)
 
     def write_int64(self, i: int):
-        self._stream.write(i.to_bytes(8, byteorder="little", signed=True))
+        self._pack(_INT64, i)
 
     def write_float32(self, f: float):
-        self._stream.write(struct.pack("<f", f))
+        self._pack(_FLOAT32, f)
 
     def write_float64(self, f: float):
-        self._stream.write(struct.pack("<d", f))
+        self._pack(_FLOAT64, f)
 
     def write_str(self, s: str):
         encoded = s.encode()
         self.write_int16(len(encoded))
-        self._stream.write(encoded)
+        self.write_bytes(encoded)
 
     def write_uint8(self, i: int):
-        self._stream.write(i.to_bytes(1, byteorder="little", signed=False))
+        self._pack(_UINT8, i)
 
     def write_uint16(self, i: int):
-        self._stream.write(i.to_bytes(2, byteorder="little", signed=False))
+        self._pack(_UINT16, i)
 
     def write_uint32(self, i: int):
-        self._stream.write(i.to_bytes(4, byteorder="little", signed=False))
+        self._pack(_UINT32, i)
 
     def write_uint64(self, i: int):
-        self._stream.write(i.to_bytes(8, byteorder="little", signed=False))
+        self._pack(_UINT64, i)
 
     def write_bool(self, b: bool):
         self.write_uint8(int(b))
 
+    def write_varuint(self, i: int):
+        """Writes an unsigned LEB128 varint: 7 bits per byte, 1 byte below 128."""
+        if i < 0:
+            raise struct.error(f"varuint cannot encode negative value {i}")
+        if i < 0x80:
+            offset = self._reserve(1)
+            self._buffer[offset] = i
+            return
+
+        encoded = bytearray()
+        while i >= 0x80:
+            encoded.append((i & 0x7F) | 0x80)
+            i >>= 7
+        encoded.append(i)
+        self.write_bytes(encoded)
+
+    def write_varint(self, i: int):
+        """Writes a signed varint, zigzag-encoded."""
+        self.write_varuint(zigzag_encode(i))
+
+    def write_quantized(self, f: float, precision: float):
+        """
+        Writes a float as a signed varint multiple of precision. For instance, a
+        precision of 1/16 keeps positions within 1/32 of a world unit.
+        """
+        self.write_varint(quantize(f, precision))
+
+    def write_struct(self, s: struct.Struct, *values):
+        """Packs every field of a precompiled struct in a single call."""
+        s.pack_into(self._buffer, self._reserve(s.size), *values)
+
+    def write_bytes(self, b: Buffer):
+        n = len(b)
+        offset = self._reserve(n)
+        self._buffer[offset : offset + n] = b
+
+    def clear(self):
+        """Discards the written payload, keeping the allocated capacity."""
+        self._size = 0
+
+    def view(self) -> memoryview:
+        """
+        Returns a zero-copy view of the written payload. The writer cannot grow
+        while the view is alive, so release it before writing again.
+        """
+        return memoryview(self._buffer)[: self._size]
+
     @property
     def data(self):
-        return self._stream.getbuffer().tobytes()
+        with memoryview(self._buffer) as view:
+            return view[: self._size].tobytes()
@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import struct
+import time
+from dataclasses import dataclass
+from typing import BinaryIO, Callable, Iterator
+
+from common.binary import Buffer, ByteReader, ByteWriter
+from common.network import DeliveryMode, get_protocol_checksum
+
+MAGIC = b"MAGUSCAP"
+VERSION = 1
+
+_HEADER = struct.Struct("<8sBBId")
+
+# Record kinds
+INBOUND = 0
+OUTBOUND = 1
+CONNECT = 2
+DISCONNECT = 3
+
+SERVER = 0
+CLIENT = 1
+
+
+@dataclass
+class CaptureHeader:
+    side: int
+    protocol_checksum: int
+    started_at: float
+
+
+@dataclass
+class CaptureRecord:
+    kind: int
+    tick_id: int
+    timestamp: float
+    """Seconds since the capture started."""
+    peer: tuple[str, int]
+    mode: DeliveryMode | None = None
+    payload: bytes = b""
+
+
+class PacketCapture:
+    """
+    Records network traffic into a compact append-only file, starting a new capture
+    at path. Each record is a kind byte (with the delivery mode in its upper bits),
+    the tick id, the time elapsed since the previous record in microseconds, the
+    peer index, and the raw payload. Integers are varints, and peers are introduced
+    once by their connect record.
+
+    Records are buffered and written every flush_threshold bytes and on close.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        side: int,
+        tick_source: Callable[[], int] = lambda: 0,
+        flush_threshold: int = 1 << 16,
+    ):
+        self._file: BinaryIO = open(path, "wb")
+        self._tick_source = tick_source
+        self._flush_threshold = flush_threshold
+        self._writer = ByteWriter(initial_capacity=flush_threshold + 1024)
+        self._peer_ids: dict[tuple[str, int], int] = {}
+        self._started_at = time.time()
+        self._last_time = time.perf_counter()
+
+        self._file.write(
+            _HEADER.pack(
+                MAGIC, VERSION, side, get_protocol_checksum(), self._started_at
+            )
+        )
+
+    def _begin_record(self, kind: int, peer: tuple[str, int], mode: int = 0):
+        now = time.perf_counter()
+        elapsed_us = round((now - self._last_time) * 1_000_000)
+        self._last_time = now
+
+        writer = self._writer
+        writer.write_uint8(kind | (mode << 2))
+        writer.write_varuint(self._tick_source())
+        writer.write_varuint(elapsed_us)
+        writer.write_varuint(self._peer_ids[peer])
+
+    def _end_record(self):
+        if len(self._writer) >= self._flush_threshold:
+            self.flush()
+
+    def record_connect(self, peer: tuple[str, int]):
+        # Reconnecting addresses get a new index, so that replays see distinct peers.
+        self._peer_ids[peer] = len(self._peer_ids)
+        self._begin_record(CONNECT, peer)
+        self._writer.write_str(peer[0])
+        self._writer.write_uint16(peer[1])
+        self._end_record()
+
+    def record_disconnect(self, peer: tuple[str, int]):
+        if peer not in self._peer_ids:
+            return
+        self._begin_record(DISCONNECT, peer)
+        self._end_record()
+
+    def record_inbound(
+        self, peer: tuple[str, int], mode: DeliveryMode, payload: Buffer
+    ):
+        self._record_payload(INBOUND, peer, mode, payload)
+
+    def record_outbound(
+        self, peer: tuple[str, int], mode: DeliveryMode, payload: Buffer
+    ):
+        self._record_payload(OUTBOUND, peer, mode, payload)
+
+    def _record_payload(
+        self, kind: int, peer: tuple[str, int], mode: DeliveryMode, payload: Buffer
+    ):
+        if peer not in self._peer_ids:
+            self.record_connect(peer)
+        self._begin_record(kind, peer, mode.value)
+        self._writer.write_varuint(len(payload))
+        self._writer.write_bytes(payload)
+        self._end_record()
+
+    def flush(self):
+        with self._writer.view() as view:
+            self._file.write(view)
+        self._writer.clear()
+        self._file.flush()
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+
+
+def read_capture(path: str) -> tuple[CaptureHeader, Iterator[CaptureRecord]]:
+    """Reads the header of a capture file, and returns an iterator over its records."""
+    with open(path, "rb") as f:
+        data = f.read()
+
+    magic, version, side, checksum, started_at = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a packet capture.")
+    if version != VERSION:
+        raise ValueError(f"Unsupported packet capture version {version}.")
+
+    header = CaptureHeader(side, checksum, started_at)
+    return header, _read_records(ByteReader(memoryview(data)[_HEADER.size :]))
+
+
+def _read_records(reader: ByteReader) -> Iterator[CaptureRecord]:
+    peers: list[tuple[str, int]] = []
+    timestamp = 0.0
+
+    while reader.remaining > 0:
+        kind_byte = reader.read_uint8()
+        kind = kind_byte & 0x3
+        tick_id = reader.read_varuint()
+        timestamp += reader.read_varuint() / 1_000_000
+        peer_id = reader.read_varuint()
+
+        if kind == CONNECT:
+            peers.append((reader.read_str(), reader.read_uint16()))
+            yield CaptureRecord(kind, tick_id, timestamp, peers[peer_id])
+        elif kind == DISCONNECT:
+            yield CaptureRecord(kind, tick_id, timestamp, peers[peer_id])
+        else:
+            payload = reader.read_bytes(reader.read_varuint()).tobytes()
+            yield CaptureRecord(
+                kind,
+                tick_id,
+                timestamp,
+                peers[peer_id],
+                DeliveryMode(kind_byte >> 2),
+                payload,
+            )
@@ -0,0 +1,34 @@
+import time
+from abc import ABC, abstractmethod
+
+
+class Clock(ABC):
+    """Where a simulation reads the time from, in seconds."""
+
+    @abstractmethod
+    def now(self) -> float:
+        pass
+
+
+class MonotonicClock(Clock):
+    def now(self) -> float:
+        return time.monotonic()
+
+
+class VirtualClock(Clock):
+    """
+    A clock that only moves when told to. Advancing it straight to the next tick
+    deadline runs a headless simulation as fast as the machine allows, with the same
+    ticks every run.
+    """
+
+    def __init__(self, start: float = 0.0):
+        self._now = start
+
+    def now(self) -> float:
+        return self._now
+
+    def advance(self, seconds: float):
+        if seconds < 0:
+            raise ValueError("A clock cannot go back in time.")
+        self._now += seconds
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import math
+from collections import deque
+
+from common.network import DeliveryMode, NetPeer, Network, Packet
+from common.schema import FLOAT64
+from common.simulation import Simulation
+
+# Seconds between two pings, once the clock is synchronized.
+PING_INTERVAL = 0.5
+
+# Seconds between two pings until then, so that synchronizing takes a fraction of
+# a second.
+SYNC_PING_INTERVAL = 0.1
+
+# Pongs the estimate is computed from, and how many it takes to be trusted.
+CLOCK_SAMPLES = 8
+MIN_CLOCK_SAMPLES = 4
+
+# Samples are only kept when their round trip is at most that much longer than the
+# shortest one, in proportion then in seconds. Longer round trips usually mean a
+# packet queued on one way only, which skews the offset.
+MAX_RTT_RATIO = 1.5
+RTT_TOLERANCE = 0.005
+
+# Ticks per tick that the estimate of the server tick may drift by to reach a new
+# estimate, so that it never jumps.
+MAX_CLOCK_SLEW = 0.05
+
+# Estimates further off than that are jumped to, as are ticks that far behind the
+# server's.
+CLOCK_SNAP_TICKS = 4.0
+
+# Ticks run up to that much faster or slower to stay in step with the server, by
+# DRIFT_GAIN for every tick of difference.
+MAX_TICK_RATE_DRIFT = 0.05
+DRIFT_GAIN = 0.1
+
+# Ticks the client runs ahead of the server by, on top of half a round trip, so that
+# the inputs it stamps with its tick reach the server before it runs that tick.
+INPUT_LEAD_TICKS = 1.0
+
+
+class ClockPing(Packet):
+    fields = {"client_time": FLOAT64}
+
+    def __init__(self, client_time: float):
+        self.client_time = client_time
+
+    @property
+    def delivery_mode(self) -> DeliveryMode:
+        return DeliveryMode.UNRELIABLE
+
+
+class ClockPong(Packet):
+    fields = {"client_time": FLOAT64, "server_tick": FLOAT64}
+
+    def __init__(self, client_time: float, server_tick: float):
+        self.client_time = client_time
+        self.server_tick = server_tick
+
+    @property
+    def delivery_mode(self) -> DeliveryMode:
+        return DeliveryMode.UNRELIABLE
+
+
+def serve_clock_sync(network: Network, simulation: Simulation):
+    """Answers the pings of clients with the tick time of the server."""
+
+    def handle_ping(ping: ClockPing, peer: NetPeer):
+        peer.send(ClockPong(ping.client_time, simulation.tick_time))
+
+    network.listen(ClockPing, handle_ping)
+
+
+class ClockSync:
+    """
+    Estimates the tick time of the server on a client, from the round trips of
+    periodic pings, and keeps the ticks of the client in step with it.
+
+    Each pong gives the offset between the server tick and the client clock, assuming
+    both ways took as long. Only the pongs with about the shortest round trip are
+    averaged, and the estimate exposed through Simulation.server_tick drifts towards
+    that average rather than jumping to it. The client then runs its ticks slightly
+    faster or slower until its tick_time is lead_ticks ahead of the server's, so
+    that the inputs it sends arrive in time for the tick they were given at.
+    """
+
+    def __init__(self, network: Network, simulation: Simulation):
+        self._network = network
+        self._simulation = simulation
+        self._samples: deque[tuple[float, float]] = deque(maxlen=CLOCK_SAMPLES)
+        self._target_offset: float | None = None
+        self._peer: NetPeer | None = None
+        self._last_ping = -math.inf
+        self._last_update: float | None = None
+        # Round trip time to the server in seconds, once synchronized.
+        self.rtt: float | None = None
+        network.listen(ClockPong, self._handle_pong)
+
+    @property
+    def synchronized(self) -> bool:
+        return self._simulation.server_tick_offset is not None
+
+    @property
+    def lead_ticks(self) -> float:
+        """Ticks the client runs ahead of the server by."""
+        if self.rtt is None:
+            return 0.0
+        return self.rtt / 2 * self._simulation.tick_rate + INPUT_LEAD_TICKS
+
+    def _reset(self):
+        self._samples.clear()
+        self._target_offset = None
+        self._last_ping = -math.inf
+        self.rtt = None
+        self._simulation.server_tick_offset = None
+        self._simulation.tick_rate_scale = 1.0
+
+    def _handle_pong(self, pong: ClockPong, peer: NetPeer):
+        if peer is not self._peer:
+            return
+
+        simulation = self._simulation
+        now = simulation.clock.now()
+        rtt = now - pong.client_time
+        if rtt < 0:
+            return
+
+        tick_rate = simulation.tick_rate
+        offset = pong.server_tick + rtt / 2 * tick_rate - now * tick_rate
+        self._samples.append((rtt, offset))
+        if len(self._samples) < MIN_CLOCK_SAMPLES:
+            return
+
+        max_rtt = min(r for r, _ in self._samples) * MAX_RTT_RATIO + RTT_TOLERANCE
+        kept = [(r, o) for r, o in self._samples if r <= max_rtt]
+        self._target_offset = sum(o for _, o in kept) / len(kept)
+        self.rtt = sum(r for r, _ in kept) / len(kept)
+
+    def update(self):
+        """Pings the server when due, and steers the simulation. Called every frame."""
+        simulation = self._simulation
+        now = simulation.clock.now()
+        elapsed = 0.0 if self._last_update is None else now - self._last_update
+        self._last_update = now
+
+        peer = next(iter(self._network.connected_peers), None)
+        if peer is not self._peer:
+            # A new server has its own ticks.
+            self._peer = peer
+            self._reset()
+        if peer is None:
+            return
+
+        interval = PING_INTERVAL if self.synchronized else SYNC_PING_INTERVAL
+        if now - self._last_ping >= interval:
+            self._last_ping = now
+            self._network.publish(ClockPing(now))
+
+        target = self._target_offset
+        if target is None:
+            return
+
+        offset = simulation.server_tick_offset
+        if offset is None or abs(target - offset) > CLOCK_SNAP_TICKS:
+            offset = target
+        else:
+            max_step = MAX_CLOCK_SLEW * elapsed * simulation.tick_rate
+            offset += max(-max_step, min(target - offset, max_step))
+        simulation.server_tick_offset = offset
+
+        target_tick = now * simulation.tick_rate + offset + self.lead_ticks
+        error = target_tick - simulation.tick_time
+        if abs(error) > CLOCK_SNAP_TICKS:
+            simulation.align_tick(target_tick)
+            simulation.tick_rate_scale = 1.0
+        else:
+            simulation.tick_rate_scale = 1 + max(
+                -MAX_TICK_RATE_DRIFT, min(error * DRIFT_GAIN, MAX_TICK_RATE_DRIFT)
+            )
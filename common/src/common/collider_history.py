@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import math
+from array import array
+from collections import deque
+from typing import TYPE_CHECKING, Iterable
+
+from common.primitives import Rect, Vector2
+from common.utils import notnull
+
+if TYPE_CHECKING:
+    from common.behaviours.collider import Collider
+
+# Kinds of shapes recorded per collider and tick. Slots without a collider at a
+# tick are absent.
+ABSENT = 0
+RECT = 1
+CIRCLE = 2
+
+# A collider as recorded at a tick: (collider, bounding rect, kind of shape).
+ColliderState = tuple["Collider", Rect, int]
+
+
+class ColliderHistory:
+    """
+    Ring buffer of the bounding rects and shapes of colliders over the last ticks,
+    for queries of the world as it was at a past tick.
+
+    Every collider gets a slot, and every tick a row of flat arrays indexed by slot:
+    four arrays of floats for the center and size of bounding rects, and an array of
+    bytes for the kinds of shapes. Rows
+    are overwritten once the history wraps around, and the slots of removed
+    colliders are only given to new ones after every row recorded them as absent.
+    """
+
+    def __init__(self, ticks: int):
+        self.ticks = ticks
+        self._row_ticks = [-1] * ticks
+        # Rows of (center x, center y, width, height).
+        self._rects = [tuple(array("f") for _ in range(4)) for _ in range(ticks)]
+        self._kinds = [array("B") for _ in range(ticks)]
+        self._capacity = 0
+        self._slots: dict[Collider, int] = {}
+        self._colliders: list[Collider | None] = []
+        self._free_slots: list[int] = []
+        # Slots of removed colliders, along with the tick they were removed at.
+        self._released_slots: deque[tuple[int, int]] = deque()
+        self.newest_tick = -1
+
+    def __len__(self):
+        return len(self._slots)
+
+    @property
+    def oldest_tick(self) -> int:
+        return self.newest_tick - self.ticks + 1
+
+    def record(self, tick_id: int, states: Iterable[ColliderState]):
+        """Records the colliders present at tick_id, which follows the last one."""
+        self._reclaim_slots(tick_id)
+        slots = [(self._get_slot(c), rect, kind) for c, rect, kind in states]
+
+        row = tick_id % self.ticks
+        self._row_ticks[row] = tick_id
+        xs, ys, ws, hs = self._rects[row]
+        kinds = self._kinds[row]
+        kinds[:] = array("B", bytes(self._capacity))
+        for slot, rect, kind in slots:
+            center = rect.center
+            size = rect.size
+            xs[slot] = center.x
+            ys[slot] = center.y
+            ws[slot] = size.x
+            hs[slot] = size.y
+            kinds[slot] = kind
+        self.newest_tick = tick_id
+
+    def remove(self, collider: Collider):
+        """Forgets the collider, which stays in the ticks it was recorded at."""
+        slot = self._slots.pop(collider, None)
+        if slot is None:
+            return
+        self._colliders[slot] = None
+        self._released_slots.append((self.newest_tick, slot))
+
+    def _get_slot(self, collider: Collider) -> int:
+        slot = self._slots.get(collider)
+        if slot is not None:
+            return slot
+
+        if self._free_slots:
+            slot = self._free_slots.pop()
+            self._colliders[slot] = collider
+        else:
+            slot = len(self._colliders)
+            self._colliders.append(collider)
+            if slot >= self._capacity:
+                self._grow(max(16, self._capacity * 2))
+        self._slots[collider] = slot
+        return slot
+
+    def _grow(self, capacity: int):
+        added = capacity - self._capacity
+        for rects, kinds in zip(self._rects, self._kinds):
+            for values in rects:
+                values.extend(array("f", bytes(4 * added)))
+            kinds.extend(array("B", bytes(added)))
+        self._capacity = capacity
+
+    def _reclaim_slots(self, tick_id: int):
+        released = self._released_slots
+        while released and tick_id - released[0][0] > self.ticks:
+            self._free_slots.append(released.popleft()[1])
+
+    def _row(self, tick_id: int) -> int | None:
+        row = tick_id % self.ticks
+        return row if self._row_ticks[row] == tick_id else None
+
+    def _recorded_around(self, tick: float) -> tuple[int, int] | None:
+        """
+        Returns the recorded ticks closest to tick, before or at it and after it,
+        since ticks may be skipped when the server catches up.
+        """
+        if self.newest_tick < 0:
+            return None
+        oldest = self.oldest_tick
+        tick = min(max(tick, oldest), self.newest_tick)
+
+        before = math.floor(tick)
+        while before >= oldest and self._row(before) is None:
+            before -= 1
+        after = before
+        if tick > before:
+            after = math.ceil(tick)
+            while after < self.newest_tick and self._row(after) is None:
+                after += 1
+        if before < oldest:
+            before = after
+        return (before, after) if self._row(before) is not None else None
+
+    def query(self, rect: Rect, tick: float) -> list[ColliderState]:
+        """
+        Returns the colliders whose bounding rect overlapped rect at tick, and their
+        state then. Fractional ticks are interpolated, and ticks outside of the
+        history are clamped to it.
+        """
+        recorded = self._recorded_around(tick)
+        if recorded is None:
+            return []
+        before, after = recorded
+        row_a = notnull(self._row(before))
+        row_b = self._row(after) if after != before else None
+        t = (min(max(tick, before), after) - before) / max(after - before, 1)
+
+        xs_a, ys_a, ws, hs = self._rects[row_a]
+        kinds_a = self._kinds[row_a]
+        if row_b is None:
+            xs_b, ys_b, kinds_b = xs_a, ys_a, kinds_a
+        else:
+            xs_b, ys_b, _, _ = self._rects[row_b]
+            kinds_b = self._kinds[row_b]
+
+        center = rect.center
+        qx, qy = center.x, center.y
+        qhw, qhh = rect.size.x * 0.5, rect.size.y * 0.5
+
+        # Colliders missing from the later tick stay where they were.
+        candidates = [
+            slot
+            for slot, (kind, kind_b, xa, xb, w) in enumerate(
+                zip(kinds_a, kinds_b, xs_a, xs_b, ws)
+            )
+            if kind != ABSENT
+            and abs((xa + (xb - xa) * t if kind_b == kind else xa) - qx)
+            <= qhw + w * 0.5
+        ]
+
+        result: list[ColliderState] = []
+        colliders = self._colliders
+        for slot in candidates:
+            collider = colliders[slot]
+            if collider is None:
+                # Removed since, so nothing could be done with it.
+                continue
+            kind = kinds_a[slot]
+            x, y = xs_a[slot], ys_a[slot]
+            if kinds_b[slot] == kind:
+                x += (xs_b[slot] - x) * t
+                y += (ys_b[slot] - y) * t
+            h = hs[slot]
+            if abs(y - qy) > qhh + h * 0.5:
+                continue
+            result.append((collider, Rect(Vector2(x, y), Vector2(ws[slot], h)), kind))
+        return result
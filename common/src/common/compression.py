@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import heapq
+import os
+import zlib
+from collections import Counter
+from sys import stderr
+from typing import Iterable
+
+# First byte of a compressed frame. Packet ids stay below it, so any other first
+# byte starts an uncompressed frame and costs nothing extra.
+COMPRESSED_FRAME = 0xFF
+
+DICTIONARY_ASSET = "network/frames.zdict"
+
+# Deflate cannot look further back than its 32KiB window, dictionary included.
+MAX_DICTIONARY_SIZE = 32 * 1024
+
+# Largest frame a compressed frame may inflate to. Larger frames are sent as they
+# are, so that a few bytes from a peer cannot make us allocate gigabytes.
+MAX_FRAME_SIZE = 1024 * 1024
+
+_WBITS = -15
+
+
+class FrameCompressor:
+    """
+    Compresses frames with raw deflate, primed with an optional preset dictionary
+    shared by both ends. Every frame is compressed on its own, so that frames can
+    be decompressed in whatever order ENet delivers them.
+
+    The dictionary is only hashed once: frames are compressed by copies of a
+    compressor that was primed with it.
+    """
+
+    def __init__(
+        self, dictionary: bytes | None = None, threshold: int = 192, level: int = 6
+    ):
+        if dictionary is not None and len(dictionary) > MAX_DICTIONARY_SIZE:
+            raise ValueError(
+                f"Compression dictionaries are limited to {MAX_DICTIONARY_SIZE} bytes."
+            )
+        self.dictionary = dictionary
+        self.threshold = threshold
+        if dictionary:
+            self._compressor = zlib.compressobj(
+                level, zlib.DEFLATED, _WBITS, zdict=dictionary
+            )
+            self._decompressor = zlib.decompressobj(_WBITS, zdict=dictionary)
+        else:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, _WBITS)
+            self._decompressor = zlib.decompressobj(_WBITS)
+
+    @property
+    def digest(self) -> bytes:
+        """Identifies the dictionary, as part of the protocol checksum."""
+        return hashlib.sha256(self.dictionary or b"").digest()
+
+    def compress(self, frame: bytes) -> bytes | None:
+        """
+        Returns the compressed frame, flag byte included, or None when compressing
+        would not make it smaller.
+        """
+        if len(frame) > MAX_FRAME_SIZE:
+            return None
+        compressor = self._compressor.copy()
+        compressed = compressor.compress(frame) + compressor.flush()
+        if len(compressed) + 1 >= len(frame):
+            return None
+        return bytes((COMPRESSED_FRAME,)) + compressed
+
+    def decompress(self, data) -> bytes:
+        decompressor = self._decompressor.copy()
+        frame = decompressor.decompress(memoryview(data)[1:], MAX_FRAME_SIZE + 1)
+        if len(frame) > MAX_FRAME_SIZE or decompressor.unconsumed_tail:
+            raise zlib.error(f"Compressed frame inflates past {MAX_FRAME_SIZE} bytes.")
+        if not decompressor.eof:
+            raise zlib.error("Truncated compressed frame.")
+        return frame
+
+
+def load_dictionary(path: str | None = None) -> bytes | None:
+    """Reads the dictionary built by the train command, if there is one."""
+    if path is None:
+        from common.assets import resource_path
+
+        path = resource_path(DICTIONARY_ASSET)
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def train_dictionary(
+    samples: Iterable[bytes],
+    size: int = 16 * 1024,
+    segment_size: int = 32,
+    k: int = 6,
+) -> bytes:
+    """
+    Builds a preset dictionary from sample payloads, by greedily picking the
+    segments that cover the most k-byte substrings shared between samples. Picked
+    substrings stop counting for the next segments, so that the dictionary does not
+    repeat itself. The best segments go last, where deflate reaches them with the
+    shortest distances.
+    """
+    samples = [bytes(s) for s in samples if len(s) >= k]
+
+    counts: Counter[bytes] = Counter()
+    for sample in samples:
+        counts.update({sample[i : i + k] for i in range(len(sample) - k + 1)})
+
+    def score(segment: bytes):
+        return sum(counts[segment[i : i + k]] - 1 for i in range(len(segment) - k + 1))
+
+    candidates = {
+        sample[start : start + segment_size]
+        for sample in samples
+        for start in range(0, max(len(sample) - segment_size, 0) + 1, segment_size // 2)
+    }
+    heap = [(-score(c), c) for c in candidates]
+    heapq.heapify(heap)
+
+    picked: list[bytes] = []
+    total = 0
+    while heap and total < size:
+        negated, segment = heapq.heappop(heap)
+        current = score(segment)
+        if current <= 0:
+            break
+        if current < -negated and heap and current < -heap[0][0]:
+            # Scores only decrease as substrings get covered, so re-queue stale ones.
+            heapq.heappush(heap, (-current, segment))
+            continue
+
+        picked.append(segment)
+        total += len(segment)
+        for i in range(len(segment) - k + 1):
+            counts[segment[i : i + k]] = 0
+
+    return b"".join(reversed(picked))[-size:]
+
+
+def _main(args):
+    from common.capture import INBOUND, OUTBOUND, read_capture
+    from common.network import DeliveryMode
+
+    samples = []
+    for path in args.captures:
+        _, records = read_capture(path)
+        samples += [
+            r.payload
+            for r in records
+            if r.kind in (INBOUND, OUTBOUND) and r.mode is not DeliveryMode.UNRELIABLE
+        ]
+    if not samples:
+        print("The captures do not contain any reliable payload.", file=stderr)
+        return
+
+    dictionary = train_dictionary(samples, args.size)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "wb") as f:
+        f.write(dictionary)
+
+    raw = sum(len(s) for s in samples)
+    plain = FrameCompressor(threshold=0)
+    trained = FrameCompressor(dictionary, threshold=0)
+    plain_size = sum(len(plain.compress(s) or s) for s in samples)
+    trained_size = sum(len(trained.compress(s) or s) for s in samples)
+    print(
+        f"Wrote a {len(dictionary)} byte dictionary to {args.output}. "
+        f"{len(samples)} reliable payloads, {raw} bytes: {plain_size} compressed "
+        f"without it, {trained_size} with it."
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Trains the frame compression dictionary from packet captures."
+    )
+    parser.add_argument("captures", nargs="+", help="Packet captures to learn from.")
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=os.path.join("assets", DICTIONARY_ASSET),
+        help="Where to write the dictionary.",
+    )
+    parser.add_argument(
+        "--size",
+        type=int,
+        default=16 * 1024,
+        help=f"Dictionary size in bytes, at most {MAX_DICTIONARY_SIZE}.",
+    )
+    _main(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -5,11 +5,13 @@ from sys import stderr
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
+    from common.clock_sync import ClockSync
     from common.network import Network, NullNetwork
     from common.node import Node
     from common.simulation import Simulation
     from common.behaviour import Behaviour
     from common.input import Input
+    from common.transform_store import TransformStore
 
 import pygame as pg
 
@@ -22,12 +24,17 @@ class Game:
         network: Network | None = None,
         scene: Node | None = None,
         global_object: Node | None = None,
+        transform_store: TransformStore | None = None,
     ):
+        from common.clock_sync import ClockSync, serve_clock_sync
         from common.input import Input
         from common.network import NullNetwork
         from common.node import Node
         from common.simulation import Simulation
 
+        # Set before any node is bound to the game, so that their transforms are
+        # stored in it from the start.
+        self._transform_store = transform_store
         self._simulation = simulation or Simulation()
         self._network: Network = network or NullNetwork()
         self._scene = scene or Node()
@@ -40,6 +47,13 @@ class Game:
         self._input = Input()
         self._scene_loaded_futures: list[asyncio.Future] = []
 
+        # Servers answer the pings that clients keep their ticks in step with.
+        self._clock_sync: ClockSync | None = None
+        if self._network.is_server():
+            serve_clock_sync(self._network, self._simulation)
+        elif self._network.is_client():
+            self._clock_sync = ClockSync(self._network, self._simulation)
+
     @property
     def stopped(self):
         return self._stopped
@@ -51,10 +65,19 @@ class Game:
     def simulation(self):
         return self._simulation
 
+    @property
+    def clock_sync(self):
+        return self._clock_sync
+
     @property
     def input(self):
         return self._input
 
+    @property
+    def transform_store(self) -> TransformStore | None:
+        """Where the transforms of the game's nodes are kept, if not in the nodes."""
+        return self._transform_store
+
     @property
     def network(self):
         return self._network
@@ -81,6 +104,7 @@ class Game:
 
         if not self._started:
             self._started = True
+            self.simulation.start()
             self.global_object.bind_to_game(self)
             self.scene.bind_to_game(self)
 
@@ -100,7 +124,10 @@ class Game:
             self._resolve_scene_loaded_futures()
 
         self.network.poll()
+        if self._clock_sync is not None:
+            self._clock_sync.update()
         self.simulation.iterate()
+        self.network.flush()
 
         if not self.headless:
             if (
@@ -116,6 +143,15 @@ class Game:
             print("No asyncio event loop detected.", file=stderr)
             quit()
 
+    def next_wake_delay(self, max_delay: float) -> float:
+        """
+        How long a headless game can wait for network events before its next
+        iteration, at most max_delay. Games with a display iterate every frame.
+        """
+        if not self.headless:
+            return 0.0
+        return min(self.simulation.time_until_next_tick(), max_delay)
+
     def handle_pygame_events(self, events: list[pg.event.Event]):
         must_stop = self._input.handle_pygame_events(events)
         if must_stop:
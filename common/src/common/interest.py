@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import math
+from collections import defaultdict
+from collections.abc import Iterable, Mapping, Set
+from typing import TYPE_CHECKING
+
+from common.network import NetPeer
+from common.primitives import Vector2
+
+if TYPE_CHECKING:
+    from common.behaviours.network_entity import NetworkEntity
+
+
+class RelevanceHandler:
+    """
+    Behaviours of networked entities can implement this to override whether their
+    entity is replicated to a given peer.
+    """
+
+    def is_relevant_to(self, peer: NetPeer) -> bool | None:
+        """
+        Returns True or False to force the entity to be replicated or not to the peer,
+        or None to let the area of interest decide.
+        """
+        return None
+
+
+class InterestViewer:
+    """
+    Behaviours of networked entities can implement this to make their entity a point
+    of view of a peer. Entities around a peer's viewers are replicated to that peer.
+    """
+
+    def get_viewing_peer(self) -> NetPeer | None:
+        return None
+
+
+class AreaOfInterest:
+    """
+    Computes which root entities are relevant to each peer, using a uniform grid over
+    entity positions. Entities become relevant once inside the view rect around one
+    of the peer's viewers, and stop being relevant only after leaving a larger rect,
+    so that entities close to the edge do not flicker in and out.
+    """
+
+    def __init__(
+        self,
+        view_size: Vector2 | None = None,
+        hysteresis: float = 1.25,
+        cell_size: float = 500,
+    ):
+        self.view_size = view_size or Vector2(2400, 1600)
+        self.hysteresis = hysteresis
+        self.cell_size = cell_size
+
+    def compute(
+        self,
+        roots: Iterable[NetworkEntity],
+        peers: Iterable[NetPeer],
+        previous: Mapping[NetPeer, Set[int] | None],
+    ) -> dict[NetPeer, set[int] | None]:
+        """
+        Returns the ids of the root entities relevant to each peer. Peers without any
+        viewer get None, meaning every entity is relevant to them.
+        """
+        cell_size = self.cell_size
+        grid: defaultdict[tuple[int, int], list[tuple[int, float, float]]] = (
+            defaultdict(list)
+        )
+        viewers: defaultdict[NetPeer, list[tuple[int, float, float]]] = defaultdict(
+            list
+        )
+        handlers: list[tuple[int, list[RelevanceHandler]]] = []
+
+        for entity in roots:
+            pos = entity.transform.position
+            entry = (entity.id, pos.x, pos.y)
+            grid[(math.floor(pos.x / cell_size), math.floor(pos.y / cell_size))].append(
+                entry
+            )
+
+            entity_handlers = []
+            for b in entity.node.behaviours:
+                if isinstance(b, InterestViewer):
+                    peer = b.get_viewing_peer()
+                    if peer is not None:
+                        viewers[peer].append(entry)
+                if isinstance(b, RelevanceHandler):
+                    entity_handlers.append(b)
+            if entity_handlers:
+                handlers.append((entity.id, entity_handlers))
+
+        enter_w = self.view_size.x * 0.5
+        enter_h = self.view_size.y * 0.5
+        leave_w = enter_w * self.hysteresis
+        leave_h = enter_h * self.hysteresis
+
+        result: dict[NetPeer, set[int] | None] = {}
+        for peer in peers:
+            peer_viewers = viewers.get(peer)
+            if not peer_viewers:
+                result[peer] = None
+                continue
+
+            # Peers without a previous interest set were sent every entity.
+            was_relevant = previous.get(peer)
+            relevant: set[int] = set()
+
+            for viewer_id, vx, vy in peer_viewers:
+                relevant.add(viewer_id)
+
+                start_x = math.floor((vx - leave_w) / cell_size)
+                end_x = math.floor((vx + leave_w) / cell_size)
+                start_y = math.floor((vy - leave_h) / cell_size)
+                end_y = math.floor((vy + leave_h) / cell_size)
+
+                for cx in range(start_x, end_x + 1):
+                    for cy in range(start_y, end_y + 1):
+                        for entity_id, x, y in grid.get((cx, cy), ()):
+                            dx = abs(x - vx)
+                            dy = abs(y - vy)
+                            if dx <= enter_w and dy <= enter_h:
+                                relevant.add(entity_id)
+                            elif (
+                                dx <= leave_w
+                                and dy <= leave_h
+                                and (was_relevant is None or entity_id in was_relevant)
+                            ):
+                                relevant.add(entity_id)
+
+            for entity_id, entity_handlers in handlers:
+                for h in entity_handlers:
+                    forced = h.is_relevant_to(peer)
+                    if forced is True:
+                        relevant.add(entity_id)
+                    elif forced is False:
+                        relevant.discard(entity_id)
+
+            result[peer] = relevant
+
+        return result
@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+from collections import deque
+
+# Transform states kept per entity. At usual tick rates, this covers about a second,
+# much more than the render delay.
+INTERPOLATION_BUFFER_SIZE = 32
+
+# Render delay behind the estimated server tick, in seconds. Updates arriving up to
+# that late are still in time to be interpolated towards.
+DEFAULT_INTERPOLATION_DELAY = 0.1
+
+# Servers only send transforms that changed. A state received more than that many
+# ticks after the previous one is assumed to follow a stop, rather than lost updates.
+MAX_INTERPOLATION_GAP = 4
+
+# How much of the distance to each newly received tick the server tick estimate
+# covers, which averages out the jitter of arrival times.
+TIMELINE_SMOOTHING = 0.1
+
+# Server tick estimates further than that from a received tick are reset to it.
+TIMELINE_SNAP_TICKS = 8.0
+
+# A received transform: (tick_id, x, y, rotation, teleport).
+TransformSample = tuple[float, float, float, float, bool]
+
+
+def lerp_angle(a: float, b: float, t: float) -> float:
+    """Interpolates between two angles in degrees, along the shortest arc."""
+    delta = (b - a) % 360
+    if delta > 180:
+        delta -= 360
+    return a + delta * t
+
+
+class InterpolationTimeline:
+    """
+    Estimates the current server tick from the ticks of received updates, unless
+    the clock is synchronized with the server, and the tick at which remote entities
+    are rendered, which is a fixed delay behind it.
+    """
+
+    def __init__(self, delay: float = DEFAULT_INTERPOLATION_DELAY):
+        self.delay = delay
+        self._server_tick: float | None = None
+        self._last_observed_tick = -1
+        self.render_tick = 0.0
+
+    @property
+    def server_tick(self) -> float | None:
+        return self._server_tick
+
+    def observe(self, tick_id: int):
+        """Takes a tick received from the server into account, once per tick."""
+        if tick_id <= self._last_observed_tick:
+            return
+        self._last_observed_tick = tick_id
+
+        server_tick = self._server_tick
+        if server_tick is None or abs(tick_id - server_tick) > TIMELINE_SNAP_TICKS:
+            self._server_tick = float(tick_id)
+        else:
+            self._server_tick = (
+                server_tick + (tick_id - server_tick) * TIMELINE_SMOOTHING
+            )
+
+    def advance(self, dt: float, tick_rate: float, server_tick: float | None = None):
+        """
+        Moves the timeline forward by a frame, or to the server tick given by clock
+        synchronization, and updates the render tick.
+        """
+        if server_tick is not None:
+            self._server_tick = server_tick
+        elif self._server_tick is None:
+            return
+        else:
+            self._server_tick += dt * tick_rate
+        self.render_tick = self._server_tick - self.delay * tick_rate
+
+
+class InterpolationBuffer:
+    """
+    Ring buffer of the transforms received for an entity, ordered by tick, that
+    gives the transform of the entity at any tick in between.
+    """
+
+    __slots__ = ("_samples",)
+
+    def __init__(self, size: int = INTERPOLATION_BUFFER_SIZE):
+        self._samples: deque[TransformSample] = deque(maxlen=size)
+
+    def __len__(self):
+        return len(self._samples)
+
+    @property
+    def newest(self) -> TransformSample | None:
+        return self._samples[-1] if self._samples else None
+
+    def push(
+        self,
+        tick_id: float,
+        x: float,
+        y: float,
+        rotation: float,
+        still_at: float | None = None,
+    ):
+        """
+        Adds the state of the entity at tick_id. A state received for an older tick
+        than the newest is folded into the newest. still_at is a tick at which the
+        entity is known to have still been in its previous state.
+        """
+        samples = self._samples
+        if not samples:
+            samples.append((tick_id, x, y, rotation, False))
+            return
+
+        newest = samples[-1]
+        if tick_id <= newest[0]:
+            if newest[4]:
+                # States sent around a teleport do not move the entity away from
+                # where it was teleported.
+                samples[-1] = (newest[0], newest[1], newest[2], rotation, True)
+            else:
+                samples[-1] = (newest[0], x, y, rotation, False)
+            return
+
+        if tick_id - newest[0] > MAX_INTERPOLATION_GAP:
+            still_at = tick_id - 1 if still_at is None else max(still_at, tick_id - 1)
+        if still_at is not None and newest[0] < still_at < tick_id:
+            samples.append((still_at, newest[1], newest[2], newest[3], False))
+        samples.append((tick_id, x, y, rotation, False))
+
+    def push_teleport(self, tick_id: float, x: float, y: float, rotation: float):
+        """
+        Adds a teleport at tick_id, which the entity jumps to instead of moving
+        towards it. Teleports may arrive after states following them.
+        """
+        samples = self._samples
+        index = len(samples)
+        while index > 0 and samples[index - 1][0] > tick_id:
+            index -= 1
+
+        sample = (tick_id, x, y, rotation, True)
+        if index > 0 and samples[index - 1][0] == tick_id:
+            samples[index - 1] = sample
+            return
+        if len(samples) == samples.maxlen:
+            if index == 0:
+                return
+            samples.popleft()
+            index -= 1
+        samples.insert(index, sample)
+
+    def sample(self, tick: float) -> TransformSample | None:
+        """
+        Returns the state of the entity at tick, holding the oldest and newest
+        states outside of the buffer. The teleport flag of the result is meaningless.
+        """
+        samples = self._samples
+        if not samples:
+            return None
+
+        # The render tick is usually just behind the newest states.
+        index = len(samples) - 1
+        if tick >= samples[index][0]:
+            return samples[index]
+        while index > 0 and samples[index - 1][0] > tick:
+            index -= 1
+        if index == 0:
+            return samples[0]
+
+        before = samples[index - 1]
+        after = samples[index]
+        if after[4]:
+            return before
+
+        t = (tick - before[0]) / (after[0] - before[0])
+        return (
+            tick,
+            before[1] + (after[1] - before[1]) * t,
+            before[2] + (after[2] - before[2]) * t,
+            lerp_angle(before[3], after[3], t),
+            False,
+        )
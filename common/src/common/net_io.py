@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import asyncio
+import queue
+import threading
+import time
+import traceback
+from sys import stderr
+from typing import Any
+
+import enet
+
+from common.net_metrics import NetworkMetrics
+from common.network import Packet, decode_packet
+
+_SEND = 0
+_FLUSH = 1
+_DISCONNECT = 2
+
+# Inbound event: (event type, peer address, enet peer, decoded packet or None,
+# raw payload, event data).
+NetEvent = tuple[int, tuple[str, int], Any, Packet | None, bytes, int]
+
+
+class NetIOThread:
+    """
+    Owns an ENet host from a background thread, so that a long tick or frame does not
+    delay acknowledgements. The host is serviced continuously, and received packets
+    are decoded there and handed to the game loop through a queue, along with
+    connection events. Outbound payloads take another queue the other way, so the
+    host and its peers are only ever touched from the I/O thread.
+    """
+
+    def __init__(
+        self,
+        host: enet.Host,
+        idle_sleep: float = 0.001,
+        metrics: NetworkMetrics | None = None,
+    ):
+        self._host = host
+        self._metrics = metrics
+        self._idle_sleep = idle_sleep
+        self._inbound: queue.SimpleQueue[NetEvent] = queue.SimpleQueue()
+        self._outbound: queue.SimpleQueue[tuple] = queue.SimpleQueue()
+        self._running = False
+        self._thread = threading.Thread(target=self._run, name="net-io", daemon=True)
+        # The game loop waiting for inbound events, if it is.
+        self._waiter: tuple[asyncio.AbstractEventLoop, asyncio.Future] | None = None
+
+    def start(self):
+        self._running = True
+        self._thread.start()
+
+    def stop(self):
+        """Sends every queued payload and stops servicing the host."""
+        if not self._running:
+            return
+        self._running = False
+        self._thread.join()
+
+    def send(self, enet_peer, channel: int, data: bytes, flags: int):
+        self._outbound.put((_SEND, enet_peer, channel, data, flags))
+
+    def flush(self):
+        self._outbound.put((_FLUSH,))
+
+    def disconnect_peer(self, enet_peer, data: int = 0):
+        self._outbound.put((_DISCONNECT, enet_peer, data))
+
+    def drain(self):
+        """Yields every event received since the last drain. Main thread only."""
+        inbound = self._inbound
+        while True:
+            try:
+                yield inbound.get_nowait()
+            except queue.Empty:
+                return
+
+    async def wait(self, timeout: float):
+        """Sleeps until an event is received or timeout elapses. Main thread only."""
+        if not self._inbound.empty() or timeout <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._waiter = (loop, future)
+        try:
+            # An event may have come in before the waiter was set.
+            if self._inbound.empty():
+                await asyncio.wait_for(future, timeout)
+        except TimeoutError:
+            pass
+        finally:
+            self._waiter = None
+
+    def _wake(self):
+        waiter = self._waiter
+        if waiter is not None:
+            loop, future = waiter
+            loop.call_soon_threadsafe(_resolve, future)
+
+    def _run(self):
+        while self._running:
+            busy = self._process_outbound()
+            busy = self._service() or busy
+            if not busy:
+                time.sleep(self._idle_sleep)
+
+        self._process_outbound()
+        self._host.flush()
+
+    def _process_outbound(self) -> bool:
+        outbound = self._outbound
+        busy = False
+        while True:
+            try:
+                command = outbound.get_nowait()
+            except queue.Empty:
+                return busy
+
+            busy = True
+            kind = command[0]
+            if kind == _SEND:
+                _, enet_peer, channel, data, flags = command
+                enet_peer.send(channel, enet.Packet(data, flags))
+            elif kind == _FLUSH:
+                self._host.flush()
+            elif kind == _DISCONNECT:
+                command[1].disconnect(command[2])
+
+    def _service(self) -> bool:
+        busy = False
+        while True:
+            event = self._host.service(0)
+            if event.type == enet.EVENT_TYPE_NONE:
+                if busy:
+                    self._wake()
+                return busy
+
+            busy = True
+            address = (event.peer.address.host, event.peer.address.port)
+            packet = None
+            data = b""
+            if event.type == enet.EVENT_TYPE_RECEIVE:
+                data = event.packet.data
+                try:
+                    packet = decode_packet(data, self._metrics)
+                except Exception:
+                    print(
+                        f"Dropped undecodable packet from {address}: {traceback.format_exc()}",
+                        file=stderr,
+                    )
+                    continue
+
+            self._inbound.put(
+                (event.type, address, event.peer, packet, data, event.data)
+            )
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+async def wait_for_host(host: enet.Host, io: NetIOThread | None, timeout: float):
+    """
+    Sleeps until the ENet host receives something or timeout elapses. Without an
+    I/O thread, this watches the host's socket from the event loop.
+    """
+    if io is not None:
+        await io.wait(timeout)
+        return
+    if timeout <= 0:
+        return
+
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    fd = host.socket.fileno()
+    loop.add_reader(fd, _resolve, future)
+    try:
+        await asyncio.wait_for(future, timeout)
+    except TimeoutError:
+        pass
+    finally:
+        loop.remove_reader(fd)
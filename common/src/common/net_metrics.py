@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import json
+import socket
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, BinaryIO
+
+if TYPE_CHECKING:
+    from common.network import DeliveryMode, Packet
+
+INBOUND = "in"
+OUTBOUND = "out"
+
+# ENet reports packet loss as a fraction of this scale, and the throttle as a
+# fraction of the other.
+_ENET_PACKET_LOSS_SCALE = 1 << 16
+_ENET_PACKET_THROTTLE_SCALE = 32
+
+_HISTOGRAM_BUCKETS = 48
+
+
+class Histogram:
+    """
+    Counts non-negative integers into power-of-two buckets: bucket i holds the
+    values below 2**i that did not fit in bucket i - 1. Adding a value is a couple of
+    integer operations, so histograms can stay on in production.
+    """
+
+    __slots__ = ("buckets", "count", "total")
+
+    def __init__(self):
+        self.buckets = [0] * _HISTOGRAM_BUCKETS
+        self.count = 0
+        self.total = 0
+
+    def add(self, value: int):
+        self.buckets[min(value.bit_length(), _HISTOGRAM_BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += value
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, p: float) -> int:
+        """Upper bound of the bucket holding the p-th percentile (0 to 1)."""
+        rank = p * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= rank:
+                return (1 << i) - 1
+        return 0
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "p50": self.percentile(0.5),
+            "p99": self.percentile(0.99),
+            "buckets": {(1 << i) - 1: n for i, n in enumerate(self.buckets) if n},
+        }
+
+
+class TrafficCounter:
+    __slots__ = ("messages", "bytes", "sizes")
+
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+        self.sizes = Histogram()
+
+
+@dataclass
+class PeerLinkStats:
+    round_trip_time: int
+    """Smoothed round trip time in milliseconds."""
+    round_trip_time_variance: int
+    packet_loss: float
+    """Fraction of reliable packets lost, between 0 and 1."""
+    packet_throttle: float
+    """Fraction of unreliable packets ENet lets through, between 0 and 1."""
+
+    @classmethod
+    def from_enet(cls, enet_peer) -> PeerLinkStats:
+        return cls(
+            enet_peer.roundTripTime,
+            enet_peer.roundTripTimeVariance,
+            enet_peer.packetLoss / _ENET_PACKET_LOSS_SCALE,
+            enet_peer.packetThrottle / _ENET_PACKET_THROTTLE_SCALE,
+        )
+
+
+class NetworkMetrics:
+    """
+    Cumulative counters of the messages and bytes exchanged per packet type,
+    direction and delivery mode, along with encode and decode timings in
+    nanoseconds. Counters only ever grow, so consumers of snapshots diff two of
+    them to get rates.
+
+    Outbound packets are counted as they are queued, before being coalesced into
+    frames. Inbound packets are counted as they are decoded, possibly by a network
+    I/O thread: MultiPacket entries cover whole frames and bundles, and the packets
+    they contain are also counted under their own types.
+    """
+
+    def __init__(self):
+        self._traffic: dict[tuple[type, str, DeliveryMode], TrafficCounter] = {}
+        self.encode_ns = Histogram()
+        self.decode_ns = Histogram()
+        self.started_at = time.time()
+
+    def record(self, packet_type: type, direction: str, mode: DeliveryMode, size: int):
+        key = (packet_type, direction, mode)
+        counter = self._traffic.get(key)
+        if counter is None:
+            counter = self._traffic.setdefault(key, TrafficCounter())
+        counter.messages += 1
+        counter.bytes += size
+        counter.sizes.add(size)
+
+    def record_received(self, packet: Packet, size: int):
+        self.record(type(packet), INBOUND, packet.delivery_mode, size)
+
+    def traffic(
+        self, packet_type: type, direction: str, mode: DeliveryMode
+    ) -> TrafficCounter | None:
+        return self._traffic.get((packet_type, direction, mode))
+
+    def snapshot(self, peers: dict[str, PeerLinkStats] | None = None) -> dict:
+        """Returns the current metrics as a JSON serializable dict."""
+        traffic: list[dict[str, Any]] = [
+            {
+                "type": packet_type.__name__,
+                "direction": direction,
+                "mode": mode.name,
+                "messages": counter.messages,
+                "bytes": counter.bytes,
+                "sizes": counter.sizes.snapshot(),
+            }
+            for (packet_type, direction, mode), counter in list(self._traffic.items())
+        ]
+        traffic.sort(key=lambda t: t["bytes"], reverse=True)
+
+        return {
+            "time": time.time(),
+            "uptime": time.time() - self.started_at,
+            "traffic": traffic,
+            "encode_ns": self.encode_ns.snapshot(),
+            "decode_ns": self.decode_ns.snapshot(),
+            "peers": {address: vars(stats) for address, stats in (peers or {}).items()},
+        }
+
+
+class MetricsExporter:
+    """
+    Periodically exports metric snapshots, as JSON lines appended to the file at
+    path, or as JSON datagrams sent over UDP to a local endpoint (host, port).
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        endpoint: tuple[str, int] | None = None,
+        interval: float = 5.0,
+    ):
+        if (path is None) == (endpoint is None):
+            raise ValueError("Exactly one of path and endpoint must be given.")
+
+        self.interval = interval
+        self._file: BinaryIO | None = open(path, "ab") if path is not None else None
+        self._endpoint = endpoint
+        self._socket: socket.socket | None = None
+        if endpoint is not None:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._next_export = time.monotonic() + interval
+
+    @classmethod
+    def from_target(cls, target: str, interval: float = 5.0) -> MetricsExporter:
+        """Creates an exporter from a file path or a udp://host:port endpoint."""
+        if target.startswith("udp://"):
+            host, _, port = target.removeprefix("udp://").rpartition(":")
+            return cls(endpoint=(host or "127.0.0.1", int(port)), interval=interval)
+        return cls(path=target, interval=interval)
+
+    def due(self) -> bool:
+        return time.monotonic() >= self._next_export
+
+    def export(self, snapshot: dict):
+        self._next_export = time.monotonic() + self.interval
+        data = json.dumps(snapshot, separators=(",", ":")).encode("utf-8")
+        if self._file is not None:
+            self._file.write(data + b"\n")
+            self._file.flush()
+        if self._socket is not None and self._endpoint is not None:
+            try:
+                self._socket.sendto(data, self._endpoint)
+            except OSError:
+                # Nobody listening, or the snapshot exceeds a datagram.
+                pass
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
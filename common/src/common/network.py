@@ -2,16 +2,26 @@ from __future__ import annotations
 
 import asyncio
 import hashlib
+import struct
+import time
 import traceback
 from abc import ABC, ABCMeta, abstractmethod
 from collections import defaultdict
+from dataclasses import dataclass
 from enum import Enum
 from sys import stderr
-from typing import Any, Callable, Collection, cast
+from typing import TYPE_CHECKING, Any, Callable, ClassVar, Collection, cast
 
 import enet
 
-from common.binary import ByteReader, ByteWriter
+from common.binary import Buffer, ByteReader, ByteWriter
+from common.compression import COMPRESSED_FRAME, FrameCompressor
+from common.net_metrics import OUTBOUND, MetricsExporter, NetworkMetrics, PeerLinkStats
+from common.schema import Fields, compile_schema
+
+if TYPE_CHECKING:
+    from common.capture import PacketCapture
+    from common.net_io import NetIOThread
 
 
 class DeliveryMode(Enum):
@@ -50,6 +60,39 @@ class DeliveryMode(Enum):
 
 
 class PacketMeta(ABCMeta):
+    """
+    Registers concrete packet types and compiles declared packet fields.
+
+    A packet class may declare its fields with a `fields` dict mapping attribute
+    names to common.schema field types. Fields are appended to the ones declared
+    by its base packet, and on_write/on_read are generated from the result.
+    Packets can still implement on_write/on_read by hand instead.
+    """
+
+    def __new__(mcls, name, bases, namespace, **kwargs):
+        fields = namespace.get("fields")
+
+        if fields is not None:
+            if "on_write" in namespace or "on_read" in namespace:
+                raise TypeError(
+                    f"{name} must either declare fields or implement on_write/on_read."
+                )
+
+            base = next(b for b in bases if isinstance(b, PacketMeta))
+            inherited = getattr(base, "_schema_fields")
+            if inherited is None:
+                raise TypeError(
+                    f"{name} declares fields but {base.__name__} has a hand-written codec."
+                )
+
+            schema_fields = {**inherited, **fields}
+            namespace["_schema_fields"] = schema_fields
+            namespace["on_write"], namespace["on_read"] = compile_schema(schema_fields)
+        elif "on_write" in namespace or "on_read" in namespace:
+            namespace.setdefault("_schema_fields", None)
+
+        return super().__new__(mcls, name, bases, namespace, **kwargs)
+
     def __init__(cls, name, bases, namespace):
         super().__init__(name, bases, namespace)
 
@@ -63,6 +106,7 @@ class PacketMeta(ABCMeta):
 _packet_types: list[type[Packet]] = []
 _packet_ids: dict[type[Packet], int] = {}
 _protocol_checksum: int = 0
+_frame_compressor = FrameCompressor()
 
 
 def register_packets(packets_to_register: list[type[Packet]]):
@@ -70,32 +114,54 @@ def register_packets(packets_to_register: list[type[Packet]]):
 
     _packet_types += packets_to_register  # type: ignore[type-abstract]
     _packet_types = list(set(_packet_types))
+    if len(_packet_types) > COMPRESSED_FRAME:
+        raise TypeError(f"Cannot register more than {COMPRESSED_FRAME} packet types.")
     _packet_types.sort(key=lambda c: f"{c.__module__}.{c.__name__}")
     _packet_ids = {}
 
-    m = hashlib.sha256()
-
     for i, c in enumerate(_packet_types):
         _packet_ids[c] = i
-        m.update(f"#{i}-{c.__module__}.{c.__name__}".encode("utf-8"))
 
-    _packet_checksum = int(m.hexdigest()[:8], 16)
+    _update_protocol_checksum()
 
     print(
-        f"New packet types added to registry (current checksum: {hex(_packet_checksum)}): {[f"{p.__module__}.{p.__name__}" for p in packets_to_register]}"
+        f"New packet types added to registry (current checksum: {hex(_protocol_checksum)}): {[f"{p.__module__}.{p.__name__}" for p in packets_to_register]}"
     )
 
 
+def set_compression_dictionary(dictionary: bytes | None):
+    """
+    Sets the preset dictionary reliable frames are compressed with. Both ends must
+    use the same one, so it is part of the protocol checksum.
+    """
+    global _frame_compressor
+
+    _frame_compressor = FrameCompressor(dictionary, _frame_compressor.threshold)
+    _update_protocol_checksum()
+
+
+def _update_protocol_checksum():
+    global _protocol_checksum
+
+    m = hashlib.sha256()
+    for i, c in enumerate(_packet_types):
+        m.update(f"#{i}-{c.__module__}.{c.__name__}".encode("utf-8"))
+    m.update(_frame_compressor.digest)
+
+    _protocol_checksum = int(m.hexdigest()[:8], 16)
+
+
 def get_protocol_checksum():
     return _protocol_checksum
 
 
 class Packet(ABC, metaclass=PacketMeta):
-    @abstractmethod
+    fields: ClassVar[Fields]
+    _schema_fields: ClassVar[Fields | None] = {}
+
     def on_write(self, writer: ByteWriter):
         pass
 
-    @abstractmethod
     def on_read(self, reader: ByteReader):
         pass
 
@@ -107,13 +173,18 @@ class Packet(ABC, metaclass=PacketMeta):
     @classmethod
     def decode(cls, reader: ByteReader):
         global _packet_types
+        start = reader.offset
         packet_id = reader.read_uint8()
-        if packet_id > len(_packet_types) or packet_id < 0:
+        if packet_id >= len(_packet_types):
             return NullPacket()
 
         packet_type = _packet_types[packet_id]
         packet = packet_type.__new__(packet_type)
         packet.on_read(reader)
+
+        observer = reader.decode_observer
+        if observer is not None:
+            observer(packet, reader.offset - start)
         return packet
 
     def encode(self, writer: ByteWriter):
@@ -126,12 +197,41 @@ class Packet(ABC, metaclass=PacketMeta):
         return f"{type(self).__name__}: {self.__dict__}"
 
 
-class NullPacket(Packet):
-    def on_write(self, writer: ByteWriter):
-        pass
+def encode_packet(packet: Packet, metrics: NetworkMetrics | None = None) -> bytes:
+    """Encodes packet, timing the encoding into metrics when given."""
+    writer = ByteWriter()
+    if metrics is None:
+        packet.encode(writer)
+        return writer.data
 
-    def on_read(self, reader: ByteReader):
-        pass
+    start = time.perf_counter_ns()
+    packet.encode(writer)
+    metrics.encode_ns.add(time.perf_counter_ns() - start)
+    return writer.data
+
+
+def decode_packet(data: Buffer, metrics: NetworkMetrics | None = None) -> Packet:
+    """
+    Decodes a received frame, decompressing it first if needed. When metrics are
+    given, the decoding is timed and every packet of the frame is recorded as inbound
+    traffic.
+    """
+    if data and data[0] == COMPRESSED_FRAME:
+        data = _frame_compressor.decompress(data)
+
+    reader = ByteReader(data)
+    if metrics is None:
+        return Packet.decode(reader)
+
+    reader.decode_observer = metrics.record_received
+    start = time.perf_counter_ns()
+    packet = Packet.decode(reader)
+    metrics.decode_ns.add(time.perf_counter_ns() - start)
+    return packet
+
+
+class NullPacket(Packet):
+    fields = {}
 
     @property
     def delivery_mode(self):
@@ -146,12 +246,12 @@ class MultiPacket(Packet):
         self._delivery_mode: DeliveryMode | None = delivery_mode
 
     def on_write(self, writer: ByteWriter):
-        writer.write_uint8(len(self.packets))
+        writer.write_uint16(len(self.packets))
         for p in self.packets:
             p.encode(writer)
 
     def on_read(self, reader: ByteReader):
-        n = reader.read_uint8()
+        n = reader.read_uint16()
         self.packets = [Packet.decode(reader) for _ in range(n)]
 
     @property
@@ -169,35 +269,157 @@ class MultiPacket(Packet):
         return f"MultiPacket: {[str(p) for p in self.packets]}"
 
 
+# Rough per-packet cost of an ENet send command (command header, sequencing and
+# length fields), used to estimate how much coalescing saves.
+_ENET_COMMAND_OVERHEAD = 8
+
+# Room left in a datagram for ENet's protocol and command headers.
+_ENET_HEADER_ALLOWANCE = 48
+
+_MULTI_PACKET_HEADER = struct.Struct("<BH")
+
+# Queues are flushed in this order, so that spawns and other reliable state
+# are handed to ENet before the unreliable updates that depend on them.
+_FLUSH_ORDER = (
+    DeliveryMode.RELIABLE_ORDERED,
+    DeliveryMode.RELIABLE,
+    DeliveryMode.UNRELIABLE,
+)
+
+
+@dataclass
+class OutboundStats:
+    """Counters for queued packets and the frames they were coalesced into."""
+
+    packets: int = 0
+    frames: int = 0
+    bytes_sent: int = 0
+    bytes_saved: int = 0
+    frames_compressed: int = 0
+    bytes_compressed: int = 0
+    """Bytes saved by compressing frames."""
+
+
+def coalesce_payloads(payloads: list[bytes], max_frame_size: int):
+    """
+    Merges encoded packets into MultiPacket frames of at most max_frame_size
+    bytes. Yields (frame, packet_count) tuples. Packets that do not fit in a
+    frame on their own are yielded unchanged.
+    """
+    multi_packet_id = _packet_ids[MultiPacket]
+    budget = max_frame_size - _MULTI_PACKET_HEADER.size
+    chunk: list[bytes] = []
+    size = 0
+
+    for payload in payloads:
+        if chunk and (size + len(payload) > budget or len(chunk) == 0xFFFF):
+            yield _build_frame(multi_packet_id, chunk), len(chunk)
+            chunk = []
+            size = 0
+        chunk.append(payload)
+        size += len(payload)
+
+    if chunk:
+        yield _build_frame(multi_packet_id, chunk), len(chunk)
+
+
+def _build_frame(multi_packet_id: int, chunk: list[bytes]):
+    if len(chunk) == 1:
+        return chunk[0]
+    return b"".join([_MULTI_PACKET_HEADER.pack(multi_packet_id, len(chunk)), *chunk])
+
+
 class NetPeer:
-    def __init__(self, enet_peer):
+    def __init__(self, enet_peer, io: NetIOThread | None = None):
         self._enet_peer = enet_peer
+        # When set, the enet peer is owned by a network I/O thread and must only
+        # be used through it.
+        self._io = io
         self._host = self._enet_peer.address.host
         self._port = self._enet_peer.address.port
         self._packet_futures: defaultdict[type, list[asyncio.Future]] = defaultdict(
             list
         )
+        self._outbound: dict[DeliveryMode, list[bytes]] = {
+            mode: [] for mode in DeliveryMode
+        }
+        self.max_frame_size = getattr(enet_peer, "mtu", 1400) - _ENET_HEADER_ALLOWANCE
+        self._capture: PacketCapture | None = None
+        self._metrics: NetworkMetrics | None = None
 
     def send_raw(self, data: bytes, mode: DeliveryMode):
         channel, flags = mode.to_enet()
+        if self._io is not None:
+            self._io.send(self._enet_peer, channel, data, flags)
+            return
         packet = enet.Packet(data, flags)
         self._enet_peer.send(channel, packet)
 
+    def queue_raw(self, data: bytes, mode: DeliveryMode):
+        """Queues an encoded packet to be sent on the next flush."""
+        self._outbound[mode].append(data)
+        if self._metrics is not None:
+            self._metrics.record(_packet_types[data[0]], OUTBOUND, mode, len(data))
+        if self._capture is not None:
+            self._capture.record_outbound(self.address, mode, data)
+
     def send(self, packet: Packet, override_mode: DeliveryMode | None = None):
         if packet.delivery_mode != DeliveryMode.UNRELIABLE:
             print(f"Sending {packet} to {self.address}")
-        writer = ByteWriter()
-        packet.encode(writer)
         mode = override_mode or packet.delivery_mode
-        self.send_raw(writer.data, mode)
+        self.queue_raw(encode_packet(packet, self._metrics), mode)
 
-    def disconnect(self):
-        self._enet_peer.disconnect()
+    def flush(self, stats: OutboundStats | None = None):
+        """
+        Coalesces and sends every queued packet, one queue per delivery mode. Large
+        reliable frames are compressed.
+        """
+        compressor = _frame_compressor
+        for mode in _FLUSH_ORDER:
+            queue = self._outbound[mode]
+            if not queue:
+                continue
+
+            compress = mode is not DeliveryMode.UNRELIABLE
+            for frame, count in coalesce_payloads(queue, self.max_frame_size):
+                if compress and len(frame) >= compressor.threshold:
+                    compressed = compressor.compress(frame)
+                    if compressed is not None:
+                        if stats is not None:
+                            stats.frames_compressed += 1
+                            stats.bytes_compressed += len(frame) - len(compressed)
+                        frame = compressed
+
+                self.send_raw(frame, mode)
+                if stats is not None:
+                    stats.packets += count
+                    stats.frames += 1
+                    stats.bytes_sent += len(frame)
+                    if count > 1:
+                        stats.bytes_saved += (
+                            count - 1
+                        ) * _ENET_COMMAND_OVERHEAD - _MULTI_PACKET_HEADER.size
+
+            queue.clear()
+
+    def disconnect(self, data: int = 0):
+        """Disconnects the peer. data is handed over to it with the disconnection."""
+        if self._io is not None:
+            self._io.disconnect_peer(self._enet_peer, data)
+            return
+        self._enet_peer.disconnect(data)
 
     @property
     def address(self) -> tuple[str, int]:
         return (self._host, self._port)
 
+    def link_stats(self) -> PeerLinkStats | None:
+        """Round trip time, loss and throttle as measured by ENet, when available."""
+        try:
+            return PeerLinkStats.from_enet(self._enet_peer)
+        except AttributeError:
+            return None
+
     async def expect[T](self, packet_type: type[T]) -> T:
         loop = asyncio.get_event_loop()
         future: asyncio.Future[T] = loop.create_future()
@@ -245,8 +467,71 @@ class Network(ABC):
         self._packet_listeners: defaultdict[
             type, list[Callable[[Packet, NetPeer], Any]]
         ] = defaultdict(list)
+        # Listeners of each received packet type and of its base packet types,
+        # base types first. Rebuilt lazily whenever listeners change.
+        self._dispatch_tables: dict[
+            type, tuple[Callable[[Packet, NetPeer], Any], ...]
+        ] = {}
         self._connect_listeners: list[Callable[[NetPeer], Any]] = []
         self._disconnect_listeners: list[Callable[[NetPeer], Any]] = []
+        self.outbound_stats = OutboundStats()
+        self._capture: PacketCapture | None = None
+        self.metrics = NetworkMetrics()
+        self._metrics_exporter: MetricsExporter | None = None
+
+    @property
+    def capture(self):
+        return self._capture
+
+    def start_capture(self, capture: PacketCapture):
+        """Records the traffic of every current and future peer into capture."""
+        self._capture = capture
+        for peer in self.connected_peers:
+            capture.record_connect(peer.address)
+            peer._capture = capture
+
+    def stop_capture(self):
+        if self._capture is None:
+            return
+        for peer in self.connected_peers:
+            peer._capture = None
+        self._capture.close()
+        self._capture = None
+
+    def add_peer(self, peer: NetPeer):
+        """Attaches the capture and metrics of this network to a new peer."""
+        peer._metrics = self.metrics
+        if self._capture is not None:
+            self._capture.record_connect(peer.address)
+            peer._capture = self._capture
+
+    def metrics_snapshot(self) -> dict:
+        """Snapshot of the traffic metrics, with the link stats of every peer."""
+        peers = {}
+        for peer in self.connected_peers:
+            stats = peer.link_stats()
+            if stats is not None:
+                peers[f"{peer.address[0]}:{peer.address[1]}"] = stats
+
+        snapshot = self.metrics.snapshot(peers)
+        snapshot["frames"] = vars(self.outbound_stats).copy()
+        return snapshot
+
+    def start_metrics_export(self, exporter: MetricsExporter):
+        """Exports a metrics snapshot every exporter.interval seconds, on flush."""
+        self._metrics_exporter = exporter
+
+    def stop_metrics_export(self):
+        if self._metrics_exporter is None:
+            return
+        self._metrics_exporter.export(self.metrics_snapshot())
+        self._metrics_exporter.close()
+        self._metrics_exporter = None
+
+    def _export_metrics(self):
+        exporter = self._metrics_exporter
+        if exporter is not None and exporter.due():
+            exporter.export(self.metrics_snapshot())
 
     @abstractmethod
     def is_server(self) -> bool:
@@ -284,6 +569,20 @@ class Network(ABC):
         """
         pass
 
+    def flush(self):
+        """
+        Sends every packet queued since the last flush. Called once per game iteration,
+        after the simulation has ticked.
+        """
+        pass
+
+    async def wait(self, timeout: float):
+        """
+        Sleeps for timeout seconds, or until network events may be waiting for the
+        next poll, whichever comes first.
+        """
+        await asyncio.sleep(timeout)
+
     @property
     @abstractmethod
     def connected_peers(self) -> Collection[NetPeer]:
@@ -297,62 +596,64 @@ class Network(ABC):
         for d in self._disconnect_listeners:
             d(disconnected_peer)
 
-    def notify(
-        self,
-        packet: Packet,
-        source_peer: NetPeer,
-        packet_type: type[Packet] | None = None,
-    ):
+    def notify(self, packet: Packet, source_peer: NetPeer):
         """
         Should only be called from a class that implements Network when a packet is received.
-        Notifies listeners of the received packet.
+        Notifies listeners of the received packet, and of every packet it contains.
         """
-        assert packet_type is None or isinstance(packet, packet_type)
-        packet_type = packet_type if packet_type is not None else type(packet)
-
-        if packet_type == Packet:
-            return
+        packet_type = type(packet)
 
         if packet.delivery_mode != DeliveryMode.UNRELIABLE:
             print(f"Received {packet}")
 
-        if packet_type == MultiPacket:
+        if packet_type is MultiPacket:
             for sub_packet in cast(MultiPacket, packet).packets:
                 self.notify(sub_packet, source_peer)
         else:
-            for p in packet_type.__bases__:
-                if not issubclass(p, Packet) and p != Packet:
-                    continue
-
-                self.notify(packet, source_peer, p)
+            listeners = self._dispatch_tables.get(packet_type)
+            if listeners is None:
+                listeners = self._build_dispatch_table(packet_type)
 
-        listeners = self._packet_listeners[packet_type]
-        for l in listeners:
-            try:
-                if packet_type != MultiPacket:
+            for l in listeners:
+                try:
                     res = l(packet, source_peer)
 
                     if asyncio.iscoroutine(res):
                         asyncio.create_task(res)
-            except Exception as e:
-                error_stack_trace = traceback.format_exc()
-                print(
-                    f"Error during processing of packet of type {type(packet)}: {error_stack_trace}",
-                    file=stderr,
-                )
+                except Exception as e:
+                    error_stack_trace = traceback.format_exc()
+                    print(
+                        f"Error during processing of packet of type {packet_type}: {error_stack_trace}",
+                        file=stderr,
+                    )
+
+        if not source_peer._packet_futures:
+            return
+
         try:
             source_peer._resolve_packet_futures(packet)
         except Exception as e:
             error_stack_trace = traceback.format_exc()
             print(
-                f"Error during processing of packet of type {type(packet)}: {error_stack_trace}",
+                f"Error during processing of packet of type {packet_type}: {error_stack_trace}",
                 file=stderr,
             )
 
+    def _build_dispatch_table(self, packet_type: type[Packet]):
+        listeners = tuple(
+            l
+            for t in reversed(packet_type.__mro__)
+            if t is not Packet and issubclass(t, Packet)
+            for l in self._packet_listeners.get(t, ())
+        )
+        self._dispatch_tables[packet_type] = listeners
+        return listeners
+
     def listen[T: Packet](self, t: type[T], listener: Callable[[T, NetPeer], Any]):
         print(f"Added listener for {t}")
         listener = cast(Callable[[Packet, NetPeer], Any], listener)
         self._packet_listeners[t].append(listener)
+        self._dispatch_tables.clear()
         return listener
 
     def unlisten[T: Packet](self, t: type[T], listener: Callable[[T, NetPeer], Any]):
@@ -360,6 +661,7 @@ class Network(ABC):
         l.remove(cast(Callable[[Packet, NetPeer], Any], listener))
         if len(l) == 0:
             self._packet_listeners.pop(t)
+        self._dispatch_tables.clear()
 
     def listen_connected(self, listener: Callable[[NetPeer], Any]):
         self._connect_listeners.append(listener)
@@ -471,6 +773,25 @@ class Network(ABC):
         return results
 
 
+class NullAddress:
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+
+
+class NullEnetPeer:
+    """Stands in for an ENet peer, discarding whatever is sent to it."""
+
+    def __init__(self, host: str, port: int):
+        self.address = NullAddress(host, port)
+
+    def send(self, channel, packet):
+        pass
+
+    def disconnect(self, data=0):
+        pass
+
+
 class NullNetwork(Network):
     def disconnect(self):
         pass
@@ -26,6 +26,8 @@ class Node(Serializable):
         self._game = game
         self.add_behaviour(Transform)
         self.skip_serialization = False
+        if game is not None:
+            self.transform._update_storage()
 
     @property
     def game(self) -> Game | None:
@@ -46,6 +48,8 @@ class Node(Serializable):
         for b in self._behaviours:
             b.visible = b.visible
             b.receive_updates = b.receive_updates
+        if self._parent is None:
+            self.transform._update_storage()
 
     @property
     def parent(self):
@@ -57,13 +61,14 @@ class Node(Serializable):
             self._parent._children.remove(self)
 
         self._parent = parent
-
-        if parent is None:
-            return
-
-        parent._children.append(self)
-        if self._game != parent.game and parent.game is not None:
-            self.bind_to_game(parent.game)
+        if parent is not None:
+            parent._children.append(self)
+            if self._game != parent.game and parent.game is not None:
+                self.bind_to_game(parent.game)
+
+        transform = self.transform
+        transform._update_storage()
+        transform._invalidate()
 
     def add_child(self, child: Self | None = None):
         if child is None:
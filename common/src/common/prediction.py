@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+from collections import deque
+from typing import Any, Callable
+
+from common.primitives import Vector2
+
+# Predicted ticks kept per entity. At usual tick rates, this covers a few seconds,
+# much more than the round trip to the server.
+PREDICTION_HISTORY = 64
+
+
+class PredictionHandler:
+    """
+    Behaviours of networked entities can implement this to predict their entity on
+    the client that controls it. The transforms the server sends for the entity are
+    then handed to them rather than interpolated.
+    """
+
+    def is_predicted(self) -> bool:
+        return False
+
+    def on_authoritative_transform(
+        self, tick_id: int, position: Vector2 | None, rotation: float | None
+    ) -> Any:
+        pass
+
+
+class Prediction[S, I]:
+    """
+    Runs an entity ahead of the server, one step per tick, and remembers the input
+    and the resulting state of every step. When the server disagrees with the state
+    predicted for a tick, the entity is rewound to the state of the server, and the
+    inputs given since are replayed.
+    """
+
+    def __init__(
+        self,
+        state: S,
+        step: Callable[[S, I | None], S],
+        size: int = PREDICTION_HISTORY,
+    ):
+        self.state = state
+        self._step = step
+        self._history: deque[tuple[int, I | None, S]] = deque(maxlen=size)
+        # Newest tick the state of the server was received for.
+        self.confirmed_tick = -1
+        # Times the entity was rewound, for stats.
+        self.replays = 0
+        # Tick epoch of the simulation the history was predicted in.
+        self.tick_epoch = 0
+
+    def __len__(self):
+        return len(self._history)
+
+    @property
+    def newest_tick(self) -> int | None:
+        return self._history[-1][0] if self._history else None
+
+    def predict(self, tick_id: int, input: I | None = None, tick_epoch: int = 0) -> S:
+        """
+        Steps the entity for tick_id, given the input of the player for it. When the
+        simulation realigned its ticks since the last step, as told by tick_epoch,
+        the history is dropped first: it was predicted for tick ids that no longer
+        match those of the server.
+        """
+        if tick_epoch != self.tick_epoch:
+            self.reset(self.state)
+            self.tick_epoch = tick_epoch
+        self.state = self._step(self.state, input)
+        self._history.append((tick_id, input, self.state))
+        return self.state
+
+    def state_at(self, tick_id: int) -> S | None:
+        """Returns the state predicted for tick_id, if still remembered."""
+        for t, _, state in reversed(self._history):
+            if t == tick_id:
+                return state
+            if t < tick_id:
+                break
+        return None
+
+    def confirm(self, tick_id: int):
+        """Forgets the ticks up to tick_id, which the server agreed with."""
+        self.confirmed_tick = max(self.confirmed_tick, tick_id)
+        history = self._history
+        while history and history[0][0] <= tick_id:
+            history.popleft()
+
+    def reconcile(self, tick_id: int, state: S) -> S:
+        """
+        Rewinds the entity to the state the server had at tick_id, and replays the
+        inputs of the ticks after it. Returns the new predicted state.
+        """
+        self.confirm(tick_id)
+        history = self._history
+        for i, (t, input, _) in enumerate(history):
+            state = self._step(state, input)
+            history[i] = (t, input, state)
+        self.state = state
+        self.replays += 1
+        return state
+
+    def reset(self, state: S):
+        """Drops the history, and predicts on from state."""
+        self._history.clear()
+        self.confirmed_tick = -1
+        self.state = state
@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import importlib
+import time
+from dataclasses import dataclass
+from sys import stderr
+from typing import Collection, Iterable
+
+from common.capture import (
+    CONNECT,
+    DISCONNECT,
+    INBOUND,
+    SERVER,
+    CaptureHeader,
+    CaptureRecord,
+    read_capture,
+)
+from common.clock import VirtualClock
+from common.compression import load_dictionary
+from common.network import (
+    DeliveryMode,
+    NetPeer,
+    Network,
+    NullEnetPeer,
+    Packet,
+    decode_packet,
+    encode_packet,
+    get_protocol_checksum,
+    set_compression_dictionary,
+)
+
+
+class ReplayNetwork(Network):
+    """
+    Fake network that feeds the inbound traffic of a capture back into a game. Each
+    poll delivers every record of the next captured tick, so iterating a game as fast
+    as possible replays the capture in the same order every time. Outbound packets
+    are encoded and flushed as usual, then discarded.
+    """
+
+    def __init__(self, header: CaptureHeader, records: Iterable[CaptureRecord]):
+        super().__init__()
+        self._server = header.side == SERVER
+        self._records = [r for r in records if r.kind in (INBOUND, CONNECT, DISCONNECT)]
+        self._next_record = 0
+        self._peers: dict[tuple[str, int], NetPeer] = {}
+        self.packets_replayed = 0
+        self.bytes_replayed = 0
+
+    @property
+    def finished(self):
+        return self._next_record >= len(self._records)
+
+    def is_server(self) -> bool:
+        return self._server
+
+    def is_client(self) -> bool:
+        return not self._server
+
+    def publish(
+        self,
+        packet: Packet,
+        override_delivery_mode: DeliveryMode | None = None,
+        exclude_peers: list[NetPeer] | None = None,
+    ):
+        mode = override_delivery_mode or packet.delivery_mode
+        data = encode_packet(packet, self.metrics)
+
+        for net_peer in self._peers.values():
+            if exclude_peers is not None and net_peer in exclude_peers:
+                continue
+            net_peer.queue_raw(data, mode)
+
+    def flush(self):
+        for net_peer in self._peers.values():
+            net_peer.flush(self.outbound_stats)
+        self._export_metrics()
+
+    def poll(self):
+        records = self._records
+        if self.finished:
+            return
+
+        tick_id = records[self._next_record].tick_id
+        while not self.finished and records[self._next_record].tick_id == tick_id:
+            record = records[self._next_record]
+            self._next_record += 1
+            self._replay(record)
+
+    def _replay(self, record: CaptureRecord):
+        if record.kind == CONNECT:
+            net_peer = NetPeer(NullEnetPeer(*record.peer))
+            self._peers[record.peer] = net_peer
+            self.add_peer(net_peer)
+            if self._server:
+                self.notify_connection(net_peer)
+
+        elif record.kind == INBOUND:
+            found_peer = self._peers.get(record.peer)
+            if found_peer is None:
+                return
+            self.packets_replayed += 1
+            self.bytes_replayed += len(record.payload)
+            self.notify(decode_packet(record.payload, self.metrics), found_peer)
+
+        elif record.kind == DISCONNECT:
+            disconnected = self._peers.pop(record.peer, None)
+            if disconnected is not None and self._server:
+                self.notify_disconnection(disconnected)
+
+    def disconnect(self):
+        self._peers = {}
+
+    @property
+    def connected_peers(self) -> Collection[NetPeer]:
+        return self._peers.values()
+
+
+@dataclass
+class ReplayStats:
+    iterations: int
+    packets: int
+    bytes: int
+    elapsed: float
+
+    @property
+    def packets_per_second(self):
+        return self.packets / self.elapsed if self.elapsed > 0 else 0.0
+
+
+async def replay(
+    game, network: ReplayNetwork, clock: VirtualClock | None = None
+) -> ReplayStats:
+    """
+    Iterates game until every record of the capture has been replayed. With the
+    virtual clock of the game's simulation, the clock jumps to the next tick after
+    every iteration, so that each captured tick is replayed on its own tick.
+    """
+    iterations = 0
+    start = time.perf_counter()
+    while not network.finished:
+        await game.iterate()
+        iterations += 1
+        if clock is not None:
+            clock.advance(game.simulation.time_until_next_tick())
+    elapsed = time.perf_counter() - start
+
+    return ReplayStats(
+        iterations, network.packets_replayed, network.bytes_replayed, elapsed
+    )
+
+
+async def _main(args):
+    import pygame as pg
+
+    from common.assets import load_node_asset
+    from common.game import Game
+    from common.simulation import Simulation
+
+    for module in args.imports:
+        importlib.import_module(module)
+    set_compression_dictionary(load_dictionary(args.dictionary))
+
+    header, records = read_capture(args.capture)
+    if header.protocol_checksum != get_protocol_checksum():
+        print(
+            f"Capture protocol checksum {hex(header.protocol_checksum)} does not match "
+            f"{hex(get_protocol_checksum())}, packets may not decode.",
+            file=stderr,
+        )
+
+    if header.side != SERVER:
+        # Client scenes load fonts and images.
+        pg.init()
+    network = ReplayNetwork(header, records)
+    clock = None if args.realtime else VirtualClock()
+    game = Game(
+        network=network,
+        simulation=Simulation(clock=clock),
+        scene=load_node_asset(args.scene),
+    )
+    stats = await replay(game, network, clock)
+    game.cleanup()
+
+    print(
+        f"Replayed {stats.packets} packets ({stats.bytes} bytes) in "
+        f"{stats.iterations} iterations, {stats.elapsed:.3f}s: "
+        f"{stats.packets_per_second:.0f} packets/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replays a packet capture into a headless game."
+    )
+    parser.add_argument("capture", help="Path to the capture file.")
+    parser.add_argument("scene", help="Scene asset the captured game started from.")
+    parser.add_argument(
+        "--import",
+        dest="imports",
+        action="append",
+        default=["game.packets"],
+        help="Module to import before replaying, to register its packets.",
+    )
+    parser.add_argument(
+        "--dictionary",
+        help="Compression dictionary of the captured game, defaults to the asset one.",
+    )
+    parser.add_argument(
+        "--realtime",
+        action="store_true",
+        help="Tick on the system clock instead of as fast as possible.",
+    )
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
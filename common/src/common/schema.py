@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import struct
+from operator import attrgetter
+from typing import Any, Callable, cast
+
+from common.binary import ByteReader, ByteWriter
+from common.primitives import Vector2
+
+
+class FieldType:
+    """
+    Encoding of a single packet field. Fixed-size types are described by a struct
+    format and get packed together with every other fixed-size field of a packet.
+    Variable-size types provide their own write/read functions.
+    """
+
+    def __init__(
+        self,
+        fmt: str | None = None,
+        flatten: Callable[[Any], tuple] | None = None,
+        build: Callable[..., Any] | None = None,
+        write: Callable[[ByteWriter, Any], Any] | None = None,
+        read: Callable[[ByteReader], Any] | None = None,
+    ):
+        self.fmt = fmt
+        self.flatten = flatten
+        self.build = build
+        self.struct = struct.Struct(f"<{fmt}") if fmt is not None else None
+
+        if write is None or read is None:
+            assert self.struct is not None
+            s = self.struct
+            if flatten is None:
+                write = lambda w, v: w.write_struct(s, v)
+                read = lambda r: r.read_struct(s)[0]
+            else:
+                assert build is not None
+                write = lambda w, v: w.write_struct(s, *flatten(v))
+                read = lambda r: build(*r.read_struct(s))
+
+        self.write = write
+        self.read = read
+
+    @property
+    def fixed_size(self):
+        return self.struct is not None
+
+
+class OptionalFieldType(FieldType):
+    """A field that may be None. Presence is stored as a bit in the packet prefix."""
+
+    def __init__(self, inner: FieldType):
+        super().__init__(write=inner.write, read=inner.read)
+        self.inner = inner
+
+
+class BitFieldType(FieldType):
+    """A boolean field, packed as a single bit in the packet prefix."""
+
+    def __init__(self):
+        super().__init__(
+            write=lambda w, v: w.write_bool(v),
+            read=lambda r: r.read_bool(),
+        )
+
+
+def optional(t: FieldType) -> OptionalFieldType:
+    return OptionalFieldType(t)
+
+
+def quantized(precision: float) -> FieldType:
+    """A float sent as a varint multiple of precision."""
+    return FieldType(
+        write=lambda w, v: w.write_quantized(v, precision),
+        read=lambda r: r.read_quantized(precision),
+    )
+
+
+def angle(steps: int = 256) -> FieldType:
+    """
+    An angle in degrees, sent as one of steps fractions of a turn. Decoded angles
+    are in the [0, 360) range.
+    """
+    if steps > 65536:
+        raise ValueError("Angles cannot be quantized in more than 65536 steps.")
+    return FieldType(
+        "B" if steps <= 256 else "H",
+        flatten=lambda v: (round(v * steps / 360) % steps,),
+        build=lambda i: i * 360 / steps,
+    )
+
+
+INT8 = FieldType("b")
+INT16 = FieldType("h")
+INT32 = FieldType("i")
+INT64 = FieldType("q")
+UINT8 = FieldType("B")
+UINT16 = FieldType("H")
+UINT32 = FieldType("I")
+UINT64 = FieldType("Q")
+FLOAT32 = FieldType("f")
+FLOAT64 = FieldType("d")
+BOOL = BitFieldType()
+# Unbound methods rather than lambdas, to save a call per field.
+VARUINT = FieldType(write=ByteWriter.write_varuint, read=ByteReader.read_varuint)
+VARINT = FieldType(write=ByteWriter.write_varint, read=ByteReader.read_varint)
+STR = FieldType(write=ByteWriter.write_str, read=ByteReader.read_str)
+VECTOR2 = FieldType("ff", flatten=lambda v: (v.x, v.y), build=Vector2)
+
+
+Fields = dict[str, FieldType]
+
+
+def _flags_format(n: int):
+    if n == 0:
+        return ""
+    if n <= 8:
+        return "B"
+    if n <= 16:
+        return "H"
+    if n <= 32:
+        return "I"
+    if n <= 64:
+        return "Q"
+    raise TypeError("Packets cannot declare more than 64 optional and bool fields.")
+
+
+def compile_schema(
+    fields: Fields,
+) -> tuple[Callable[[Any, ByteWriter], None], Callable[[Any, ByteReader], None]]:
+    """
+    Compiles a field declaration into an (on_write, on_read) pair.
+
+    Every fixed-size field, plus a bitmask with the presence of optional fields
+    followed by the value of bool fields, is packed by one precompiled struct.
+    Variable-size fields and present optional values follow, in declaration order.
+    """
+    fixed = [(n, t) for n, t in fields.items() if t.fixed_size]
+    variable = [
+        (n, t)
+        for n, t in fields.items()
+        if not t.fixed_size and not isinstance(t, (OptionalFieldType, BitFieldType))
+    ]
+    optionals = [(n, t) for n, t in fields.items() if isinstance(t, OptionalFieldType)]
+    bits = tuple(n for n, t in fields.items() if isinstance(t, BitFieldType))
+
+    flags_fmt = _flags_format(len(optionals) + len(bits))
+    fixed_fmts = [cast(str, t.fmt) for _, t in fixed]
+    prefix = struct.Struct("<" + flags_fmt + "".join(fixed_fmts))
+    has_flags = flags_fmt != ""
+    has_presence = len(optionals) > 0
+    bits_offset = len(optionals)
+    get_bits = tuple(attrgetter(n) for n in bits)
+    fixed_names = tuple(n for n, _ in fixed)
+    flatteners = tuple(t.flatten for _, t in fixed)
+    composite = any(f is not None for f in flatteners)
+    builders = tuple((t.build, len(fmt)) for (_, t), fmt in zip(fixed, fixed_fmts))
+
+    get_fixed: Callable[[Any], tuple]
+    if len(fixed_names) == 0:
+        get_fixed = lambda _: ()
+    elif len(fixed_names) == 1:
+        getter = attrgetter(fixed_names[0])
+        get_fixed = lambda p: (getter(p),)
+    else:
+        get_fixed = attrgetter(*fixed_names)
+
+    variable_writers = tuple((attrgetter(n), t.write) for n, t in variable)
+    variable_readers = tuple((n, t.read) for n, t in variable)
+    optional_writers = tuple((attrgetter(n), t.write) for n, t in optionals)
+    optional_readers = tuple((n, t.read) for n, t in optionals)
+
+    def flatten_values(values: tuple) -> list:
+        flat: list = []
+        for v, flatten in zip(values, flatteners):
+            if flatten is None:
+                flat.append(v)
+            else:
+                flat.extend(flatten(v))
+        return flat
+
+    def build_values(values: tuple) -> list:
+        built = []
+        i = 0
+        for build, n in builders:
+            if build is None:
+                built.append(values[i])
+            else:
+                built.append(build(*values[i : i + n]))
+            i += n
+        return built
+
+    def on_write(self, writer: ByteWriter):
+        values = get_fixed(self)
+        if composite:
+            values = tuple(flatten_values(values))
+
+        if has_flags:
+            mask = 0
+            if has_presence:
+                optional_values = [get(self) for get, _ in optional_writers]
+                for i, v in enumerate(optional_values):
+                    if v is not None:
+                        mask |= 1 << i
+            for i, get in enumerate(get_bits, bits_offset):
+                if get(self):
+                    mask |= 1 << i
+            writer.write_struct(prefix, mask, *values)
+        else:
+            writer.write_struct(prefix, *values)
+
+        for get, write in variable_writers:
+            write(writer, get(self))
+
+        if has_presence:
+            for v, (_, write) in zip(optional_values, optional_writers):
+                if v is not None:
+                    write(writer, v)
+
+    def on_read(self, reader: ByteReader):
+        values = reader.read_struct(prefix)
+        attrs = self.__dict__
+
+        if has_flags:
+            mask = values[0]
+            values = values[1:]
+            if bits:
+                for i, name in enumerate(bits, bits_offset):
+                    attrs[name] = bool(mask & (1 << i))
+
+        if composite:
+            attrs.update(zip(fixed_names, build_values(values)))
+        else:
+            attrs.update(zip(fixed_names, values))
+
+        for name, read in variable_readers:
+            attrs[name] = read(reader)
+
+        if has_presence:
+            for i, (name, read) in enumerate(optional_readers):
+                attrs[name] = read(reader) if mask & (1 << i) else None
+
+    return on_write, on_read
@@ -1,20 +1,65 @@
 from __future__ import annotations
 
 import asyncio
+import time
 from collections import defaultdict
-
-import pygame as pg
+from dataclasses import dataclass
+from sys import stderr
 
 from common.behaviour import Behaviour
+from common.clock import Clock, MonotonicClock
 from common.utils import overrides_method
 
+# Rounding tolerance on tick deadlines. Without it, a clock advanced right to the
+# deadline could fall short of it by a rounding error, and never reach it.
+_TICK_EPSILON = 1e-9
+
+
+@dataclass
+class TickStats:
+    ticks: int = 0
+    # Ticks run in the same iteration as a previous one, to catch up on lost time.
+    catch_up_ticks: int = 0
+    # Iterations that were so late that ticks had to be dropped.
+    overruns: int = 0
+    dropped_ticks: int = 0
+
+    def add(self, other: TickStats):
+        self.ticks += other.ticks
+        self.catch_up_ticks += other.catch_up_ticks
+        self.overruns += other.overruns
+        self.dropped_ticks += other.dropped_ticks
+
 
 class Simulation:
-    def __init__(self, tick_rate: float = 24):
+    def __init__(
+        self,
+        tick_rate: float = 24,
+        max_catch_up_ticks: int = 5,
+        clock: Clock | None = None,
+    ):
+        """
+        When an iteration comes late, the ticks it missed are run right away, up to
+        max_catch_up_ticks. Any tick beyond that is dropped and counted as an
+        overrun, so that a slow iteration does not snowball into slower ones.
+
+        Time is read from clock, the monotonic system clock by default.
+        """
+        self.clock = clock or MonotonicClock()
+        self._tick_rate_scale = 1.0
         self.tick_rate = tick_rate
+        self.max_catch_up_ticks = max_catch_up_ticks
+        self.stats = TickStats()
         self._last_tick: float = 0
         self._tick_accum_time: float = 0
         self._tick_id = 0
+        # Bumped whenever align_tick jumps tick ids, so that state kept per tick id
+        # can tell its ticks are no longer in sequence.
+        self.tick_epoch = 0
+
+        # Set on clients by clock synchronization: the server is that many ticks
+        # ahead of clock.now() * tick_rate.
+        self.server_tick_offset: float | None = None
 
         self._updatables: set[Behaviour] = set()
         self._will_update: set[Behaviour] = set()
@@ -35,12 +80,19 @@ class Simulation:
 
         self.render_debug = False
 
+        # When set to a dict, the time spent in on_tick and on_update is added up
+        # there under the name of each behaviour type. Only the synchronous part of
+        # asynchronous callbacks is counted.
+        self.behaviour_timings: dict[str, float] | None = None
+
     def _spawn_task(self, coro):
         task = asyncio.create_task(coro)
         self._pending_tasks.add(task)
 
         def _cleanup(task):
             self._pending_tasks.discard(task)
+            if task.cancelled():
+                return
             try:
                 task.result()
             except Exception as e:
@@ -64,6 +116,43 @@ class Simulation:
     @tick_rate.setter
     def tick_rate(self, tick_rate: float):
         self.tick_interval = 1 / tick_rate
+        self._tick_period = self.tick_interval / self._tick_rate_scale
+
+    @property
+    def tick_rate_scale(self) -> float:
+        """
+        How much faster than tick_rate ticks actually run, which lets clients drift
+        into step with the server. Behaviours still see the nominal tick_interval.
+        """
+        return self._tick_rate_scale
+
+    @tick_rate_scale.setter
+    def tick_rate_scale(self, scale: float):
+        self._tick_rate_scale = scale
+        self._tick_period = self.tick_interval / scale
+
+    @property
+    def tick_time(self) -> float:
+        """The tick id, plus the fraction of the next tick that already elapsed."""
+        elapsed = self.clock.now() - self._last_tick
+        return self._tick_id + (self._tick_accum_time + elapsed) / self._tick_period
+
+    @property
+    def server_tick(self) -> float | None:
+        """
+        Estimated tick time of the server, on clients that synchronized their clock
+        with it.
+        """
+        if self.server_tick_offset is None:
+            return None
+        return self.clock.now() * self.tick_rate + self.server_tick_offset
+
+    def align_tick(self, tick_time: float):
+        """Jumps to tick_time, as returned by tick_time, without running any tick."""
+        self._last_tick = self.clock.now()
+        self._tick_id = int(tick_time)
+        self._tick_accum_time = (tick_time - self._tick_id) * self._tick_period
+        self.tick_epoch += 1
 
     def add_updatable(self, b: Behaviour):
         if not b._started:
@@ -90,11 +179,17 @@ class Simulation:
         self._will_render.discard((b, layer))
 
     def start(self):
-        self._last_tick = pg.time.get_ticks()
+        self._last_tick = self.clock.now()
+
+    def time_until_next_tick(self) -> float:
+        """Seconds until the next tick is due, 0 when it is already late."""
+        elapsed = self.clock.now() - self._last_tick
+        remaining = self._tick_period - self._tick_accum_time - elapsed
+        return remaining if remaining > _TICK_EPSILON else 0.0
 
     def iterate(self):
-        curr_tick = pg.time.get_ticks()
-        dt = (curr_tick - self._last_tick) / 1000.0
+        curr_tick = self.clock.now()
+        dt = curr_tick - self._last_tick
         self._last_tick = curr_tick
         self._tick_accum_time += dt
 
@@ -120,19 +215,53 @@ class Simulation:
 
         self._resolve_frame_futures()
 
-        if self._tick_accum_time > self.tick_interval:
-            self._tick_accum_time -= self.tick_interval
-            self._resolve_tick_futures()
-            for t in self._tickables:
-                if t.node.destroyed:
-                    continue
-                self.run_task(t.on_tick(self._tick_id))
-            self._tick_id += 1
+        steps = 0
+        while self._tick_accum_time + _TICK_EPSILON >= self._tick_period:
+            if steps == self.max_catch_up_ticks:
+                self._drop_late_ticks()
+                break
+            self._tick_accum_time -= self._tick_period
+            self._tick()
+            steps += 1
+        if steps > 1:
+            self.stats.catch_up_ticks += steps - 1
 
+        timings = self.behaviour_timings
         for u in self._updatables:
             if u.node.destroyed:
                 continue
-            self.run_task(u.on_update(dt))
+            if timings is None:
+                self.run_task(u.on_update(dt))
+            else:
+                started = time.perf_counter()
+                self.run_task(u.on_update(dt))
+                _add_timing(timings, u, started)
+
+    def _tick(self):
+        self._resolve_tick_futures()
+        timings = self.behaviour_timings
+        for t in self._tickables:
+            if t.node.destroyed:
+                continue
+            if timings is None:
+                self.run_task(t.on_tick(self._tick_id))
+            else:
+                started = time.perf_counter()
+                self.run_task(t.on_tick(self._tick_id))
+                _add_timing(timings, t, started)
+        self._tick_id += 1
+        self.stats.ticks += 1
+
+    def _drop_late_ticks(self):
+        dropped = int((self._tick_accum_time + _TICK_EPSILON) / self._tick_period)
+        self._tick_accum_time -= dropped * self._tick_period
+        self.stats.overruns += 1
+        self.stats.dropped_ticks += dropped
+        print(
+            f"Simulation overrun: dropped {dropped} ticks after catching up on "
+            f"{self.max_catch_up_ticks}.",
+            file=stderr,
+        )
 
     def render(self):
         for bl in self._will_render:
@@ -172,12 +301,10 @@ class Simulation:
         return await future
 
     async def wait_seconds(self, seconds: float):
-        start_time = pg.time.get_ticks() / 1000.0
-        target_time = start_time + seconds
+        target_time = self.clock.now() + seconds
 
         while True:
-            current_time = pg.time.get_ticks() / 1000.0
-            if current_time >= target_time:
+            if self.clock.now() >= target_time:
                 break
             await self.wait_next_frame()
 
@@ -196,3 +323,8 @@ class Simulation:
         for future in futures_to_resolve:
             if not future.done():
                 future.set_result(None)
+
+
+def _add_timing(timings: dict[str, float], behaviour: Behaviour, started: float):
+    name = type(behaviour).__name__
+    timings[name] = timings.get(name, 0.0) + time.perf_counter() - started
@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+from typing import Any
+
+from common.behaviours.network_entity import (
+    POSITION_PRECISION,
+    ROTATION_TYPE,
+    SCALE_PRECISION,
+    _sync_var_id_types,
+    _sync_var_readers,
+    _sync_var_type_ids,
+    _sync_var_writers,
+)
+from common.binary import ByteReader, ByteWriter
+from common.network import DeliveryMode, Packet
+from common.schema import VARUINT, quantized
+
+# Replicated state of a single entity: position x/y, world rotation, scale x/y
+# and the values of its sync vars, indexed by sync var id.
+EntityState = tuple[float, float, float, float, float, tuple]
+
+# A changed entity: (entity_id, field_mask, sync_var_mask, state). Only the fields
+# and sync vars flagged by the masks are meaningful in the state.
+EntityDelta = tuple[int, int, int, EntityState]
+
+POSITION = 1
+ROTATION = 2
+SCALE = 4
+SYNC_VARS = 8
+
+ALL_FIELDS = POSITION | ROTATION | SCALE | SYNC_VARS
+
+MAX_SYNC_VARS = 64
+
+
+def diff_state(old: EntityState | None, new: EntityState) -> tuple[int, int]:
+    """Returns the (field_mask, sync_var_mask) of what changed from old to new."""
+    if old is None:
+        sync_count = len(new[5])
+        mask = ALL_FIELDS if sync_count else ALL_FIELDS & ~SYNC_VARS
+        return mask, (1 << sync_count) - 1
+
+    mask = 0
+    if old[0] != new[0] or old[1] != new[1]:
+        mask |= POSITION
+    if old[2] != new[2]:
+        mask |= ROTATION
+    if old[3] != new[3] or old[4] != new[4]:
+        mask |= SCALE
+
+    sync_mask = 0
+    old_vars, new_vars = old[5], new[5]
+    if old_vars != new_vars:
+        for i, v in enumerate(new_vars):
+            if i >= len(old_vars) or old_vars[i] != v:
+                sync_mask |= 1 << i
+        if sync_mask:
+            mask |= SYNC_VARS
+
+    return mask, sync_mask
+
+
+def diff_snapshots(
+    baseline: dict[int, EntityState] | None, current: dict[int, EntityState]
+) -> tuple[list[EntityDelta], list[int]]:
+    """
+    Computes the entities that changed between two snapshots, and the ones that
+    are no longer present.
+    """
+    if baseline is None:
+        baseline = {}
+
+    changes: list[EntityDelta] = []
+    for entity_id, state in current.items():
+        old = baseline.get(entity_id)
+        if old == state:
+            continue
+        mask, sync_mask = diff_state(old, state)
+        changes.append((entity_id, mask, sync_mask, state))
+
+    removed = [entity_id for entity_id in baseline if entity_id not in current]
+    return changes, removed
+
+
+def merge_state(
+    base: EntityState | None, mask: int, sync_mask: int, delta: EntityState
+) -> EntityState:
+    x, y, rotation, sx, sy, sync_values = base or (0.0, 0.0, 0.0, 1.0, 1.0, ())
+
+    if mask & POSITION:
+        x, y = delta[0], delta[1]
+    if mask & ROTATION:
+        rotation = delta[2]
+    if mask & SCALE:
+        sx, sy = delta[3], delta[4]
+    if mask & SYNC_VARS:
+        merged = list(sync_values)
+        for i, v in enumerate(delta[5]):
+            if not sync_mask & (1 << i):
+                continue
+            if i >= len(merged):
+                merged += [None] * (i + 1 - len(merged))
+            merged[i] = v
+        sync_values = tuple(merged)
+
+    return x, y, rotation, sx, sy, sync_values
+
+
+def merge_snapshot(
+    baseline: dict[int, EntityState] | None,
+    changes: list[EntityDelta],
+    removed: list[int],
+) -> dict[int, EntityState]:
+    """Rebuilds a full snapshot from its baseline and the deltas against it."""
+    snapshot = dict(baseline) if baseline is not None else {}
+    for entity_id in removed:
+        snapshot.pop(entity_id, None)
+    for entity_id, mask, sync_mask, delta in changes:
+        snapshot[entity_id] = merge_state(
+            snapshot.get(entity_id), mask, sync_mask, delta
+        )
+    return snapshot
+
+
+class EntitySnapshot(Packet):
+    """
+    Replicated state of every entity that changed since the baseline snapshot,
+    which is the last snapshot acknowledged by the receiving peer. A missing
+    baseline means the snapshot is complete.
+    """
+
+    def __init__(
+        self,
+        tick_id: int,
+        baseline_tick: int | None,
+        changes: list[EntityDelta],
+        removed: list[int],
+    ):
+        self.tick_id = tick_id
+        self.baseline_tick = baseline_tick
+        self.changes = changes
+        self.removed = removed
+
+    def on_write(self, writer: ByteWriter):
+        writer.write_varuint(self.tick_id)
+        # The baseline is sent as a distance to the tick, plus one so that zero
+        # means there is no baseline.
+        if self.baseline_tick is not None:
+            writer.write_varuint(self.tick_id - self.baseline_tick + 1)
+        else:
+            writer.write_varuint(0)
+
+        writer.write_varuint(len(self.removed))
+        for entity_id in self.removed:
+            writer.write_varuint(entity_id)
+
+        writer.write_varuint(len(self.changes))
+        rotation_write = ROTATION_TYPE.write
+        for entity_id, mask, sync_mask, state in self.changes:
+            writer.write_varuint(entity_id)
+            writer.write_uint8(mask)
+            if mask & POSITION:
+                writer.write_quantized(state[0], POSITION_PRECISION)
+                writer.write_quantized(state[1], POSITION_PRECISION)
+            if mask & ROTATION:
+                rotation_write(writer, state[2])
+            if mask & SCALE:
+                writer.write_quantized(state[3], SCALE_PRECISION)
+                writer.write_quantized(state[4], SCALE_PRECISION)
+            if mask & SYNC_VARS:
+                if len(state[5]) > MAX_SYNC_VARS:
+                    raise ValueError(
+                        f"Entity {entity_id} has more than {MAX_SYNC_VARS} sync vars."
+                    )
+                writer.write_varuint(sync_mask)
+                for i, v in enumerate(state[5]):
+                    if sync_mask & (1 << i):
+                        t = type(v)
+                        writer.write_uint8(_sync_var_type_ids[t])
+                        _sync_var_writers[t](v, writer)
+
+    def on_read(self, reader: ByteReader):
+        self.tick_id = reader.read_varuint()
+        baseline_distance = reader.read_varuint()
+        self.baseline_tick = (
+            self.tick_id - baseline_distance + 1 if baseline_distance else None
+        )
+
+        self.removed = [reader.read_varuint() for _ in range(reader.read_varuint())]
+
+        rotation_read = ROTATION_TYPE.read
+        self.changes = []
+        for _ in range(reader.read_varuint()):
+            entity_id = reader.read_varuint()
+            mask = reader.read_uint8()
+            x = y = rotation = sx = sy = 0.0
+            sync_mask = 0
+            sync_values: list[Any] = []
+
+            if mask & POSITION:
+                x = reader.read_quantized(POSITION_PRECISION)
+                y = reader.read_quantized(POSITION_PRECISION)
+            if mask & ROTATION:
+                rotation = rotation_read(reader)
+            if mask & SCALE:
+                sx = reader.read_quantized(SCALE_PRECISION)
+                sy = reader.read_quantized(SCALE_PRECISION)
+            if mask & SYNC_VARS:
+                sync_mask = reader.read_varuint()
+                for i in range(sync_mask.bit_length()):
+                    if sync_mask & (1 << i):
+                        t = _sync_var_id_types[reader.read_uint8()]
+                        sync_values.append(_sync_var_readers[t](reader))
+                    else:
+                        sync_values.append(None)
+
+            self.changes.append(
+                (
+                    entity_id,
+                    mask,
+                    sync_mask,
+                    (x, y, rotation, sx, sy, tuple(sync_values)),
+                )
+            )
+
+    @property
+    def delivery_mode(self) -> DeliveryMode:
+        return DeliveryMode.UNRELIABLE
+
+
+class SnapshotAck(Packet):
+    # view_delay is how many ticks behind the acknowledged snapshot the client
+    # renders entities, which tells the server what the client sees.
+    fields = {"tick_id": VARUINT, "view_delay": quantized(1 / 16)}
+
+    def __init__(self, tick_id: int, view_delay: float = 0.0):
+        self.tick_id = tick_id
+        self.view_delay = view_delay
+
+    @property
+    def delivery_mode(self) -> DeliveryMode:
+        return DeliveryMode.UNRELIABLE
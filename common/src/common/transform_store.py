@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from common.behaviours.transform import Transform
+
+
+class TransformStore:
+    """
+    Keeps the transforms of a game in columns of NumPy arrays, one slot per node,
+    instead of in vectors of every Transform. Transforms of the game become views
+    over their slot, and systems that need many transforms at once can refresh and
+    read the columns directly.
+
+    Local columns hold what transforms were set to, and world columns what they
+    were last refreshed to. Stale world values are recomputed either per transform,
+    when one is read, or all at once by refresh, one depth of the scene at a time so
+    that parents are up to date before their children.
+    """
+
+    def __init__(self, capacity: int = 256):
+        self.local_x = np.zeros(capacity)
+        self.local_y = np.zeros(capacity)
+        self.local_rotation = np.zeros(capacity)
+        self.local_scale_x = np.ones(capacity)
+        self.local_scale_y = np.ones(capacity)
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.rotation = np.zeros(capacity)
+        self.scale_x = np.ones(capacity)
+        self.scale_y = np.ones(capacity)
+        # Slot of the parent of every node, or -1 for roots, and how many ancestors
+        # the node has.
+        self.parent = np.full(capacity, -1, dtype=np.int32)
+        self.depth = np.zeros(capacity, dtype=np.int32)
+
+        self._transforms: list[Transform | None] = [None] * capacity
+        self._free = list(range(capacity - 1, -1, -1))
+        # Slots whose world transform went stale since the last refresh. Some may
+        # have been refreshed on their own, or released, since.
+        self._stale: list[int] = []
+
+    def __len__(self):
+        return len(self._transforms) - len(self._free)
+
+    @property
+    def capacity(self) -> int:
+        return len(self._transforms)
+
+    def _columns(self) -> list[np.ndarray]:
+        return [
+            self.local_x,
+            self.local_y,
+            self.local_rotation,
+            self.local_scale_x,
+            self.local_scale_y,
+            self.x,
+            self.y,
+            self.rotation,
+            self.scale_x,
+            self.scale_y,
+            self.parent,
+            self.depth,
+        ]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(c.nbytes for c in self._columns())
+
+    def transform(self, slot: int) -> Transform | None:
+        return self._transforms[slot]
+
+    def refresh(self):
+        """Recomputes every stale world transform, with a vectorized pass per depth."""
+        stale = self._stale
+        if not stale:
+            return
+        transforms = self._transforms
+        pending = [transforms[s] for s in set(stale)]
+        stale.clear()
+        refreshed = [t for t in pending if t is not None and t._dirty]
+        if not refreshed:
+            return
+
+        slots = np.fromiter((t._slot for t in refreshed), np.intp, len(refreshed))
+        depths = self.depth[slots]
+        order = np.argsort(depths, kind="stable")
+        slots = slots[order]
+        depths = depths[order]
+        levels = np.split(slots, np.flatnonzero(np.diff(depths)) + 1)
+        if depths[0] == 0:
+            roots = levels.pop(0)
+            self.x[roots] = self.local_x[roots]
+            self.y[roots] = self.local_y[roots]
+            self.rotation[roots] = self.local_rotation[roots]
+            self.scale_x[roots] = self.local_scale_x[roots]
+            self.scale_y[roots] = self.local_scale_y[roots]
+        for level in levels:
+            self._refresh_children(level)
+
+        for t in refreshed:
+            t._dirty = False
+
+    def _refresh_children(self, slots: np.ndarray):
+        parents = self.parent[slots]
+        parent_rotation = self.rotation[parents]
+        radians = np.radians(parent_rotation)
+        cos = np.cos(radians)
+        sin = np.sin(radians)
+        local_x = self.local_x[slots]
+        local_y = self.local_y[slots]
+        self.x[slots] = self.x[parents] + local_x * cos - local_y * sin
+        self.y[slots] = self.y[parents] + local_x * sin + local_y * cos
+        self.rotation[slots] = self.local_rotation[slots] + parent_rotation
+        self.scale_x[slots] = self.local_scale_x[slots] * self.scale_x[parents]
+        self.scale_y[slots] = self.local_scale_y[slots] * self.scale_y[parents]
+
+    def _allocate(self, transform: Transform) -> int:
+        if not self._free:
+            self._grow()
+        slot = self._free.pop()
+        self._transforms[slot] = transform
+        return slot
+
+    def _release(self, slot: int):
+        self._transforms[slot] = None
+        self.parent[slot] = -1
+        self._free.append(slot)
+
+    def _grow(self):
+        capacity = self.capacity
+
+        def grow(column: np.ndarray, fill: float) -> np.ndarray:
+            grown = np.full(capacity * 2, fill, dtype=column.dtype)
+            grown[:capacity] = column
+            return grown
+
+        self.local_x = grow(self.local_x, 0)
+        self.local_y = grow(self.local_y, 0)
+        self.local_rotation = grow(self.local_rotation, 0)
+        self.local_scale_x = grow(self.local_scale_x, 1)
+        self.local_scale_y = grow(self.local_scale_y, 1)
+        self.x = grow(self.x, 0)
+        self.y = grow(self.y, 0)
+        self.rotation = grow(self.rotation, 0)
+        self.scale_x = grow(self.scale_x, 1)
+        self.scale_y = grow(self.scale_y, 1)
+        self.parent = grow(self.parent, -1)
+        self.depth = grow(self.depth, 0)
+        self._transforms.extend([None] * capacity)
+        self._free.extend(range(capacity * 2 - 1, capacity - 1, -1))
@@ -5,6 +5,7 @@ import pygame as pg
 
 from common.behaviour import Behaviour
 from common.behaviours.network_behaviour import NetworkBehaviour
+from common.interest import RelevanceHandler
 from common.network import NetPeer
 from common.primitives import Vector2
 from common.utils import notnull
@@ -14,7 +15,7 @@ if TYPE_CHECKING:
     from game.player import Player
 
 
-class GameManager(NetworkBehaviour):
+class GameManager(NetworkBehaviour, RelevanceHandler):
     def on_init(self) -> Any:
         self._players: list[Player] = []
         self._players_by_peer: dict[NetPeer, Player] = {}
@@ -31,6 +32,9 @@ class GameManager(NetworkBehaviour):
     def get_player_by_peer(self, peer: NetPeer):
         return self._players_by_peer[peer]
 
+    def is_relevant_to(self, peer: NetPeer) -> bool | None:
+        return True
+
     def on_common_pre_start(self):
         for p in self.players:
             self._players_by_peer[notnull(p.net_peer)] = p
@@ -1,8 +1,8 @@
 from __future__ import annotations
 
 from common.behaviours.network_entity import EntityPacket
-from common.binary import ByteReader, ByteWriter
 from common.network import DeliveryMode, Packet
+from common.schema import BOOL, STR, UINT8, UINT16, optional
 
 
 class LobbyInfo:
@@ -19,11 +19,7 @@ class LobbyInfo:
 
 
 class StartGameRequest(Packet):
-    def on_write(self, writer: ByteWriter):
-        pass
-
-    def on_read(self, reader: ByteReader):
-        pass
+    fields = {}
 
     @property
     def delivery_mode(self):
@@ -31,11 +27,7 @@ class StartGameRequest(Packet):
 
 
 class JoinGameRequest(Packet):
-    def on_write(self, writer: ByteWriter):
-        pass
-
-    def on_read(self, reader: ByteReader):
-        pass
+    fields = {}
 
     @property
     def delivery_mode(self):
@@ -43,16 +35,18 @@ class JoinGameRequest(Packet):
 
 
 class JoinGameResponse(Packet):
+    """
+    When redirect_port is set, the request was handed off to the worker listening
+    at that port of the same server, and the client should ask it again.
+    """
+
     accepted: bool
+    redirect_port: int | None
+    fields = {"accepted": BOOL, "redirect_port": optional(UINT16)}
 
-    def __init__(self, accepted: bool):
+    def __init__(self, accepted: bool, redirect_port: int | None = None):
         self.accepted = accepted
-
-    def on_write(self, writer: ByteWriter):
-        writer.write_bool(self.accepted)
-
-    def on_read(self, reader: ByteReader):
-        self.accepted = reader.read_bool()
+        self.redirect_port = redirect_port
 
     @property
     def delivery_mode(self):
@@ -60,11 +54,7 @@ class JoinGameResponse(Packet):
 
 
 class GameStarting(Packet):
-    def on_write(self, writer: ByteWriter):
-        pass
-
-    def on_read(self, reader: ByteReader):
-        pass
+    fields = {}
 
     @property
     def delivery_mode(self):
@@ -72,11 +62,7 @@ class GameStarting(Packet):
 
 
 class DoneLoadingGameScene(Packet):
-    def on_write(self, writer: ByteWriter):
-        pass
-
-    def on_read(self, reader: ByteReader):
-        pass
+    fields = {}
 
     @property
     def delivery_mode(self):
@@ -84,32 +70,20 @@ class DoneLoadingGameScene(Packet):
 
 
 class PlayerJoined(EntityPacket):
+    fields = {"index": UINT8, "you": BOOL}
+
     def __init__(self, entity_id: int, index: int, you: bool):
         super().__init__(entity_id, None)
         self.index = index
         self.you = you
 
-    def on_write(self, writer: ByteWriter):
-        super().on_write(writer)
-        writer.write_uint8(self.index)
-        writer.write_bool(self.you)
-
-    def on_read(self, reader: ByteReader):
-        super().on_read(reader)
-        self.index = reader.read_uint8()
-        self.you = reader.read_bool()
-
     @property
     def delivery_mode(self) -> DeliveryMode:
         return DeliveryMode.RELIABLE_ORDERED
 
 
 class QuitLobby(Packet):
-    def on_write(self, writer: ByteWriter):
-        pass
-
-    def on_read(self, reader: ByteReader):
-        pass
+    fields = {}
 
     @property
     def delivery_mode(self) -> DeliveryMode:
@@ -117,48 +91,24 @@ class QuitLobby(Packet):
 
 
 class PlayerLeft(EntityPacket):
+    fields = {"index": UINT8}
+
     def __init__(self, entity_id: int, index: int):
         super().__init__(entity_id, None)
         self.index = index
 
-    def on_write(self, writer: ByteWriter):
-        super().on_write(writer)
-        writer.write_uint8(self.index)
-
-    def on_read(self, reader: ByteReader):
-        super().on_read(reader)
-        self.index = reader.read_uint8()
-
     @property
     def delivery_mode(self) -> DeliveryMode:
         return DeliveryMode.RELIABLE_ORDERED
 
 
 class UpdateLobbyInfo(Packet):
+    fields = {"name": optional(STR), "capacity": optional(UINT8)}
+
     def __init__(self, name: str | None, capacity: int | None):
         self.name = name
         self.capacity = capacity
 
-    def on_write(self, writer: ByteWriter):
-        if self.name:
-            writer.write_bool(True)
-            writer.write_str(self.name)
-        else:
-            writer.write_bool(False)
-
-        if self.capacity:
-            writer.write_bool(True)
-            writer.write_uint8(self.capacity)
-        else:
-            writer.write_bool(False)
-
-    def on_read(self, reader: ByteReader):
-        if reader.read_bool():
-            self.name = reader.read_str()
-
-        if reader.read_bool():
-            self.capacity = reader.read_uint8()
-
     @property
     def delivery_mode(self) -> DeliveryMode:
         return DeliveryMode.RELIABLE_ORDERED
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+from collections import deque
+
 import pygame as pg
 
 from common.behaviours.animator import Animator
@@ -12,9 +14,11 @@ from common.behaviours.network_behaviour import (
 )
 from common.behaviours.network_entity import EntityPacket, NetworkEntity
 from common.behaviours.physics_object import PhysicsObject
-from common.binary import ByteReader, ByteWriter
+from common.interest import InterestViewer
 from common.network import DeliveryMode, NetPeer
+from common.prediction import Prediction, PredictionHandler
 from common.primitives import Vector2
+from common.schema import INT32, STR, VECTOR2
 from common.utils import clamp, notnull
 from game.composite_value import CompositeValue
 from game.game_manager import GameManager
@@ -22,20 +26,24 @@ from game.player import Player
 from game.spell import SpellInfo, SpellState, get_spell
 from game.ui.status_bar import StatusBar
 
+# Distance from the position the server had at a tick past which a predicted mage is
+# rewound and replayed. Above the precision of positions on the wire.
+PREDICTION_TOLERANCE = 0.25
 
-class MoveToOrder(EntityPacket):
-    def __init__(self, entity_id: int, where: Vector2):
-        super().__init__(entity_id)
-        self.where = where
+# Ticks ahead of the server that orders can be given for. Orders for later ticks
+# are carried out right away.
+MAX_ORDER_LEAD_TICKS = 64
 
-    def on_write(self, writer: ByteWriter):
-        super().on_write(writer)
-        writer.write_float32(self.where.x)
-        writer.write_float32(self.where.y)
+# Predicted state of a mage: its position, and where it is moving to.
+_MotionState = tuple[Vector2, Vector2 | None]
 
-    def on_read(self, reader: ByteReader):
-        super().on_read(reader)
-        self.where = Vector2(reader.read_float32(), reader.read_float32())
+
+class MoveToOrder(EntityPacket):
+    fields = {"where": VECTOR2}
+
+    def __init__(self, entity_id: int, where: Vector2, tick_id: int | None = None):
+        super().__init__(entity_id, tick_id)
+        self.where = where
 
     @property
     def delivery_mode(self) -> DeliveryMode:
@@ -43,49 +51,40 @@ class MoveToOrder(EntityPacket):
 
 
 class CastPointTargetSpellOrder(EntityPacket):
+    fields = {"spell_entity_id": INT32, "where": VECTOR2}
+
     def __init__(self, entity_id: int, spell_entity_id: int, where: Vector2):
         super().__init__(entity_id)
         self.spell_entity_id = spell_entity_id
         self.where = where
 
-    def on_write(self, writer: ByteWriter):
-        super().on_write(writer)
-        writer.write_int32(self.spell_entity_id)
-        writer.write_float32(self.where.x)
-        writer.write_float32(self.where.y)
-
-    def on_read(self, reader: ByteReader):
-        super().on_read(reader)
-        self.spell_entity_id = reader.read_int32()
-        self.where = Vector2(reader.read_float32(), reader.read_float32())
-
     @property
     def delivery_mode(self) -> DeliveryMode:
         return DeliveryMode.RELIABLE_ORDERED
 
 
 class AddSpell(EntityPacket):
+    fields = {"spell_entity_id": INT32, "spell_info_name": STR}
+
     def __init__(self, mage_entity_id: int, spell_entity_id: int, spell_info_name: str):
         super().__init__(mage_entity_id)
         self.spell_entity_id = spell_entity_id
         self.spell_info_name = spell_info_name
 
-    def on_write(self, writer: ByteWriter):
-        super().on_write(writer)
-        writer.write_int32(self.spell_entity_id)
-        writer.write_str(self.spell_info_name)
+    @property
+    def delivery_mode(self) -> DeliveryMode:
+        return DeliveryMode.RELIABLE_ORDERED
 
-    def on_read(self, reader: ByteReader):
-        super().on_read(reader)
-        self.spell_entity_id = reader.read_int32()
-        self.spell_info_name = reader.read_str()
+
+class TakeControl(EntityPacket):
+    """Tells the client of a player which mage it controls."""
 
     @property
     def delivery_mode(self) -> DeliveryMode:
         return DeliveryMode.RELIABLE_ORDERED
 
 
-class Mage(NetworkBehaviour):
+class Mage(NetworkBehaviour, InterestViewer, PredictionHandler):
     _move_destination: Vector2 | None
     _health_bar: StatusBar | None
 
@@ -93,6 +92,14 @@ class Mage(NetworkBehaviour):
         self._animator = self.node.get_behaviour_in_children(Animator)
         self._physics_object = self.node.get_or_add_behaviour(PhysicsObject)
         self._move_destination = None
+        # Server-side orders to carry out at the start of a tick still to come.
+        self._scheduled_orders: deque[tuple[int, Vector2]] = deque()
+        # Client-side prediction of the motion of the mage of the local player,
+        # and the order to send and predict along with the next tick.
+        self._prediction: Prediction[_MotionState, Vector2] | None = None
+        self._pending_order: Vector2 | None = None
+        self._render_from: Vector2 | None = None
+        self._controlled = False
         self._spells: list[SpellState] = []
         self.speed = CompositeValue(
             self, base=500, delivery_mode=DeliveryMode.UNRELIABLE
@@ -128,6 +135,12 @@ class Mage(NetworkBehaviour):
     def owner(self) -> Player:
         return notnull(self._game_manager.get_player_by_index(self.owner_index.value))
 
+    def get_viewing_peer(self) -> NetPeer | None:
+        if getattr(self, "_game_manager", None) is None:
+            return None
+        player = self._game_manager.get_player_by_index(self.owner_index.value)
+        return player.net_peer if player is not None else None
+
     @server_method
     def add_spell(self, spell: SpellInfo):
         assert self.game
@@ -141,6 +154,24 @@ class Mage(NetworkBehaviour):
         )
         self._do_add_spell(spell_entity, spell)
 
+    @server_method
+    def move_to(self, where: Vector2, tick_id: int | None = None):
+        """
+        Has the mage move towards where, right away or from tick_id on. Clients
+        predict their orders from the tick they give them at.
+        """
+        assert self.game
+        if tick_id is None:
+            self._scheduled_orders.clear()
+            self._move_destination = where
+            return
+
+        current_tick = self.game.simulation.tick_id
+        if tick_id > current_tick + MAX_ORDER_LEAD_TICKS:
+            tick_id = current_tick
+        # Late orders are carried out as soon as possible, after earlier ones.
+        self._scheduled_orders.append((max(tick_id, current_tick), where))
+
     @server_method
     def cast_spell_at_point(self, spell: SpellState | SpellInfo, where: Vector2):
         if isinstance(spell, SpellInfo):
@@ -154,6 +185,7 @@ class Mage(NetworkBehaviour):
             return
 
         spell_state.on_point_cast(where)
+        spell_state.start_cooldown()
 
     def get_spell_state(self, spell: SpellInfo):
         for s in self.spells:
@@ -161,6 +193,26 @@ class Mage(NetworkBehaviour):
                 return s
         return None
 
+    def is_predicted(self) -> bool:
+        return self._prediction is not None
+
+    def on_authoritative_transform(
+        self, tick_id: int, position: Vector2 | None, rotation: float | None
+    ):
+        prediction = self._prediction
+        if prediction is None or position is None:
+            return
+        if tick_id <= prediction.confirmed_tick:
+            return
+
+        predicted = prediction.state_at(tick_id)
+        if predicted is None:
+            prediction.reconcile(tick_id, (position, prediction.state[1]))
+        elif predicted[0].distance_squared_to(position) > PREDICTION_TOLERANCE**2:
+            prediction.reconcile(tick_id, (position, predicted[1]))
+        else:
+            prediction.confirm(tick_id)
+
     #
     # Private
     #
@@ -195,7 +247,7 @@ class Mage(NetworkBehaviour):
     def _handle_user_input(self):
         assert self.game
         camera = Camera.main
-        if camera is None:
+        if camera is None or not self._controlled:
             return
 
         mouse_world_pos = camera.screen_to_world_space(self.game.input.mouse_pos)
@@ -213,9 +265,13 @@ class Mage(NetworkBehaviour):
                 and current_tick != self._last_sent_move_order_tick
                 and mouse_world_pos != self._last_pressed_move_order_target
             ):
-                self.game.network.publish(
-                    MoveToOrder(self.net_entity.id, mouse_world_pos)
-                )
+                if self._prediction is not None:
+                    # Sent along with the tick it is predicted from.
+                    self._pending_order = mouse_world_pos
+                else:
+                    self.game.network.publish(
+                        MoveToOrder(self.net_entity.id, mouse_world_pos)
+                    )
                 self._last_pressed_move_order_target = mouse_world_pos
                 self._last_sent_move_order_tick = current_tick
 
@@ -228,16 +284,22 @@ class Mage(NetworkBehaviour):
                     )
                 )
 
-    @server_method
-    def _tick_motion(self, tick_interval: float):
-        if self._move_destination is None:
-            return
-
-        curr_pos = self.transform.position
-
-        delta = self._move_destination - curr_pos
+    def _step_motion(
+        self,
+        destination: Vector2 | None,
+        tick_interval: float,
+        predicted: bool = False,
+    ) -> Vector2 | None:
+        """
+        Moves the mage towards destination for a tick, and returns the destination
+        if it is still to be reached. Predicted steps leave other objects alone.
+        """
+        if destination is None:
+            return None
+
+        delta = destination - self.transform.position
         if delta.x == 0 and delta.y == 0:
-            return
+            return None
 
         delta_normalized = delta.normalize()
         if self._animator:
@@ -246,9 +308,65 @@ class Mage(NetworkBehaviour):
         motion = delta_normalized * self.speed.current * tick_interval
         if motion.length_squared() > delta.length_squared():
             motion = delta
-            self._move_destination = None
+            destination = None
+
+        # Moved within the tick, so that snapshots and predictions of the tick
+        # agree on where the mage is.
+        self._physics_object.move_and_collide_now(motion, predicted)
+        return destination
+
+    @server_method
+    def _tick_motion(self, tick_id: int, tick_interval: float):
+        orders = self._scheduled_orders
+        while orders and orders[0][0] <= tick_id:
+            self._move_destination = orders.popleft()[1]
+
+        self._move_destination = self._step_motion(
+            self._move_destination, tick_interval
+        )
+
+    def _predict_motion(
+        self, state: _MotionState, order: Vector2 | None
+    ) -> _MotionState:
+        assert self.game
+        position, destination = state
+        if order is not None:
+            destination = order
+
+        self.transform.position = position
+        destination = self._step_motion(
+            destination, self.game.simulation.tick_interval, predicted=True
+        )
+        return self.transform.position.copy(), destination
+
+    def _tick_prediction(self, tick_id: int):
+        assert self.game
+        prediction = self._prediction
+        if prediction is None:
+            if not self._controlled or self.game.network.is_server():
+                return
+            prediction = self._prediction = Prediction(
+                (self.transform.position.copy(), None), self._predict_motion
+            )
+
+        order = self._pending_order
+        self._pending_order = None
+        if order is not None:
+            self.game.network.publish(MoveToOrder(self.net_entity.id, order, tick_id))
 
-        self._physics_object.move_and_collide(motion)
+        self._render_from = prediction.state[0]
+        prediction.predict(tick_id, order, self.game.simulation.tick_epoch)
+
+    def _render_prediction(self):
+        """Moves the predicted mage between its last two ticks, for smooth frames."""
+        assert self.game
+        prediction = self._prediction
+        if prediction is None or self._render_from is None:
+            return
+
+        simulation = self.game.simulation
+        t = clamp(simulation.tick_time - simulation.tick_id, 0, 1)
+        self.transform.position = self._render_from.lerp(prediction.state[0], t)
 
     #
     # Packet handlers
@@ -279,12 +397,16 @@ class Mage(NetworkBehaviour):
 
         self._do_add_spell(spell_entity, spell)
 
+    @entity_packet_handler(TakeControl)
+    def _handle_take_control(self, packet: TakeControl, peer: NetPeer):
+        self._controlled = True
+
     @entity_packet_handler(MoveToOrder)
     def _handle_move_to_order(self, order: MoveToOrder, peer: NetPeer):
         if not self._has_authority(peer):
             return
 
-        self._move_destination = order.where
+        self.move_to(order.where, order.tick_id)
 
     #
     # Lifecycle
@@ -310,7 +432,13 @@ class Mage(NetworkBehaviour):
         spell = get_spell("fireball")
         self.add_spell(spell)
 
+        peer = self.get_viewing_peer()
+        if peer is not None:
+            peer.send(TakeControl(self.net_entity.id))
+
     def on_client_tick(self, tick_id: int):
+        self._tick_prediction(tick_id)
+
         if not self._health_bar:
             return
 
@@ -327,10 +455,11 @@ class Mage(NetworkBehaviour):
         tick_interval = self.game.simulation.tick_interval
         self.health -= 1 * tick_interval
 
-        self._tick_motion(tick_interval)
+        self._tick_motion(tick_id, tick_interval)
 
     def on_client_update(self, dt: float):
         self._handle_user_input()
+        self._render_prediction()
 
     def on_serialize(self, out_dict: dict):
         out_dict["speed"] = self.speed.base.value
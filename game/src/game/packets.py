@@ -7,7 +7,7 @@ from game.lobby import (
     PlayerLeft,
     StartGameRequest,
 )
-from game.mage import MoveToOrder
+from game.mage import MoveToOrder, TakeControl
 from game.spells.fireball_projectile import FireballBurst
 
 register_packets(
@@ -20,5 +20,6 @@ register_packets(
         DoneLoadingGameScene,
         MoveToOrder,
         FireballBurst,
+        TakeControl,
     ]
 )
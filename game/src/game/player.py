@@ -1,6 +1,7 @@
 from typing import TYPE_CHECKING
 
 from common.behaviours.network_behaviour import NetworkBehaviour, entity_packet_handler
+from common.interest import RelevanceHandler
 from common.network import NetPeer
 from common.utils import notnull
 from game.lobby import PlayerJoined
@@ -10,7 +11,7 @@ if TYPE_CHECKING:
     from game.mage import Mage
 
 
-class Player(NetworkBehaviour):
+class Player(NetworkBehaviour, RelevanceHandler):
     def on_init(self):
         self.index: int = 0
         self._local_player: bool = False
@@ -27,6 +28,9 @@ class Player(NetworkBehaviour):
         """
         return self._net_peer
 
+    def is_relevant_to(self, peer: NetPeer) -> bool | None:
+        return True
+
     def local_player(self):
         return self._local_player
 
@@ -127,6 +127,10 @@ class SpellState(NetworkBehaviour):
     def spell(self):
         return self._spell
 
+    def start_cooldown(self):
+        cooldowns = self.spell.cooldown
+        self.cooldown_timer.value = cooldowns[min(self.level.value, len(cooldowns)) - 1]
+
     def can_cast_now(self):
         return self.cooldown_timer.value <= 0
 
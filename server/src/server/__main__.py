@@ -1,34 +1,21 @@
 import asyncio
 import os
-import traceback
-from sys import stderr
 
-import pygame as pg
+from server.supervisor import Supervisor
+from server.worker import serve
 
-from common.assets import load_node_asset
-from common.game import Game
-from server.netserver import NetServer
+PORT = 16214
 
 
 async def main():
-    network = NetServer(port=16214)
-
-    os.environ["SDL_VIDEODRIVER"] = "dummy"
-    pg.init()
-    screen = pg.display.set_mode((1, 1))
-
-    game = Game(network=network, scene=load_node_asset("scenes/server/lobby.json"))
-
-    running = True
-    while running:
-        try:
-            await game.iterate()
-        except KeyboardInterrupt:
-            running = False
-        except Exception as _:
-            error_stack_trace = traceback.format_exc()
-            print(error_stack_trace, file=stderr)
-    game.cleanup()
+    threaded_io = os.environ.get("MAGUS_NET_THREAD") == "1"
+    # With workers, matches are spread over that many processes, behind a front
+    # door at PORT.
+    workers = int(os.environ.get("MAGUS_WORKERS", 0))
+    if workers > 0:
+        await Supervisor(workers, port=PORT, threaded_io=threaded_io).run()
+    else:
+        await serve(PORT, threaded_io)
 
 
 if __name__ == "__main__":
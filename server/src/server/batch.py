@@ -0,0 +1,302 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Iterable
+
+import game.packets  # Registers every packet, as a server would.
+from common.assets import load_node_asset
+from common.behaviours.network_entity_manager import NetworkEntityManager
+from common.clock import VirtualClock
+from common.game import Game
+from common.network import NetPeer, NullEnetPeer, NullNetwork
+from common.primitives import Vector2
+from common.simulation import Simulation
+from game.game_manager import GameManager
+from game.mage import Mage
+from game.player import Player
+from game.spell import get_spell
+
+# Arena the mages are spawned in by GameManager, that bots wander around.
+ARENA_HALF_SIZE = 200
+
+
+class _ServerNetwork(NullNetwork):
+    """Runs server code only, where a NullNetwork would run client code as well."""
+
+    def is_client(self) -> bool:
+        return False
+
+
+# A bot gets its mage, the mages of its enemies, and the match's random generator
+# every tick.
+Bot = Callable[[Mage, list[Mage], random.Random], None]
+
+
+def idle_bot(mage: Mage, enemies: list[Mage], rng: random.Random):
+    pass
+
+
+def wandering_bot(mage: Mage, enemies: list[Mage], rng: random.Random):
+    if mage._move_destination is None:
+        mage.move_to(
+            Vector2(
+                rng.uniform(-ARENA_HALF_SIZE, ARENA_HALF_SIZE),
+                rng.uniform(-ARENA_HALF_SIZE, ARENA_HALF_SIZE),
+            )
+        )
+
+
+def duelist_bot(mage: Mage, enemies: list[Mage], rng: random.Random):
+    """Closes in on the nearest enemy, and throws fireballs at it."""
+    alive = [e for e in enemies if e.health > 0]
+    if not alive:
+        return
+    position = mage.transform.position
+    target = min(alive, key=lambda e: (e.transform.position - position).length())
+    mage.move_to(target.transform.position)
+    fireball = mage.get_spell_state(get_spell("fireball"))
+    if fireball is not None:
+        mage.cast_spell_at_point(fireball, target.transform.position)
+
+
+BOTS: dict[str, Bot] = {
+    "idle": idle_bot,
+    "wandering": wandering_bot,
+    "duelist": duelist_bot,
+}
+
+
+@dataclass
+class MatchSpec:
+    seed: int
+    players: int = 2
+    bot: str = "duelist"
+    # Simulated seconds after which the match is called.
+    duration: float = 120.0
+    tick_rate: float = 24
+
+
+@dataclass
+class MatchResult:
+    seed: int
+    ticks: int
+    simulated_seconds: float
+    wall_seconds: float
+    # Index of the player whose mage outlived or outlasted the others, None on a draw.
+    winner: int | None
+    health: list[float]
+    behaviour_timings: dict[str, float] = field(default_factory=dict)
+
+    @property
+    def ticks_per_second(self):
+        return self.ticks / self.wall_seconds if self.wall_seconds > 0 else 0.0
+
+
+def _create_game(spec: MatchSpec, clock: VirtualClock) -> Game:
+    scene = load_node_asset("scenes/server/game.json")
+    scene.add_child(load_node_asset("templates/entity_manager.json"))
+    return Game(
+        network=_ServerNetwork(),
+        simulation=Simulation(spec.tick_rate, clock=clock),
+        scene=scene,
+    )
+
+
+def _spawn_players(spec: MatchSpec, game: Game) -> list[Player]:
+    """Spawns bot players and the game manager, as LobbyManager would."""
+    entity_mgr = game.scene.find_behaviour_in_children(
+        NetworkEntityManager, recursive=True
+    )
+    assert entity_mgr is not None
+
+    players = []
+    for index in range(spec.players):
+        player = entity_mgr.spawn_entity("player").node.get_behaviour(Player)
+        assert player is not None
+        player.index = index
+        player._net_peer = NetPeer(NullEnetPeer("bot", index))
+        players.append(player)
+
+    game_mgr = entity_mgr.spawn_entity("game_manager").node.get_or_add_behaviour(
+        GameManager
+    )
+    game_mgr._players = players
+    return players
+
+
+def _outcome(mages: list[Mage]) -> int | None:
+    health = [m.health for m in mages]
+    best = max(health)
+    if best <= 0 or health.count(best) > 1:
+        return None
+    return health.index(best)
+
+
+async def _run_match(spec: MatchSpec) -> MatchResult:
+    # GameManager spawns mages at random positions.
+    random.seed(spec.seed)
+    rng = random.Random(spec.seed)
+    bot = BOTS[spec.bot]
+
+    clock = VirtualClock()
+    game = _create_game(spec, clock)
+    simulation = game.simulation
+    simulation.behaviour_timings = {}
+    max_ticks = int(spec.duration * spec.tick_rate)
+
+    started = time.perf_counter()
+    await game.iterate()
+    players = _spawn_players(spec, game)
+
+    mages: list[Mage] = []
+    last_tick = simulation.tick_id
+    while simulation.tick_id < max_ticks:
+        clock.advance(simulation.time_until_next_tick())
+        await game.iterate()
+        if simulation.tick_id == last_tick:
+            continue
+        last_tick = simulation.tick_id
+
+        if not mages:
+            if any(p.mage is None for p in players):
+                continue
+            mages = [p.mage for p in players if p.mage is not None]
+
+        for mage in mages:
+            if mage.health > 0:
+                bot(mage, [m for m in mages if m is not mage], rng)
+        if sum(1 for m in mages if m.health > 0) <= 1:
+            break
+    wall_seconds = time.perf_counter() - started
+    game.cleanup()
+
+    return MatchResult(
+        spec.seed,
+        simulation.tick_id,
+        simulation.tick_id * simulation.tick_interval,
+        wall_seconds,
+        _outcome(mages) if mages else None,
+        [m.health for m in mages],
+        simulation.behaviour_timings,
+    )
+
+
+def run_match(spec: MatchSpec) -> MatchResult:
+    """Simulates a whole match on a virtual clock, as fast as the CPU allows."""
+    return asyncio.run(_run_match(spec))
+
+
+@dataclass
+class BatchReport:
+    matches: int
+    workers: int
+    wall_seconds: float
+    ticks: int
+    simulated_seconds: float
+    # Ticks simulated per wall second, across every worker.
+    ticks_per_second: float
+    # Ticks per second of a single match, averaged over matches.
+    match_ticks_per_second: float
+    outcomes: dict[str, int]
+    # Microseconds per tick spent in each behaviour type, over every match.
+    behaviour_us_per_tick: dict[str, float]
+
+    def format(self) -> str:
+        lines = [
+            f"{self.matches} matches on {self.workers} workers in "
+            f"{self.wall_seconds:.2f}s: {self.ticks} ticks, "
+            f"{self.simulated_seconds:.0f}s simulated",
+            f"{self.ticks_per_second:.0f} ticks/s overall, "
+            f"{self.match_ticks_per_second:.0f} ticks/s per match",
+            "Outcomes: "
+            + ", ".join(f"{k}: {v}" for k, v in sorted(self.outcomes.items())),
+            "Behaviour time per tick:",
+        ]
+        timings = sorted(self.behaviour_us_per_tick.items(), key=lambda kv: -kv[1])
+        lines += [f"  {name:<24} {us:9.1f}us" for name, us in timings]
+        return "\n".join(lines)
+
+
+def summarize(
+    results: list[MatchResult], workers: int, wall_seconds: float
+) -> BatchReport:
+    ticks = sum(r.ticks for r in results)
+    timings: Counter[str] = Counter()
+    for r in results:
+        timings.update(r.behaviour_timings)
+    outcomes = Counter(
+        "draw" if r.winner is None else f"player {r.winner}" for r in results
+    )
+    return BatchReport(
+        len(results),
+        workers,
+        wall_seconds,
+        ticks,
+        sum(r.simulated_seconds for r in results),
+        ticks / wall_seconds if wall_seconds > 0 else 0.0,
+        sum(r.ticks_per_second for r in results) / max(len(results), 1),
+        dict(outcomes),
+        {name: t * 1e6 / max(ticks, 1) for name, t in timings.items()},
+    )
+
+
+def _init_worker():
+    # Behaviours and packets print as they go, which thousands of matches cannot
+    # afford.
+    sys.stdout = open(os.devnull, "w")
+
+
+def run_batch(specs: Iterable[MatchSpec], workers: int | None = None) -> BatchReport:
+    """Runs every match across a pool of worker processes."""
+    specs = list(specs)
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    with ProcessPoolExecutor(workers, initializer=_init_worker) as executor:
+        chunksize = max(1, len(specs) // (workers * 4))
+        results = list(executor.map(run_match, specs, chunksize=chunksize))
+    return summarize(results, workers, time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Simulates matches between bots faster than real time."
+    )
+    parser.add_argument("--matches", type=int, default=100)
+    parser.add_argument("--players", type=int, default=2)
+    parser.add_argument("--bot", choices=sorted(BOTS), default="duelist")
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=120.0,
+        help="Simulated seconds after which a match is called.",
+    )
+    parser.add_argument("--tick-rate", type=float, default=24)
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the first match.")
+    parser.add_argument(
+        "--workers", type=int, help="Worker processes, one per core by default."
+    )
+    parser.add_argument("--json", help="Also writes the report to this file.")
+    args = parser.parse_args()
+
+    specs = (
+        MatchSpec(args.seed + i, args.players, args.bot, args.duration, args.tick_rate)
+        for i in range(args.matches)
+    )
+    report = run_batch(specs, args.workers)
+    print(report.format())
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(asdict(report), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -75,6 +75,7 @@ class LobbyManager(Behaviour):
         assert self.net_entity_manager
         entity_mgr = self.net_entity_manager
 
+        self._starting = True
         self.game.network.publish(GameStarting())
 
         response_promise = self.game.network.expect_all(
@@ -112,14 +113,18 @@ class LobbyManager(Behaviour):
     def _handle_update_lobby_info(self, packet: UpdateLobbyInfo, peer: NetPeer):
         self.lobby_info.update_from_packet(packet)
 
+    def accepts_players(self, player_count: int) -> bool:
+        """Whether another player can join, with player_count players already in."""
+        return not self._starting and player_count < self.lobby_info.capacity
+
     def on_init(self):
         self._players: list[Player] = []
+        self._starting = False
+        self.lobby_info = LobbyInfo()
 
     def on_pre_start(self):
         assert self.game
 
-        self.lobby_info = LobbyInfo()
-
         self._join_request_handler = self.game.network.listen(
             JoinGameRequest, lambda m, p: self._handle_join_request(m, p)
         )
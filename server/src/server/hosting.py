@@ -0,0 +1,328 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from typing import Callable, Collection
+
+from common.capture import SERVER, PacketCapture
+from common.game import Game
+from common.network import DeliveryMode, NetPeer, Network, Packet, encode_packet
+from common.simulation import TickStats
+from server.netserver import NetServer
+
+_CONNECT = 0
+_RECEIVE = 1
+_DISCONNECT = 2
+
+
+class HostedNetwork(Network):
+    """
+    The network of one game hosted by a GameHost. It only sees the peers routed to
+    its game, and hands them the events they sent since the last poll, so that each
+    game handles its traffic during its own iteration.
+    """
+
+    def __init__(self, host: GameHost):
+        super().__init__()
+        self._host = host
+        self.metrics = host.metrics
+        self._peers: dict[tuple[str, int], NetPeer] = {}
+        self._events: list[tuple[int, NetPeer, Packet | None, bytes]] = []
+        self._incoming = 0
+        # Events are held until the game iterated once, so that its behaviours are
+        # listening by the time they are delivered.
+        self._ready = False
+
+    @property
+    def pending(self) -> bool:
+        """Whether events are waiting for the next poll."""
+        return len(self._events) > 0
+
+    @property
+    def peer_count(self) -> int:
+        """Connected peers, counting the ones the game has not been told about yet."""
+        return len(self._peers) + self._incoming
+
+    def _connect(self, peer: NetPeer):
+        self._incoming += 1
+        self._events.append((_CONNECT, peer, None, b""))
+
+    def _receive(self, packet: Packet, peer: NetPeer, data: bytes):
+        self._events.append((_RECEIVE, peer, packet, data))
+
+    def _disconnect(self, peer: NetPeer):
+        # Forgotten right away, so that nothing gets sent to it in the meantime.
+        self._peers.pop(peer.address, None)
+        self._events.append((_DISCONNECT, peer, None, b""))
+
+    def poll(self):
+        if not self._ready:
+            return
+        events = self._events
+        self._events = []
+        capture = self._capture
+        for kind, peer, packet, data in events:
+            if kind == _RECEIVE:
+                assert packet is not None
+                if peer.address in self._peers:
+                    if capture is not None:
+                        capture.record_inbound(peer.address, packet.delivery_mode, data)
+                    self.notify(packet, peer)
+            elif kind == _CONNECT:
+                self._incoming -= 1
+                self._peers[peer.address] = peer
+                self.add_peer(peer)
+                self.notify_connection(peer)
+            else:
+                if capture is not None:
+                    capture.record_disconnect(peer.address)
+                peer._capture = None
+                self.notify_disconnection(peer)
+
+    def publish(
+        self,
+        packet: Packet,
+        override_delivery_mode: DeliveryMode | None = None,
+        exclude_peers: list[NetPeer] | None = None,
+    ):
+        mode = override_delivery_mode or packet.delivery_mode
+        data = encode_packet(packet, self.metrics)
+        for net_peer in self._peers.values():
+            if exclude_peers is not None and net_peer in exclude_peers:
+                continue
+            net_peer.queue_raw(data, mode)
+
+    def flush(self):
+        # The host flushes ENet once every game got to queue its packets.
+        for net_peer in self._peers.values():
+            net_peer.flush(self.outbound_stats)
+
+    def disconnect(self):
+        for net_peer in self._peers.values():
+            net_peer.disconnect()
+        self._peers = {}
+
+    def is_server(self) -> bool:
+        return True
+
+    def is_client(self) -> bool:
+        return False
+
+    @property
+    def connected_peers(self) -> Collection[NetPeer]:
+        return self._peers.values()
+
+
+class HostedGame:
+    def __init__(self, game: Game, network: HostedNetwork):
+        self.game = game
+        self.network = network
+        self.next_iteration = 0.0
+        self.suspended = False
+        # Order in which the game was created on its host.
+        self.number = 0
+
+
+class GameHost(NetServer):
+    """
+    Hosts many independent games behind a single ENet host, all iterated from one
+    event loop. Each connecting peer is routed to the first game that accepts it,
+    or to a new game, and stays there until it disconnects.
+
+    Games with peers are iterated when their next tick is due, or as soon as their
+    peers sent them something, and the host sleeps in between. Games without any
+    peer are suspended until one is routed to them, so an idle game costs nothing
+    but memory. All but one of the empty games that still accept peers are cleaned
+    up, along with stopped games and empty games that stopped accepting peers.
+
+    A draining host turns new peers away, and lets the games it already runs play
+    out.
+
+    The traffic of each game can be captured into a file of its own, stamped with
+    the ticks of that game, so that every capture can be replayed into one game.
+    """
+
+    def __init__(
+        self,
+        game_factory: Callable[[HostedNetwork], Game],
+        accepts_peer: Callable[[Game, int], bool] | None = None,
+        frame_rate: float | None = None,
+        address: str = "127.0.0.1",
+        port: int = 9999,
+        max_clients: int = 32,
+        threaded_io: bool = False,
+    ):
+        """
+        game_factory creates a game around the network it is given.
+        accepts_peer(game, peer_count) tells whether a game with peer_count peers
+        accepts another one. By default, every peer goes to the first game.
+        With a frame_rate, games are also iterated at least that often, for the
+        behaviours that update every frame.
+        """
+        super().__init__(address, port, max_clients, threaded_io)
+        self._game_factory = game_factory
+        self._accepts_peer = accepts_peer or (lambda game, peer_count: True)
+        self._frame_interval = None if frame_rate is None else 1 / frame_rate
+        self._retired_tick_stats = TickStats()
+        self._games: list[HostedGame] = []
+        self._peer_games: dict[NetPeer, HostedGame] = {}
+        self.iteration = 0
+        self.draining = False
+        self._capture_path: str | None = None
+        self._games_created = 0
+
+    @property
+    def games(self) -> list[Game]:
+        return [h.game for h in self._games]
+
+    @property
+    def peer_count(self) -> int:
+        return len(self._peer_games)
+
+    def create_game(self) -> Game:
+        network = HostedNetwork(self)
+        hosted = HostedGame(self._game_factory(network), network)
+        self._games_created += 1
+        hosted.number = self._games_created
+        self._games.append(hosted)
+        if self._capture_path is not None:
+            self._start_game_capture(hosted)
+        return hosted.game
+
+    def capture_games(self, path: str):
+        """
+        Captures the traffic of every current and future game. Each game gets a
+        file of its own next to path, numbered in the order games were created.
+        """
+        self._capture_path = path
+        for hosted in self._games:
+            self._start_game_capture(hosted)
+
+    def game_capture_path(self, number: int) -> str | None:
+        """Where the traffic of the game created as number-th is captured."""
+        if self._capture_path is None:
+            return None
+        root, ext = os.path.splitext(self._capture_path)
+        return f"{root}.game{number}{ext}"
+
+    def _start_game_capture(self, hosted: HostedGame):
+        path = self.game_capture_path(hosted.number)
+        assert path is not None
+        simulation = hosted.game.simulation
+        hosted.network.start_capture(
+            PacketCapture(path, SERVER, lambda: simulation.tick_id)
+        )
+
+    def _accepts(self, hosted: HostedGame, peer_count: int):
+        return not hosted.game.stopped and self._accepts_peer(hosted.game, peer_count)
+
+    def _route(self) -> HostedGame:
+        for hosted in self._games:
+            if self._accepts(hosted, hosted.network.peer_count):
+                return hosted
+
+        self.create_game()
+        return self._games[-1]
+
+    def notify_connection(self, connected_peer: NetPeer):
+        if self.draining:
+            connected_peer.disconnect()
+            return
+        hosted = self._route()
+        self._peer_games[connected_peer] = hosted
+        hosted.network._connect(connected_peer)
+
+    def _receive(self, net_peer: NetPeer, packet: Packet, data: bytes):
+        hosted = self._peer_games.get(net_peer)
+        if hosted is not None:
+            hosted.network._receive(packet, net_peer, data)
+
+    def notify_disconnection(self, disconnected_peer: NetPeer):
+        hosted = self._peer_games.pop(disconnected_peer, None)
+        if hosted is not None:
+            hosted.network._disconnect(disconnected_peer)
+
+    async def iterate(self):
+        """Routes network events, then iterates the games that are due."""
+        self.iteration += 1
+        self.poll()
+
+        now = time.monotonic()
+        for hosted in list(self._games):
+            network = hosted.network
+            if network.peer_count == 0 and not network.pending:
+                hosted.suspended = True
+                continue
+            if not self._due(hosted, now):
+                continue
+
+            if hosted.suspended:
+                # The simulation would otherwise catch up on the time it spent idle.
+                hosted.game.simulation.start()
+                hosted.suspended = False
+
+            if self._frame_interval is not None:
+                hosted.next_iteration = now + self._frame_interval
+            await hosted.game.iterate()
+            network._ready = True
+
+        self.flush()
+        self._collect_games()
+
+    def _collect_games(self):
+        spare = False
+        for hosted in list(self._games):
+            if not hosted.game.stopped:
+                if hosted.network.peer_count > 0 or hosted.network.pending:
+                    continue
+                if not spare and self._accepts(hosted, 0):
+                    spare = True
+                    continue
+
+            hosted.game.cleanup()
+            hosted.network.stop_capture()
+            self._games.remove(hosted)
+            self._retired_tick_stats.add(hosted.game.simulation.stats)
+
+    def _due(self, hosted: HostedGame, now: float) -> bool:
+        return (
+            hosted.network.pending
+            or hosted.game.simulation.time_until_next_tick() == 0
+            or (self._frame_interval is not None and now >= hosted.next_iteration)
+        )
+
+    def next_wake_delay(self, max_delay: float) -> float:
+        """
+        Time until the next game is due, at most max_delay. Network events wake
+        the host earlier when it waits with wait().
+        """
+        now = time.monotonic()
+        delay = max_delay
+        for hosted in self._games:
+            network = hosted.network
+            if network.pending:
+                return 0.0
+            if network.peer_count == 0:
+                continue
+            delay = hosted.game.next_wake_delay(delay)
+            if self._frame_interval is not None:
+                delay = min(delay, hosted.next_iteration - now)
+        return max(delay, 0.0)
+
+    @property
+    def tick_stats(self) -> TickStats:
+        """Ticks of every game this host ran, overruns included."""
+        stats = TickStats()
+        stats.add(self._retired_tick_stats)
+        for hosted in self._games:
+            stats.add(hosted.game.simulation.stats)
+        return stats
+
+    def disconnect(self):
+        for hosted in self._games:
+            hosted.game.cleanup()
+            hosted.network.stop_capture()
+        self._games = []
+        self._peer_games = {}
+        super().disconnect()
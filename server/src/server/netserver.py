@@ -1,19 +1,41 @@
-from typing import Collection
+import traceback
+from sys import stderr
+from typing import Any, Collection
 
 import enet
 
-from common.binary import ByteReader, ByteWriter
-from common.network import DeliveryMode, NetPeer, Network, Packet
+from common.net_io import NetIOThread, wait_for_host
+from common.network import (
+    DeliveryMode,
+    NetPeer,
+    Network,
+    Packet,
+    decode_packet,
+    encode_packet,
+    get_protocol_checksum,
+)
 
 
 class NetServer(Network):
     def __init__(
-        self, address: str = "127.0.0.1", port: int = 9999, max_clients: int = 32
+        self,
+        address: str = "127.0.0.1",
+        port: int = 9999,
+        max_clients: int = 32,
+        threaded_io: bool = False,
     ):
+        """
+        With threaded_io, the ENet host is serviced from a background thread and
+        poll only hands the received packets over to listeners.
+        """
         super().__init__()
         self._address = enet.Address(address.encode("utf-8"), port)
         self._host = enet.Host(self._address, 128, 0, 0, 0)
         self._peers: dict[tuple[str, int], NetPeer] = {}
+        self._io: NetIOThread | None = None
+        if threaded_io:
+            self._io = NetIOThread(self._host, metrics=self.metrics)
+            self._io.start()
         print(f"Listening at port {port}")
 
     def publish(
@@ -24,51 +46,119 @@ class NetServer(Network):
     ):
         if packet.delivery_mode != DeliveryMode.UNRELIABLE:
             print(f"Broadcasting {packet}")
-        writer = ByteWriter()
-        packet.encode(writer)
         mode = override_delivery_mode or packet.delivery_mode
-        data = writer.data
+        data = encode_packet(packet, self.metrics)
 
         for net_peer in self._peers.values():
             if exclude_peers is not None and net_peer in exclude_peers:
                 continue
 
-            net_peer.send_raw(data, mode)
+            net_peer.queue_raw(data, mode)
+
+    def flush(self):
+        for net_peer in self._peers.values():
+            net_peer.flush(self.outbound_stats)
+        if self._io is not None:
+            self._io.flush()
+        else:
+            self._host.flush()
+        self._export_metrics()
 
     def poll(self):
+        if self._io is not None:
+            for event in self._io.drain():
+                self._handle_event(*event)
+            return
+
         while True:
-            net_peer: NetPeer | None
             event = self._host.service(0)
             if event.type == enet.EVENT_TYPE_NONE:
                 break
 
-            if event.type == enet.EVENT_TYPE_CONNECT:
-                net_peer = NetPeer(event.peer)
-                self._peers[net_peer.address] = net_peer
-                self.notify_connection(net_peer)
-                print(f"New connection: {net_peer.address}")
+            address = (event.peer.address.host, event.peer.address.port)
+            packet = None
+            data = b""
+            if event.type == enet.EVENT_TYPE_RECEIVE:
+                if address not in self._peers:
+                    continue
+                # pyenet copies the payload into bytes on every access to data, and
+                # decoding then reads it in place.
+                data = event.packet.data
+                try:
+                    packet = decode_packet(data, self.metrics)
+                except Exception:
+                    print(
+                        f"Dropped undecodable packet from {address}: {traceback.format_exc()}",
+                        file=stderr,
+                    )
+                    continue
+
+            self._handle_event(
+                event.type, address, event.peer, packet, data, event.data
+            )
 
-            elif event.type == enet.EVENT_TYPE_RECEIVE:
-                net_peer = self._peers.get(
-                    (event.peer.address.host, event.peer.address.port)
+    def _handle_event(
+        self,
+        event_type: int,
+        address: tuple[str, int],
+        enet_peer: Any,
+        packet: Packet | None,
+        data: bytes,
+        event_data: int,
+    ):
+        net_peer: NetPeer | None
+        capture = self._capture
+        if event_type == enet.EVENT_TYPE_CONNECT:
+            net_peer = NetPeer(enet_peer, self._io)
+            # Clients connect with their protocol checksum, and are turned away with
+            # ours when they disagree on packet ids or on the compression dictionary.
+            checksum = get_protocol_checksum()
+            if event_data != checksum:
+                print(
+                    f"Rejected {address}: protocol checksum {hex(event_data)} does not "
+                    f"match {hex(checksum)}",
+                    file=stderr,
                 )
-                if net_peer:
-                    data = bytes(event.packet.data)
-                    reader = ByteReader(data)
-                    packet = Packet.decode(reader)
-                    self.notify(packet, net_peer)
-
-            elif event.type == enet.EVENT_TYPE_DISCONNECT:
-                address = (event.peer.address.host, event.peer.address.port)
-                disconnected = self._peers.pop(address)
-                self.notify_disconnection(disconnected)
-                print(f"Lost connection: {address}")
+                net_peer.disconnect(checksum)
+                return
+
+            self._peers[net_peer.address] = net_peer
+            self.add_peer(net_peer)
+            self.notify_connection(net_peer)
+            print(f"New connection: {net_peer.address}")
+
+        elif event_type == enet.EVENT_TYPE_RECEIVE:
+            net_peer = self._peers.get(address)
+            if net_peer and packet is not None:
+                self._receive(net_peer, packet, data)
+
+        elif event_type == enet.EVENT_TYPE_DISCONNECT:
+            disconnected = self._peers.pop(address, None)
+            if disconnected is None:
+                return
+            if capture is not None:
+                capture.record_disconnect(address)
+            self.notify_disconnection(disconnected)
+            print(f"Lost connection: {address}")
+
+    def _receive(self, net_peer: NetPeer, packet: Packet, data: bytes):
+        if self._capture is not None:
+            self._capture.record_inbound(net_peer.address, packet.delivery_mode, data)
+        self.notify(packet, net_peer)
 
     def disconnect(self):
         for p in self._peers.values():
             p.disconnect()
         self._peers = {}
-        self._host.destroy()
+        # pyenet destroys the host once it is collected, so only the disconnections
+        # have to be sent out.
+        if self._io is not None:
+            self._io.stop()
+        else:
+            self._host.flush()
+
+    async def wait(self, timeout: float):
+        await wait_for_host(self._host, self._io, timeout)
 
     def is_server(self) -> bool:
         return True
@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import asyncio
+import multiprocessing as mp
+import signal
+import time
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
+from sys import stderr
+
+from common.network import NetPeer
+from game.lobby import JoinGameRequest, JoinGameResponse
+from server.netserver import NetServer
+from server.worker import DRAIN, WorkerHealth, run_worker
+
+# A worker that did not report for that long is not sent any player.
+HEALTH_TIMEOUT = 5.0
+
+# Players sent to a worker count towards its load until its reports include them.
+RESERVATION_TIMEOUT = 2.0
+
+# Longest the front door waits for join requests before checking on workers.
+SUPERVISE_INTERVAL = 0.05
+
+# How long draining workers get to finish their matches before being terminated.
+DRAIN_TIMEOUT = 600.0
+
+
+class WorkerHandle:
+    def __init__(self, index: int, port: int):
+        self.index = index
+        self.port = port
+        self.process: BaseProcess | None = None
+        self.link: Connection | None = None
+        self.health: WorkerHealth | None = None
+        self.reported_at = 0.0
+        self.draining = False
+        self._reservations: list[float] = []
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def healthy(self, now: float) -> bool:
+        return (
+            self.health is not None
+            and not self.draining
+            and not self.health.draining
+            and now - self.reported_at < HEALTH_TIMEOUT
+        )
+
+    def reserve(self, now: float):
+        self._reservations.append(now)
+
+    def load(self, now: float) -> tuple[int, float]:
+        """Players, counting the ones on their way, then the share of time busy."""
+        self._reservations = [
+            t for t in self._reservations if now - t < RESERVATION_TIMEOUT
+        ]
+        assert self.health is not None
+        return (self.health.peers + len(self._reservations), self.health.busy)
+
+
+class Supervisor:
+    """
+    Spreads matches over worker processes, so that a server uses every core
+    despite the GIL. Each worker hosts its own lobbies and matches at its own port,
+    while a front door at the public port hands every JoinGameRequest to the
+    least loaded healthy worker, and redirects the client there.
+
+    Workers report their health every second. The ones that stopped reporting are
+    skipped, and the ones that died are restarted. Draining a worker stops sending
+    it players, and lets it exit once its matches are over.
+    """
+
+    def __init__(
+        self,
+        worker_count: int,
+        address: str = "127.0.0.1",
+        port: int = 9999,
+        threaded_io: bool = False,
+    ):
+        """Workers listen at the ports following the front door's."""
+        self.front_door = NetServer(address, port, threaded_io=threaded_io)
+        self.front_door.listen(JoinGameRequest, self._handle_join_request)
+        self.workers = [WorkerHandle(i, port + 1 + i) for i in range(worker_count)]
+        self._threaded_io = threaded_io
+        # Workers are spawned rather than forked, so that they do not inherit the
+        # front door's socket.
+        self._context = mp.get_context("spawn")
+        self._shutting_down = False
+        self._shutdown_deadline = 0.0
+
+    def start(self):
+        for worker in self.workers:
+            self._spawn(worker)
+
+    def _spawn(self, worker: WorkerHandle):
+        link, worker_link = self._context.Pipe()
+        worker.process = self._context.Process(
+            target=run_worker,
+            args=(worker.index, worker.port, worker_link, self._threaded_io),
+            name=f"magus-worker-{worker.index}",
+        )
+        worker.process.start()
+        worker_link.close()
+        worker.link = link
+        worker.health = None
+        worker.draining = False
+        print(f"Started worker {worker.index} at port {worker.port}")
+
+    def least_loaded_worker(self) -> WorkerHandle | None:
+        now = time.monotonic()
+        candidates = [w for w in self.workers if w.alive and w.healthy(now)]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda w: w.load(now))
+
+    def _handle_join_request(self, packet: JoinGameRequest, peer: NetPeer):
+        worker = None if self._shutting_down else self.least_loaded_worker()
+        if worker is None:
+            peer.send(JoinGameResponse(False))
+            return
+
+        worker.reserve(time.monotonic())
+        peer.send(JoinGameResponse(True, worker.port))
+
+    def health(self) -> list[WorkerHealth | None]:
+        return [w.health for w in self.workers]
+
+    def drain_worker(self, index: int):
+        worker = self.workers[index]
+        worker.draining = True
+        if worker.link is not None:
+            try:
+                worker.link.send(DRAIN)
+            except (BrokenPipeError, OSError):
+                pass
+
+    def shutdown(self):
+        """Stops taking players, and drains every worker."""
+        if self._shutting_down:
+            return
+        print("Draining workers...")
+        self._shutting_down = True
+        self._shutdown_deadline = time.monotonic() + DRAIN_TIMEOUT
+        for worker in self.workers:
+            self.drain_worker(worker.index)
+
+    def _receive_health(self):
+        now = time.monotonic()
+        for worker in self.workers:
+            link = worker.link
+            if link is None:
+                continue
+            try:
+                while link.poll():
+                    worker.health = link.recv()
+                    worker.reported_at = now
+            except (EOFError, OSError):
+                worker.link = None
+
+    def _supervise(self):
+        for worker in self.workers:
+            if worker.process is None or worker.alive:
+                continue
+
+            exit_code = worker.process.exitcode
+            worker.process = None
+            worker.link = None
+            worker.health = None
+            if worker.draining:
+                print(f"Worker {worker.index} drained.")
+            else:
+                print(
+                    f"Worker {worker.index} exited with code {exit_code}, restarting it.",
+                    file=stderr,
+                )
+                self._spawn(worker)
+
+    @property
+    def done(self) -> bool:
+        if not self._shutting_down:
+            return False
+        if all(w.process is None for w in self.workers):
+            return True
+        return time.monotonic() >= self._shutdown_deadline
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.shutdown)
+
+        self.start()
+        while not self.done:
+            self.front_door.poll()
+            self._receive_health()
+            self._supervise()
+            self.front_door.flush()
+            await self.front_door.wait(SUPERVISE_INTERVAL)
+
+        for worker in self.workers:
+            if worker.process is not None:
+                print(f"Worker {worker.index} did not drain in time.", file=stderr)
+                worker.process.terminate()
+                worker.process.join()
+        self.front_door.disconnect()
@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import signal
+import time
+import traceback
+from dataclasses import dataclass
+from multiprocessing.connection import Connection
+from sys import stderr
+
+import game.packets  # Registers every packet before protocol checksums are compared.
+from common.assets import load_node_asset
+from common.compression import load_dictionary
+from common.game import Game
+from common.net_metrics import MetricsExporter
+from common.network import set_compression_dictionary
+from server.behaviours.lobby_manager import LobbyManager
+from server.hosting import GameHost, HostedNetwork
+
+# Longest the host sleeps without servicing ENet, which still has pings to answer
+# and timeouts to check while every game is idle.
+MAX_WAIT = 0.1
+
+# How often a worker reports its health to the supervisor.
+REPORT_INTERVAL = 1.0
+
+# Command sent by the supervisor for a worker to stop taking players and exit once
+# its matches are over.
+DRAIN = "drain"
+
+
+@dataclass
+class WorkerHealth:
+    index: int
+    port: int
+    peers: int
+    games: int
+    # Share of the wall time spent iterating games since the previous report.
+    busy: float
+    # Ticks dropped by games that fell too far behind.
+    dropped_ticks: int
+    draining: bool
+
+
+def create_lobby(network: HostedNetwork) -> Game:
+    return Game(network=network, scene=load_node_asset("scenes/server/lobby.json"))
+
+
+def lobby_accepts(game: Game, peer_count: int) -> bool:
+    lobby = game.scene.find_behaviour_in_children(LobbyManager, recursive=True)
+    return lobby is not None and lobby.accepts_players(peer_count)
+
+
+def _worker_path(path: str, index: int | None) -> str:
+    """Gives every worker its own file, next to the one that was configured."""
+    if index is None:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{index}{ext}"
+
+
+class _Reporter:
+    """Sends health reports to the supervisor, and receives its commands."""
+
+    def __init__(self, index: int, port: int, link: Connection):
+        self._index = index
+        self._port = port
+        self._link = link
+        self._last_report = time.monotonic()
+        self._busy_time = 0.0
+
+    def add_busy_time(self, seconds: float):
+        self._busy_time += seconds
+
+    def should_drain(self) -> bool:
+        try:
+            while self._link.poll():
+                if self._link.recv() == DRAIN:
+                    return True
+        except (EOFError, OSError):
+            # The supervisor is gone, so nobody will send players here anymore.
+            return True
+        return False
+
+    def report(self, host: GameHost):
+        now = time.monotonic()
+        elapsed = now - self._last_report
+        if elapsed < REPORT_INTERVAL:
+            return
+        health = WorkerHealth(
+            self._index,
+            self._port,
+            host.peer_count,
+            len(host.games),
+            min(self._busy_time / elapsed, 1.0),
+            host.tick_stats.dropped_ticks,
+            host.draining,
+        )
+        self._last_report = now
+        self._busy_time = 0.0
+        try:
+            self._link.send(health)
+        except (BrokenPipeError, OSError):
+            pass
+
+
+async def serve(
+    port: int,
+    threaded_io: bool = False,
+    index: int | None = None,
+    link: Connection | None = None,
+):
+    """
+    Hosts lobbies and their matches at port until interrupted. Workers of a
+    supervisor get an index and a link to report their health through, and exit
+    once they are drained and their last player left.
+    """
+    # The compression dictionary is part of the protocol checksum, so it must be
+    # loaded before clients compare protocol checksums with us.
+    set_compression_dictionary(load_dictionary())
+    # The server never initializes pygame: simulations read the system clock, and
+    # images are loaded without being converted for a display.
+    host = GameHost(create_lobby, lobby_accepts, port=port, threaded_io=threaded_io)
+    host.create_game()
+
+    capture_path = os.environ.get("MAGUS_CAPTURE")
+    if capture_path:
+        # One capture per game, which replay feeds back into a single game.
+        host.capture_games(_worker_path(capture_path, index))
+
+    metrics_target = os.environ.get("MAGUS_METRICS")
+    if metrics_target:
+        if not metrics_target.startswith("udp://"):
+            metrics_target = _worker_path(metrics_target, index)
+        host.start_metrics_export(
+            MetricsExporter.from_target(
+                metrics_target, float(os.environ.get("MAGUS_METRICS_INTERVAL", 5))
+            )
+        )
+
+    reporter = None
+    if link is not None:
+        assert index is not None
+        reporter = _Reporter(index, port, link)
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGTERM, lambda: setattr(host, "draining", True)
+        )
+
+    running = True
+    while running:
+        try:
+            started = time.perf_counter()
+            await host.iterate()
+            if reporter is not None:
+                reporter.add_busy_time(time.perf_counter() - started)
+                if reporter.should_drain():
+                    host.draining = True
+                reporter.report(host)
+                if host.draining and host.peer_count == 0:
+                    running = False
+            await host.wait(host.next_wake_delay(MAX_WAIT))
+        except KeyboardInterrupt:
+            running = False
+        except Exception as _:
+            error_stack_trace = traceback.format_exc()
+            print(error_stack_trace, file=stderr)
+    host.disconnect()
+    host.stop_metrics_export()
+
+
+def run_worker(index: int, port: int, link: Connection, threaded_io: bool):
+    """Entry point of a worker process."""
+    # Interrupting the terminal reaches the whole process group, but workers only
+    # stop when the supervisor drains them.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(serve(port, threaded_io, index, link))
@@ -0,0 +1,67 @@
+"""
+Reports the time spent recording the colliders of a server into its lag
+compensation history every tick, the time taken by queries of a past tick, and the
+memory the history takes, for a second of history at 24 ticks per second.
+
+Run with: python -m tests.benchmarks.collider_history
+"""
+
+import math
+import random
+import time
+from typing import cast
+
+from common.behaviours.collider import Collider
+from common.collider_history import RECT, ColliderHistory
+from common.primitives import Rect, Vector2
+
+COLLIDERS = 500
+TICK_RATE = 24
+SECONDS = 10
+QUERIES_PER_TICK = 10
+ARENA_SIZE = 4000
+
+
+def main():
+    rng = random.Random(0)
+    colliders = [cast(Collider, object()) for _ in range(COLLIDERS)]
+    origins = [
+        Vector2(rng.uniform(0, ARENA_SIZE), rng.uniform(0, ARENA_SIZE))
+        for _ in colliders
+    ]
+    size = Vector2(32, 32)
+    history = ColliderHistory(TICK_RATE + 1)
+
+    record_time = 0.0
+    query_time = 0.0
+    hits = 0
+    ticks = TICK_RATE * SECONDS
+    for tick_id in range(ticks):
+        states = [
+            (c, Rect(o + Vector2(math.cos(tick_id * 0.1 + i), 0) * 100, size), RECT)
+            for i, (c, o) in enumerate(zip(colliders, origins))
+        ]
+        started = time.perf_counter()
+        history.record(tick_id, states)
+        record_time += time.perf_counter() - started
+
+        started = time.perf_counter()
+        for _ in range(QUERIES_PER_TICK):
+            where = Vector2(rng.uniform(0, ARENA_SIZE), rng.uniform(0, ARENA_SIZE))
+            hits += len(history.query(Rect(where, size), tick_id - TICK_RATE / 2))
+        query_time += time.perf_counter() - started
+
+    memory = sum(
+        sum(a.itemsize * len(a) for a in rects) + kinds.itemsize * len(kinds)
+        for rects, kinds in zip(history._rects, history._kinds)
+    )
+    print(
+        f"{COLLIDERS} colliders, {history.ticks} ticks: "
+        f"{record_time / ticks * 1e6:.0f}us per record, "
+        f"{query_time / ticks / QUERIES_PER_TICK * 1e6:.0f}us per query, "
+        f"{memory / 1024:.0f}KiB of history ({hits} hits)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Reports the bytes spent per entity per tick replicating moving entities, with the
+previous fixed-width encoding and the current compact one.
+
+Run with: python -m tests.benchmarks.entity_bytes
+"""
+
+import math
+import random
+
+from common.behaviours.network_entity import PositionUpdate, RotationUpdate
+from common.binary import ByteWriter
+from common.network import DeliveryMode, Packet
+from common.schema import FLOAT32, INT32, UINT32, optional
+from common.snapshot import EntitySnapshot, diff_snapshots
+
+ENTITY_COUNT = 64
+TICKS = 600
+
+
+class _FixedPositionUpdate(Packet):
+    fields = {
+        "entity_id": INT32,
+        "tick_id": optional(UINT32),
+        "x": FLOAT32,
+        "y": FLOAT32,
+    }
+
+    def __init__(self, tick_id: int, entity_id: int, x: float, y: float):
+        self.entity_id = entity_id
+        self.tick_id = tick_id
+        self.x = x
+        self.y = y
+
+    @property
+    def delivery_mode(self):
+        return DeliveryMode.UNRELIABLE
+
+
+class _FixedRotationUpdate(Packet):
+    fields = {"entity_id": INT32, "tick_id": optional(UINT32), "rotation": FLOAT32}
+
+    def __init__(self, tick_id: int, entity_id: int, rotation: float):
+        self.entity_id = entity_id
+        self.tick_id = tick_id
+        self.rotation = rotation
+
+    @property
+    def delivery_mode(self):
+        return DeliveryMode.UNRELIABLE
+
+
+def _size(packet: Packet) -> int:
+    writer = ByteWriter()
+    packet.on_write(writer)
+    return len(writer)
+
+
+def _simulate():
+    """Yields (tick_id, {entity_id: (x, y, rotation)}) for entities walking around."""
+    rng = random.Random(0)
+    entities = {
+        entity_id: [rng.uniform(-1500, 1500), rng.uniform(-1500, 1500), 0.0]
+        for entity_id in range(1, ENTITY_COUNT + 1)
+    }
+    tick_id = 100_000
+    for _ in range(TICKS):
+        tick_id += 1
+        for state in entities.values():
+            if rng.random() < 0.02:
+                state[2] = rng.uniform(-180, 180)
+            state[0] += math.cos(math.radians(state[2])) * 500 / 60
+            state[1] += math.sin(math.radians(state[2])) * 500 / 60
+        yield tick_id, {k: tuple(v) for k, v in entities.items()}
+
+
+def main():
+    fixed_bytes = 0
+    compact_bytes = 0
+    snapshot_bytes = 0
+
+    previous: dict[int, tuple] = {}
+    baseline = None
+    for tick_id, entities in _simulate():
+        for entity_id, (x, y, rotation) in entities.items():
+            fixed_bytes += _size(_FixedPositionUpdate(tick_id, entity_id, x, y))
+            compact_bytes += _size(PositionUpdate(tick_id, entity_id, x, y))
+            if previous.get(entity_id, (0, 0, rotation))[2] != rotation:
+                fixed_bytes += _size(_FixedRotationUpdate(tick_id, entity_id, rotation))
+                compact_bytes += _size(RotationUpdate(tick_id, entity_id, rotation))
+        previous = entities
+
+        current = {
+            entity_id: (x, y, rotation, 1.0, 1.0, ())
+            for entity_id, (x, y, rotation) in entities.items()
+        }
+        changes, removed = diff_snapshots(baseline, current)
+        snapshot_bytes += _size(
+            EntitySnapshot(tick_id, tick_id - 1 if baseline else None, changes, removed)
+        )
+        baseline = current
+
+    samples = ENTITY_COUNT * TICKS
+    print(f"{ENTITY_COUNT} entities over {TICKS} ticks, bytes per entity per tick:")
+    print(f"  fixed-width entity updates: {fixed_bytes / samples:6.2f}")
+    print(f"  compact entity updates:     {compact_bytes / samples:6.2f}")
+    print(f"  compact delta snapshots:    {snapshot_bytes / samples:6.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Reports the time spent per frame interpolating the transforms of remote entities,
+for a client rendering at 60 frames per second entities updated at 24 ticks per
+second, half of them moving and half of them at rest.
+
+Run with: python -m tests.benchmarks.interpolation
+"""
+
+import math
+import time
+
+from common.interpolation import InterpolationBuffer, InterpolationTimeline
+from common.node import Node
+from common.primitives import Vector2
+
+ENTITIES = 500
+TICK_RATE = 24
+FRAME_RATE = 60
+SECONDS = 10
+
+
+def main():
+    timeline = InterpolationTimeline()
+    entities = [(Node().transform, InterpolationBuffer()) for _ in range(ENTITIES)]
+    applied: list[object] = [None] * ENTITIES
+
+    frame_time = 0.0
+    frames = 0
+    tick_id = 0
+    for frame in range(FRAME_RATE * SECONDS):
+        now = frame / FRAME_RATE
+        while tick_id <= now * TICK_RATE:
+            timeline.observe(tick_id)
+            for i in range(0, ENTITIES, 2):
+                angle = tick_id * 0.1 + i
+                entities[i][1].push(
+                    tick_id, math.cos(angle) * 100, math.sin(angle) * 100, angle
+                )
+            if tick_id == 0:
+                for i in range(1, ENTITIES, 2):
+                    entities[i][1].push(tick_id, i, -i, 0)
+            tick_id += 1
+
+        started = time.perf_counter()
+        timeline.advance(1 / FRAME_RATE, TICK_RATE)
+        render_tick = timeline.render_tick
+        for i, (transform, buffer) in enumerate(entities):
+            sample = buffer.sample(render_tick)
+            if sample is applied[i] or sample is None:
+                continue
+            applied[i] = sample
+            transform.position = Vector2(sample[1], sample[2])
+            transform.local_rotation = sample[3]
+        frame_time += time.perf_counter() - started
+        frames += 1
+
+    print(
+        f"{ENTITIES} entities: {frame_time / frames * 1e6:.0f}us per frame, "
+        f"{frame_time / frames / ENTITIES * 1e9:.0f}ns per entity"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Reports the memory allocated and the time spent per received packet decoding a
+typical server frame, through the copying receive path the server used to take and
+through the current zero-copy one.
+
+Allocations are measured with tracemalloc: the transient bytes are the peak memory
+allocated while decoding a frame, and the retained blocks are the memory blocks
+still alive afterwards, i.e. the decoded packets themselves.
+
+Run with: python -m tests.benchmarks.receive_allocations
+"""
+
+import gc
+import sys
+import timeit
+import tracemalloc
+from io import BytesIO
+from typing import Callable
+
+from common.behaviours.network_entity import PositionUpdate, RotationUpdate
+from common.behaviours.network_entity_manager import SpawnEntity
+from common.binary import ByteReader, ByteWriter
+from common.network import MultiPacket, Packet, decode_packet
+
+FRAMES = 2000
+
+
+def _build_frame() -> tuple[bytes, int]:
+    packets: list[Packet] = [SpawnEntity(900, "templates/fireball.json", None)]
+    for entity_id in range(1, 33):
+        packets.append(
+            PositionUpdate(120_000, entity_id, entity_id * 37.5, -entity_id * 12.25)
+        )
+    for entity_id in range(1, 5):
+        packets.append(RotationUpdate(120_000, entity_id, entity_id * 45.0))
+
+    writer = ByteWriter()
+    MultiPacket(packets).encode(writer)
+    # ENet hands received payloads over as bytes.
+    return writer.data, len(packets)
+
+
+def _copying_decode(payload: bytes) -> Packet:
+    # The receive path used to copy the ENet payload before decoding, and the
+    # reader went through a BytesIO.
+    data = bytes(bytearray(payload))
+    return Packet.decode(ByteReader(BytesIO(data)))
+
+
+def _zero_copy_decode(payload: bytes) -> Packet:
+    return decode_packet(payload)
+
+
+def _measure(decode: Callable[[bytes], Packet], payload: bytes, packets: int):
+    for _ in range(100):
+        decode(payload)
+
+    gc.collect()
+    gc.disable()
+    tracemalloc.start()
+    peak = 0
+    for _ in range(FRAMES):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        decode(payload)
+        peak += tracemalloc.get_traced_memory()[1] - before
+
+    decoded = []
+    blocks = sys.getallocatedblocks()
+    for _ in range(FRAMES):
+        decoded.append(decode(payload))
+    retained = sys.getallocatedblocks() - blocks
+    tracemalloc.stop()
+    gc.enable()
+    del decoded
+
+    elapsed = min(timeit.repeat(lambda: decode(payload), number=FRAMES // 10, repeat=5))
+
+    samples = FRAMES * packets
+    return peak / samples, retained / samples, elapsed * 1e10 / samples
+
+
+def main():
+    payload, packets = _build_frame()
+    print(f"{packets} packets per {len(payload)} byte frame, per received packet:")
+    print(f"  {'':12} {'transient B':>12} {'retained blocks':>16} {'ns':>8}")
+    for name, decode in (
+        ("copying", _copying_decode),
+        ("zero-copy", _zero_copy_decode),
+    ):
+        transient, retained, ns = _measure(decode, payload, packets)
+        print(f"  {name:12} {transient:12.1f} {retained:16.2f} {ns:8.0f}")
+
+
+if __name__ == "__main__":
+    main()
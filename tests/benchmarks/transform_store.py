@@ -0,0 +1,98 @@
+"""
+Reports the time taken to read the world transforms of many entities every tick,
+one transform at a time from transforms of their own, and in a vectorized pass over
+a transform store, along with the memory taken by the store.
+
+Run with: python -m tests.benchmarks.transform_store
+"""
+
+import random
+import time
+
+import numpy as np
+
+from common.game import Game
+from common.node import Node
+from common.primitives import Vector2
+from common.transform_store import TransformStore
+
+ENTITIES = 5000
+CHILDREN = 2
+MOVING = 0.05
+TICKS = 100
+
+
+def _scene(store: TransformStore | None) -> tuple[list[Node], list[Node]]:
+    game = Game(transform_store=store)
+    game.scene.bind_to_game(game)
+    rng = random.Random(0)
+    roots = []
+    nodes = []
+    for _ in range(ENTITIES):
+        root = game.scene.add_child()
+        root.transform.position = Vector2(rng.uniform(0, 4000), rng.uniform(0, 4000))
+        roots.append(root)
+        nodes.append(root)
+        for i in range(CHILDREN):
+            child = root.add_child()
+            child.transform.local_position = Vector2(0, 10 * (i + 1))
+            child.transform.local_rotation = 15 * i
+            nodes.append(child)
+    return roots[: int(len(roots) * MOVING)], nodes
+
+
+def _read_transforms(nodes: list[Node]):
+    return [
+        (t.position.x, t.position.y, t.rotation, t.scale.x, t.scale.y)
+        for t in (n.transform for n in nodes)
+    ]
+
+
+def _read_store(store: TransformStore, slots: np.ndarray):
+    store.refresh()
+    return list(
+        zip(
+            store.x[slots].tolist(),
+            store.y[slots].tolist(),
+            store.rotation[slots].tolist(),
+            store.scale_x[slots].tolist(),
+            store.scale_y[slots].tolist(),
+        )
+    )
+
+
+def _move(roots: list[Node]):
+    for root in roots:
+        root.transform.local_position = root.transform.local_position + Vector2(1, 0)
+
+
+def main():
+    moving, nodes = _scene(None)
+    store = TransformStore()
+    stored_moving, stored_nodes = _scene(store)
+    slots = np.array([n.transform._slot for n in stored_nodes])
+
+    transform_time = 0.0
+    store_time = 0.0
+    for _ in range(TICKS):
+        _move(moving)
+        started = time.perf_counter()
+        expected = _read_transforms(nodes)
+        transform_time += time.perf_counter() - started
+
+        _move(stored_moving)
+        started = time.perf_counter()
+        result = _read_store(store, slots)
+        store_time += time.perf_counter() - started
+        assert np.allclose(result, expected)
+
+    print(
+        f"{len(nodes)} transforms, {len(moving) * (CHILDREN + 1)} moving: "
+        f"{transform_time / TICKS * 1e3:.2f}ms per tick through transforms, "
+        f"{store_time / TICKS * 1e3:.2f}ms through the store, "
+        f"{store.nbytes / 1024:.0f}KiB of columns"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+from common.network import NullEnetPeer
+
+
+class FakeEnetPeer(NullEnetPeer):
+    """ENet peer that records what is sent to it, for NetPeers under test."""
+
+    def __init__(self, port: int = 1234, host: str = "127.0.0.1", mtu: int = 1400):
+        super().__init__(host, port)
+        self.mtu = mtu
+        self.sent: list[tuple[int, bytes]] = []
+        self.disconnected = False
+
+    def send(self, channel, packet):
+        self.sent.append((channel, packet.data))
+
+    def disconnect(self, data=0):
+        self.disconnected = True
@@ -0,0 +1,113 @@
+import struct
+
+import pytest
+
+from common.binary import ByteReader, ByteWriter, zigzag_decode, zigzag_encode
+
+
+def test_wire_format():
+    writer = ByteWriter()
+    writer.write_int8(-2)
+    writer.write_uint16(0x1234)
+    writer.write_int32(-1)
+    writer.write_float32(1.5)
+    writer.write_str("hé")
+    writer.write_bool(True)
+
+    assert writer.data == (
+        b"\xfe"
+        + b"\x34\x12"
+        + b"\xff\xff\xff\xff"
+        + struct.pack("<f", 1.5)
+        + b"\x03\x00"
+        + "hé".encode()
+        + b"\x01"
+    )
+
+
+def test_round_trip():
+    writer = ByteWriter(initial_capacity=1)
+    writer.write_int8(-100)
+    writer.write_int16(-30000)
+    writer.write_int32(-(2**31))
+    writer.write_int64(-(2**63))
+    writer.write_uint8(255)
+    writer.write_uint16(65535)
+    writer.write_uint32(2**32 - 1)
+    writer.write_uint64(2**64 - 1)
+    writer.write_float32(0.25)
+    writer.write_float64(1 / 3)
+    writer.write_str("Something")
+    writer.write_bool(False)
+
+    reader = ByteReader(writer.data)
+    assert reader.read_int8() == -100
+    assert reader.read_int16() == -30000
+    assert reader.read_int32() == -(2**31)
+    assert reader.read_int64() == -(2**63)
+    assert reader.read_uint8() == 255
+    assert reader.read_uint16() == 65535
+    assert reader.read_uint32() == 2**32 - 1
+    assert reader.read_uint64() == 2**64 - 1
+    assert reader.read_float32() == 0.25
+    assert reader.read_float64() == 1 / 3
+    assert reader.read_str() == "Something"
+    assert reader.read_bool() is False
+    assert reader.remaining == 0
+
+
+def test_view_is_zero_copy():
+    writer = ByteWriter()
+    writer.write_uint32(7)
+
+    with writer.view() as view:
+        assert view.tobytes() == writer.data
+        assert ByteReader(view).read_uint32() == 7
+
+    writer.clear()
+    writer.write_uint8(1)
+    assert writer.data == b"\x01"
+
+
+def test_read_past_end_raises():
+    reader = ByteReader(b"\x01")
+    with pytest.raises(struct.error):
+        reader.read_uint32()
+    with pytest.raises(struct.error):
+        reader.read_bytes(2)
+    assert reader.read_uint8() == 1
+    with pytest.raises(struct.error):
+        reader.read_uint8()
+
+
+def test_varints():
+    assert [zigzag_encode(i) for i in (0, -1, 1, -2, 2)] == [0, 1, 2, 3, 4]
+
+    values = [0, 1, -1, 63, -64, 64, 300, -(2**40), 2**62]
+    writer = ByteWriter(initial_capacity=1)
+    writer.write_varuint(127)
+    writer.write_varuint(128)
+    for v in values:
+        writer.write_varint(v)
+
+    assert writer.data[:3] == b"\x7f\x80\x01"
+
+    reader = ByteReader(writer.data)
+    assert reader.read_varuint() == 127
+    assert reader.read_varuint() == 128
+    assert [reader.read_varint() for _ in values] == values
+    assert [zigzag_decode(zigzag_encode(v)) for v in values] == values
+    assert reader.remaining == 0
+
+    with pytest.raises(struct.error):
+        ByteReader(b"\x80").read_varuint()
+
+
+def test_quantized():
+    writer = ByteWriter()
+    writer.write_quantized(-2.53, 1 / 16)
+
+    assert len(writer) == 1
+
+    reader = ByteReader(writer.data)
+    assert reader.read_quantized(1 / 16) == -2.5
@@ -0,0 +1,95 @@
+import asyncio
+
+from common.binary import ByteWriter
+from common.capture import (
+    CONNECT,
+    DISCONNECT,
+    INBOUND,
+    OUTBOUND,
+    SERVER,
+    PacketCapture,
+    read_capture,
+)
+from common.clock import VirtualClock
+from common.game import Game
+from common.network import DeliveryMode, MultiPacket, Packet, register_packets
+from common.replay import ReplayNetwork, replay
+from common.schema import UINT16
+from common.simulation import Simulation
+
+
+class CapturedPacket(Packet):
+    fields = {"value": UINT16}
+
+    def __init__(self, value: int):
+        self.value = value
+
+    @property
+    def delivery_mode(self):
+        return DeliveryMode.RELIABLE
+
+
+def _encode(packet: Packet):
+    writer = ByteWriter()
+    packet.encode(writer)
+    return writer.data
+
+
+def test_capture_and_replay(tmp_path):
+    register_packets([MultiPacket, CapturedPacket])
+    path = str(tmp_path / "traffic.cap")
+    peer = ("10.0.0.1", 4000)
+
+    tick = 10
+    capture = PacketCapture(path, SERVER, lambda: tick, flush_threshold=16)
+    capture.record_connect(peer)
+    capture.record_inbound(peer, DeliveryMode.RELIABLE, _encode(CapturedPacket(1)))
+    capture.record_outbound(peer, DeliveryMode.UNRELIABLE, b"\x00")
+    tick = 11
+    capture.record_inbound(peer, DeliveryMode.RELIABLE, _encode(CapturedPacket(2)))
+    capture.record_inbound(peer, DeliveryMode.RELIABLE, _encode(CapturedPacket(3)))
+    capture.record_disconnect(peer)
+    capture.close()
+
+    header, records = read_capture(path)
+    record_list = list(records)
+    assert header.side == SERVER
+    assert [r.kind for r in record_list] == [
+        CONNECT,
+        INBOUND,
+        OUTBOUND,
+        INBOUND,
+        INBOUND,
+        DISCONNECT,
+    ]
+    assert [r.tick_id for r in record_list] == [10, 10, 10, 11, 11, 11]
+    assert all(r.peer == peer for r in record_list)
+    assert record_list[2].mode == DeliveryMode.UNRELIABLE
+    assert record_list[2].payload == b"\x00"
+
+    # Each poll replays one captured tick.
+    network = ReplayNetwork(header, record_list)
+    received: list[int] = []
+    connected: list[tuple[str, int]] = []
+    network.listen(CapturedPacket, lambda p, _: received.append(p.value))
+    network.listen_connected(lambda p: connected.append(p.address))
+
+    network.poll()
+    assert connected == [peer]
+    assert received == [1]
+    assert len(network.connected_peers) == 1
+
+    network.poll()
+    assert received == [1, 2, 3]
+    assert network.finished
+    assert len(network.connected_peers) == 0
+    assert network.packets_replayed == 3
+
+    # On a virtual clock, the replay jumps from tick to tick instead of waiting.
+    network = ReplayNetwork(header, record_list)
+    clock = VirtualClock()
+    game = Game(network=network, simulation=Simulation(tick_rate=4, clock=clock))
+    stats = asyncio.run(replay(game, network, clock))
+    assert stats.iterations == 2 and stats.packets == 3
+    assert game.simulation.tick_id == 1
+    assert clock.now() == 0.5
@@ -0,0 +1,132 @@
+from typing import Collection
+
+from common.clock import VirtualClock
+from common.clock_sync import (
+    CLOCK_SNAP_TICKS,
+    INPUT_LEAD_TICKS,
+    MAX_CLOCK_SLEW,
+    ClockPing,
+    ClockPong,
+    ClockSync,
+)
+from common.network import DeliveryMode, NetPeer, NullNetwork, Packet
+from common.simulation import Simulation
+from tests.conftest import FakeEnetPeer
+
+TICK_RATE = 10
+STEP = 0.01
+
+
+class _ClientNetwork(NullNetwork):
+    def __init__(self):
+        super().__init__()
+        self.peer = NetPeer(FakeEnetPeer())
+        self.pings: list[ClockPing] = []
+
+    def publish(
+        self,
+        packet: Packet,
+        override_delivery_mode: DeliveryMode | None = None,
+        exclude_peers: list[NetPeer] | None = None,
+    ):
+        assert isinstance(packet, ClockPing)
+        self.pings.append(packet)
+
+    def is_server(self) -> bool:
+        return False
+
+    @property
+    def connected_peers(self) -> Collection[NetPeer]:
+        return [self.peer]
+
+
+class _Link:
+    """Carries pings to a server whose ticks started at server_start."""
+
+    def __init__(self, clock: VirtualClock, network: _ClientNetwork):
+        self.clock = clock
+        self.network = network
+        self.server_start = 3.0
+        self.delays = (0.02, 0.02)
+        self._in_flight: list[tuple[float, ClockPong]] = []
+
+    def server_tick(self, time: float) -> float:
+        return (time - self.server_start) * TICK_RATE
+
+    def run(self, seconds: float, sync: ClockSync, simulation: Simulation):
+        for _ in range(round(seconds / STEP)):
+            self.clock.advance(STEP)
+            now = self.clock.now()
+            for ping in self.network.pings:
+                there, back = self.delays
+                server_time = ping.client_time + there
+                pong = ClockPong(ping.client_time, self.server_tick(server_time))
+                self._in_flight.append((server_time + back, pong))
+            self.network.pings.clear()
+
+            arrived = [p for t, p in self._in_flight if t <= now]
+            self._in_flight = [(t, p) for t, p in self._in_flight if t > now]
+            for pong in arrived:
+                self.network.notify(pong, self.network.peer)
+
+            sync.update()
+            simulation.iterate()
+
+
+def _setup():
+    clock = VirtualClock(10.0)
+    simulation = Simulation(TICK_RATE, clock=clock)
+    simulation.start()
+    network = _ClientNetwork()
+    sync = ClockSync(network, simulation)
+    return clock, simulation, _Link(clock, network), sync
+
+
+def test_client_ticks_in_step_with_the_server():
+    clock, simulation, link, sync = _setup()
+
+    link.run(0.5, sync, simulation)
+    assert sync.synchronized
+    assert sync.rtt is not None and abs(sync.rtt - 0.04) < STEP
+
+    link.run(3.0, sync, simulation)
+    server_tick = link.server_tick(clock.now())
+    assert simulation.server_tick is not None
+    assert abs(simulation.server_tick - server_tick) < 0.01
+    # Client ticks run ahead, so that inputs reach the server in time.
+    assert abs(sync.lead_ticks - (0.02 * TICK_RATE + INPUT_LEAD_TICKS)) < 0.1
+    assert abs(simulation.tick_time - server_tick - sync.lead_ticks) < 0.05
+
+
+def test_late_pongs_do_not_skew_the_estimate():
+    clock, simulation, link, sync = _setup()
+    link.run(3.0, sync, simulation)
+
+    # A few pongs queued on their way back, which would make the server look late.
+    link.delays = (0.02, 0.3)
+    link.run(3.0, sync, simulation)
+    link.delays = (0.02, 0.02)
+
+    assert simulation.server_tick is not None
+    assert abs(simulation.server_tick - link.server_tick(clock.now())) < 0.01
+
+
+def test_estimate_drifts_to_small_corrections():
+    clock, simulation, link, sync = _setup()
+    link.run(3.0, sync, simulation)
+
+    link.server_start -= 0.1
+    offset = simulation.server_tick_offset
+    link.run(0.5, sync, simulation)
+    assert simulation.server_tick_offset is not None and offset is not None
+    assert simulation.server_tick_offset - offset <= MAX_CLOCK_SLEW * 0.5 * TICK_RATE
+
+    link.run(8.0, sync, simulation)
+    assert simulation.server_tick is not None
+    assert abs(simulation.server_tick - link.server_tick(clock.now())) < 0.01
+
+    # A server far off, as after a redirect, is jumped to.
+    link.server_start -= 10.0
+    link.run(20.0, sync, simulation)
+    server_tick = link.server_tick(clock.now())
+    assert abs(simulation.tick_time - server_tick - sync.lead_ticks) < CLOCK_SNAP_TICKS
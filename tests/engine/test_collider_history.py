@@ -0,0 +1,74 @@
+from typing import cast
+
+from common.behaviours.collider import Collider
+from common.collider_history import CIRCLE, RECT, ColliderHistory
+from common.primitives import Rect, Vector2
+
+
+class _Collider:
+    """Stands in for a collider, which the history only uses as a key."""
+
+    def __init__(self, name: str):
+        self.name = name
+
+
+def _colliders(*names: str):
+    return [cast(Collider, _Collider(name)) for name in names]
+
+
+def _rect(x: float, y: float, size: float = 10):
+    return Rect(Vector2(x, y), Vector2(size, size))
+
+
+def _centers(history: ColliderHistory, rect: Rect, tick: float):
+    return {
+        cast(_Collider, c).name: (r.center.x, r.center.y)
+        for c, r, _ in history.query(rect, tick)
+    }
+
+
+def test_queries_see_colliders_where_they_were():
+    a, b = _colliders("a", "b")
+    history = ColliderHistory(8)
+    for tick in range(20):
+        history.record(
+            tick, [(a, _rect(tick * 10, 0), RECT), (b, _rect(0, 50), CIRCLE)]
+        )
+
+    assert _centers(history, _rect(150, 0), 15) == {"a": (150, 0)}
+    assert _centers(history, _rect(155, 0, 2), 15.5) == {"a": (155, 0)}
+    assert _centers(history, _rect(0, 50), 19) == {"b": (0, 50)}
+    assert [kind for _, _, kind in history.query(_rect(0, 50), 19)] == [CIRCLE]
+
+    # Ticks outside of the history are clamped to it.
+    assert _centers(history, _rect(120, 0), 0) == {"a": (120, 0)}
+    assert _centers(history, _rect(190, 0), 30) == {"a": (190, 0)}
+
+
+def test_skipped_ticks_are_interpolated_over():
+    (a,) = _colliders("a")
+    history = ColliderHistory(8)
+    history.record(10, [(a, _rect(0, 0), RECT)])
+    history.record(14, [(a, _rect(40, 0), RECT)])
+
+    assert _centers(history, _rect(20, 0, 2), 12) == {"a": (20, 0)}
+
+
+def test_slots_of_removed_colliders_wait_for_the_history_to_wrap():
+    a, b = _colliders("a", "b")
+    history = ColliderHistory(4)
+    history.record(0, [(a, _rect(0, 0), RECT)])
+    history.remove(a)
+    history.record(1, [(b, _rect(100, 0), RECT)])
+
+    # a was removed, and no query can act on it anymore.
+    assert _centers(history, _rect(0, 0), 0) == {}
+    assert _centers(history, _rect(100, 0), 1) == {"b": (100, 0)}
+    assert len(history) == 1
+
+    (c,) = _colliders("c")
+    for tick in range(2, 6):
+        history.record(tick, [(b, _rect(100, 0), RECT)])
+    history.record(6, [(b, _rect(100, 0), RECT), (c, _rect(0, 0), RECT)])
+    assert history._slots[c] == 0
+    assert _centers(history, _rect(0, 0), 6) == {"c": (0, 0)}
@@ -0,0 +1,97 @@
+import zlib
+from typing import cast
+
+import pytest
+
+from common.compression import (
+    COMPRESSED_FRAME,
+    MAX_FRAME_SIZE,
+    FrameCompressor,
+    train_dictionary,
+)
+from common.network import (
+    DeliveryMode,
+    MultiPacket,
+    NetPeer,
+    OutboundStats,
+    Packet,
+    decode_packet,
+    get_protocol_checksum,
+    register_packets,
+    set_compression_dictionary,
+)
+from common.schema import STR
+from tests.conftest import FakeEnetPeer
+
+
+class TemplatePacket(Packet):
+    fields = {"template": STR}
+
+    def __init__(self, template: str):
+        self.template = template
+
+    @property
+    def delivery_mode(self):
+        return DeliveryMode.RELIABLE_ORDERED
+
+
+def _templates(n: int):
+    return [f"templates/spells/fireball_{i % 3}.json" for i in range(n)]
+
+
+def test_large_reliable_frames_are_compressed():
+    register_packets([MultiPacket, TemplatePacket])
+    enet_peer = FakeEnetPeer()
+    peer = NetPeer(enet_peer)
+    stats = OutboundStats()
+
+    for template in _templates(20):
+        peer.send(TemplatePacket(template))
+        peer.send(TemplatePacket(template), DeliveryMode.UNRELIABLE)
+    peer.flush(stats)
+
+    reliable, unreliable = [data for _, data in enet_peer.sent]
+    assert reliable[0] == COMPRESSED_FRAME
+    assert unreliable[0] != COMPRESSED_FRAME
+    assert stats.frames_compressed == 1
+    assert stats.bytes_compressed > 0
+
+    decoded = cast(MultiPacket, decode_packet(reliable))
+    assert [cast(TemplatePacket, p).template for p in decoded.packets] == _templates(20)
+
+
+def test_trained_dictionary_helps_and_changes_the_checksum():
+    register_packets([MultiPacket, TemplatePacket])
+    samples = [
+        f"templates/spells/fireball_{i}.json|player_{i}".encode() for i in range(200)
+    ]
+    dictionary = train_dictionary(samples, size=1024)
+    assert 0 < len(dictionary) <= 1024
+
+    frame = b"templates/spells/fireball_7.json|player_7" * 2
+    plain = FrameCompressor(threshold=0).compress(frame)
+    trained = FrameCompressor(dictionary, threshold=0).compress(frame)
+    assert plain is not None and trained is not None
+    assert len(trained) < len(plain)
+    assert FrameCompressor(dictionary).decompress(trained) == frame
+
+    checksum = get_protocol_checksum()
+    assert checksum != 0
+    try:
+        set_compression_dictionary(dictionary)
+        assert get_protocol_checksum() != checksum
+    finally:
+        set_compression_dictionary(None)
+    assert get_protocol_checksum() == checksum
+
+
+def test_frames_inflating_past_the_limit_are_rejected():
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+    bomb = compressor.compress(bytes(MAX_FRAME_SIZE + 1)) + compressor.flush()
+    assert len(bomb) < 2048
+
+    with pytest.raises(zlib.error):
+        decode_packet(bytes((COMPRESSED_FRAME,)) + bomb)
+
+    # Frames that large are sent uncompressed in the first place.
+    assert FrameCompressor().compress(bytes(MAX_FRAME_SIZE + 1)) is None
@@ -0,0 +1,139 @@
+import asyncio
+
+import enet
+
+from common.binary import ByteWriter
+from common.capture import CONNECT, DISCONNECT, INBOUND, OUTBOUND, read_capture
+from common.game import Game
+from common.network import (
+    DeliveryMode,
+    MultiPacket,
+    NetPeer,
+    Packet,
+    decode_packet,
+    get_protocol_checksum,
+    register_packets,
+)
+from common.schema import UINT16
+from server.hosting import GameHost, HostedNetwork
+from tests.conftest import FakeEnetPeer
+
+
+class HostedPacket(Packet):
+    fields = {"value": UINT16}
+
+    def __init__(self, value: int):
+        self.value = value
+
+    @property
+    def delivery_mode(self):
+        return DeliveryMode.RELIABLE
+
+
+def test_peers_are_routed_to_their_own_game():
+    connected: dict[int, list[NetPeer]] = {}
+
+    def create_game(network: HostedNetwork):
+        game = Game(network=network)
+        peers = connected.setdefault(id(game), [])
+        network.listen_connected(peers.append)
+        network.listen_disconnected(peers.remove)
+        return game
+
+    host = GameHost(create_game, lambda game, peer_count: peer_count < 2, port=0)
+
+    def handle(event_type: int, port: int):
+        host._handle_event(
+            event_type,
+            ("127.0.0.1", port),
+            FakeEnetPeer(port),
+            None,
+            b"",
+            get_protocol_checksum(),
+        )
+
+    async def iterate(n: int):
+        for _ in range(n):
+            await host.iterate()
+            await asyncio.sleep(host.next_wake_delay(0.02))
+
+    for port in (1, 2, 3):
+        handle(enet.EVENT_TYPE_CONNECT, port)
+    asyncio.run(iterate(3))
+
+    first, second = host.games
+    assert [p.address[1] for p in connected[id(first)]] == [1, 2]
+    assert [p.address[1] for p in connected[id(second)]] == [3]
+    assert [p.address[1] for p in second.network.connected_peers] == [3]
+
+    # Empty games are cleaned up, except for one spare that still accepts peers.
+    handle(enet.EVENT_TYPE_DISCONNECT, 3)
+    asyncio.run(iterate(3))
+    assert connected[id(second)] == []
+    assert host.games == [first, second]
+
+    handle(enet.EVENT_TYPE_DISCONNECT, 1)
+    handle(enet.EVENT_TYPE_DISCONNECT, 2)
+    asyncio.run(iterate(3))
+    assert host.games == [first]
+
+    # A suspended game resumes when a peer is routed to it.
+    handle(enet.EVENT_TYPE_CONNECT, 4)
+    asyncio.run(iterate(3))
+    assert [p.address[1] for p in connected[id(first)]] == [4]
+
+
+def test_every_game_is_captured_on_its_own(tmp_path):
+    register_packets([MultiPacket, HostedPacket])
+    host = GameHost(
+        lambda network: Game(network=network),
+        lambda game, peer_count: peer_count < 1,
+        port=0,
+    )
+    host.create_game()
+    host.capture_games(str(tmp_path / "traffic.cap"))
+
+    def handle(event_type: int, port: int, packet: Packet | None = None):
+        data = b""
+        if packet is not None:
+            writer = ByteWriter()
+            packet.encode(writer)
+            data = writer.data
+        host._handle_event(
+            event_type,
+            ("127.0.0.1", port),
+            FakeEnetPeer(port),
+            packet,
+            data,
+            get_protocol_checksum(),
+        )
+
+    async def iterate(n: int):
+        for _ in range(n):
+            await host.iterate()
+            await asyncio.sleep(host.next_wake_delay(0.02))
+
+    handle(enet.EVENT_TYPE_CONNECT, 1)
+    handle(enet.EVENT_TYPE_CONNECT, 2)
+    asyncio.run(iterate(2))
+    handle(enet.EVENT_TYPE_RECEIVE, 1, HostedPacket(10))
+    handle(enet.EVENT_TYPE_RECEIVE, 2, HostedPacket(20))
+    asyncio.run(iterate(2))
+    handle(enet.EVENT_TYPE_DISCONNECT, 2)
+    asyncio.run(iterate(2))
+    first, second = host.games
+    ticks = (first.simulation.tick_id, second.simulation.tick_id)
+    host.disconnect()
+
+    for number, port, value, tick_id in ((1, 1, 10, ticks[0]), (2, 2, 20, ticks[1])):
+        path = host.game_capture_path(number)
+        assert path is not None
+        _, all_records = read_capture(path)
+        records = [r for r in all_records if r.kind != OUTBOUND]
+        assert all(r.peer == ("127.0.0.1", port) for r in records)
+        assert all(0 <= r.tick_id <= tick_id for r in records)
+        assert [r.kind for r in records][:2] == [CONNECT, INBOUND]
+        packet = decode_packet(records[1].payload)
+        assert isinstance(packet, HostedPacket) and packet.value == value
+    # The peer of the second game left before the host stopped.
+    assert records[-1].kind == DISCONNECT
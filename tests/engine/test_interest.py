@@ -0,0 +1,60 @@
+from typing import Any, cast
+
+from common.interest import AreaOfInterest, InterestViewer, RelevanceHandler
+from common.network import NetPeer
+from common.primitives import Vector2
+
+
+class _Viewer(InterestViewer):
+    def __init__(self, peer):
+        self.peer = peer
+
+    def get_viewing_peer(self):
+        return self.peer
+
+
+class _AlwaysRelevant(RelevanceHandler):
+    def is_relevant_to(self, peer):
+        return True
+
+
+class _Node:
+    def __init__(self, behaviours):
+        self.behaviours = behaviours
+
+
+class _Transform:
+    def __init__(self, position):
+        self.position = position
+
+
+class _Entity:
+    def __init__(self, id: int, x: float, y: float, *behaviours):
+        self.id = id
+        self.transform = _Transform(Vector2(x, y))
+        self.node = _Node(list(behaviours))
+
+
+def test_area_of_interest():
+    peer = cast(NetPeer, object())
+    lonely_peer = cast(NetPeer, object())
+    aoi = AreaOfInterest(Vector2(200, 200), hysteresis=1.5, cell_size=50)
+
+    viewer = _Entity(1, 0, 0, _Viewer(peer))
+    near = _Entity(2, 90, -90)
+    edge = _Entity(3, 130, 0)
+    far = _Entity(4, 1000, 1000)
+    manager = _Entity(5, 5000, 5000, _AlwaysRelevant())
+    entities: list[Any] = [viewer, near, edge, far, manager]
+
+    relevant = aoi.compute(entities, [peer, lonely_peer], {peer: frozenset()})
+    assert relevant[peer] == {1, 2, 5}
+    assert relevant[lonely_peer] is None
+
+    # Entities already relevant stay so until they leave the larger rect.
+    relevant = aoi.compute(entities, [peer], {peer: frozenset({1, 2, 3, 5})})
+    assert relevant[peer] == {1, 2, 3, 5}
+
+    edge.transform.position = Vector2(160, 0)
+    relevant = aoi.compute(entities, [peer], relevant)
+    assert relevant[peer] == {1, 2, 5}
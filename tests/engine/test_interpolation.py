@@ -0,0 +1,72 @@
+from common.interpolation import (
+    MAX_INTERPOLATION_GAP,
+    InterpolationBuffer,
+    InterpolationTimeline,
+    lerp_angle,
+)
+
+
+def _position(buffer: InterpolationBuffer, tick: float):
+    sample = buffer.sample(tick)
+    assert sample is not None
+    return sample[1], sample[2]
+
+
+def test_buffer_interpolates_between_received_states():
+    buffer = InterpolationBuffer()
+    buffer.push(10, 0, 0, 350)
+    buffer.push(12, 8, -4, 10)
+
+    assert _position(buffer, 9) == (0, 0)
+    assert buffer.sample(11) == (11, 4, -2, 360, False)
+    # States are held past the newest one rather than extrapolated.
+    assert _position(buffer, 20) == (8, -4)
+
+
+def test_rotation_goes_the_shortest_way_around():
+    assert lerp_angle(350, 10, 0.25) == 355
+    assert lerp_angle(10, 350, 0.25) == 5
+
+
+def test_entities_stay_at_rest_until_they_move_again():
+    buffer = InterpolationBuffer()
+    buffer.push(10, 0, 0, 0)
+    buffer.push(10 + MAX_INTERPOLATION_GAP + 10, 10, 0, 0)
+    assert _position(buffer, 15) == (0, 0)
+
+    # Snapshots tell when the entity was still at rest.
+    buffer = InterpolationBuffer()
+    buffer.push(10, 0, 0, 0)
+    buffer.push(13, 10, 0, 0, still_at=12)
+    assert _position(buffer, 12) == (0, 0)
+    assert _position(buffer, 12.5) == (5, 0)
+
+
+def test_teleports_jump_even_when_received_late():
+    buffer = InterpolationBuffer()
+    buffer.push(10, 0, 0, 0)
+    buffer.push(11, 1, 0, 0)
+    # The state sent at the tick of the teleport may still be the old position.
+    buffer.push(12, 2, 0, 0)
+    buffer.push_teleport(12, 100, 0, 0)
+    buffer.push(12, 2, 0, 0)
+    buffer.push(13, 101, 0, 0)
+
+    assert _position(buffer, 11.5) == (1, 0)
+    assert _position(buffer, 12) == (100, 0)
+    assert _position(buffer, 12.5) == (100.5, 0)
+
+
+def test_timeline_renders_behind_the_smoothed_server_tick():
+    timeline = InterpolationTimeline(delay=0.125)
+    timeline.observe(100)
+    timeline.advance(0.25, tick_rate=8)
+    assert timeline.server_tick == 102
+    assert timeline.render_tick == 101
+
+    # A late update only pulls the estimate back by a fraction of the difference.
+    timeline.observe(101)
+    assert timeline.server_tick is not None and 101 < timeline.server_tick < 102
+    # Far off ticks reset it.
+    timeline.observe(200)
+    assert timeline.server_tick == 200
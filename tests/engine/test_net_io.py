@@ -0,0 +1,92 @@
+import asyncio
+import time
+
+import enet
+
+from common.binary import ByteWriter
+from common.net_io import NetIOThread, wait_for_host
+from common.network import MultiPacket, NullPacket, register_packets
+from tests.conftest import FakeEnetPeer
+
+
+class _Event:
+    def __init__(self, type, peer=None, payload=b"", data=0):
+        self.type = type
+        self.peer = peer
+        self.packet = enet.Packet(payload) if payload else None
+        self.data = data
+
+
+class _FakeHost:
+    def __init__(self, events):
+        self.events = events
+        self.flushes = 0
+
+    def service(self, timeout):
+        if self.events:
+            return self.events.pop(0)
+        return _Event(enet.EVENT_TYPE_NONE)
+
+    def flush(self):
+        self.flushes += 1
+
+
+def test_io_thread_hands_over_events_and_sends():
+    register_packets([MultiPacket, NullPacket])
+    writer = ByteWriter()
+    NullPacket().encode(writer)
+
+    peer = FakeEnetPeer()
+    host = _FakeHost(
+        [
+            _Event(enet.EVENT_TYPE_CONNECT, peer),
+            _Event(enet.EVENT_TYPE_RECEIVE, peer, writer.data),
+        ]
+    )
+    io = NetIOThread(host)
+    io.start()
+
+    events: list = []
+    deadline = time.monotonic() + 5
+    while len(events) < 2 and time.monotonic() < deadline:
+        events += io.drain()
+        time.sleep(0.001)
+
+    io.send(peer, 1, b"abc", 0)
+    io.flush()
+    io.stop()
+
+    assert [e[0] for e in events] == [enet.EVENT_TYPE_CONNECT, enet.EVENT_TYPE_RECEIVE]
+    assert events[0][1] == ("127.0.0.1", 1234)
+    assert isinstance(events[1][3], NullPacket)
+    assert peer.sent == [(1, b"abc")]
+    assert host.flushes >= 1
+
+
+def test_waiting_wakes_up_on_inbound_events():
+    async def wait(host, io, timeout):
+        started = time.monotonic()
+        await wait_for_host(host, io, timeout)
+        return time.monotonic() - started
+
+    # Without an I/O thread, the host's socket is watched from the event loop.
+    server = enet.Host(enet.Address(b"127.0.0.1", 0), 1, 0, 0, 0)
+    client = enet.Host(None, 1, 0, 0, 0)
+    client.connect(enet.Address(b"127.0.0.1", server.address.port), 1)
+    client.flush()
+    assert asyncio.run(wait(server, None, 5.0)) < 4.0
+
+    io = NetIOThread(_FakeHost([]))
+    io.start()
+    try:
+        assert asyncio.run(wait(None, io, 0.05)) >= 0.04
+
+        async def wait_for_event():
+            waiting = asyncio.ensure_future(wait(None, io, 5.0))
+            await asyncio.sleep(0.05)
+            io._host.events.append(_Event(enet.EVENT_TYPE_CONNECT, FakeEnetPeer()))
+            return await waiting
+
+        assert asyncio.run(wait_for_event()) < 4.0
+    finally:
+        io.stop()
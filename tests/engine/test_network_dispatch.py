@@ -0,0 +1,83 @@
+import asyncio
+from typing import Any, cast
+
+from common.network import DeliveryMode, MultiPacket, NetPeer, Network, Packet
+from common.schema import UINT8
+from tests.conftest import FakeEnetPeer
+
+
+class _FakeNetwork(Network):
+    def is_server(self):
+        return True
+
+    def is_client(self):
+        return False
+
+    def disconnect(self):
+        pass
+
+    def publish(self, packet, override_delivery_mode=None, exclude_peers=None):
+        pass
+
+    def poll(self):
+        pass
+
+    @property
+    def connected_peers(self):
+        return []
+
+
+class BasePacket(Packet):
+    fields = {"value": UINT8}
+
+    def __init__(self, value: int):
+        self.value = value
+
+    @property
+    def delivery_mode(self):
+        return DeliveryMode.UNRELIABLE
+
+
+class DerivedPacket(BasePacket):
+    pass
+
+
+def test_notify_dispatches_to_base_listeners_first():
+    network = _FakeNetwork()
+    peer = NetPeer(FakeEnetPeer())
+    received: list[tuple[str, Any]] = []
+
+    network.listen(DerivedPacket, lambda p, _: received.append(("derived", p.value)))
+    network.listen(BasePacket, lambda p, _: received.append(("base", p.value)))
+
+    network.notify(DerivedPacket(1), peer)
+    network.notify(BasePacket(2), peer)
+    assert received == [("base", 1), ("derived", 1), ("base", 2)]
+
+    # Listener changes invalidate the cached dispatch tables.
+    received.clear()
+    late = network.listen(
+        DerivedPacket, lambda p, _: received.append(("late", p.value))
+    )
+    network.notify(MultiPacket([DerivedPacket(3), BasePacket(4)]), peer)
+    assert received == [("base", 3), ("derived", 3), ("late", 3), ("base", 4)]
+
+    received.clear()
+    network.unlisten(DerivedPacket, late)
+    network.notify(DerivedPacket(5), peer)
+    assert received == [("base", 5), ("derived", 5)]
+
+
+def test_notify_resolves_expected_packets():
+    network = _FakeNetwork()
+    peer = NetPeer(FakeEnetPeer())
+
+    async def receive():
+        task = asyncio.create_task(peer.expect(BasePacket))
+        await asyncio.sleep(0)
+        network.notify(DerivedPacket(7), peer)
+        return await task
+
+    packet = cast(BasePacket, asyncio.run(receive()))
+    assert packet.value == 7
+    assert not peer._packet_futures
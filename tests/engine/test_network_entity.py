@@ -0,0 +1,30 @@
+from common.behaviours.network_entity import NetworkEntity, SyncVarUpdate
+from common.clock import VirtualClock
+from common.game import Game
+from common.network import DeliveryMode, NetPeer
+from common.node import Node
+from common.simulation import Simulation
+from tests.conftest import FakeEnetPeer
+
+
+def test_sync_var_updates_follow_server_ticks():
+    simulation = Simulation(tick_rate=10, clock=VirtualClock())
+    # Clients run ahead of the server.
+    simulation.align_tick(205)
+    entity = Node(Game(simulation=simulation)).add_behaviour(NetworkEntity)
+    health = entity.use_sync_var(int, 100)
+    peer = NetPeer(FakeEnetPeer())
+
+    def receive(tick_id: int, value: int):
+        update = SyncVarUpdate(
+            entity.id, tick_id, health._id, value, DeliveryMode.RELIABLE
+        )
+        entity._handle_sync_var_update(update, peer)
+
+    receive(200, 90)
+    receive(201, 80)
+    assert health.value == 80
+
+    # Updates that arrive out of order are still ignored.
+    receive(200, 90)
+    assert health.value == 80
@@ -0,0 +1,98 @@
+import json
+
+from common.binary import ByteWriter
+from common.net_metrics import (
+    INBOUND,
+    OUTBOUND,
+    Histogram,
+    MetricsExporter,
+    NetworkMetrics,
+)
+from common.network import (
+    DeliveryMode,
+    MultiPacket,
+    NetPeer,
+    Packet,
+    decode_packet,
+    register_packets,
+)
+from common.schema import UINT8
+from tests.conftest import FakeEnetPeer
+
+
+class _MeasuredEnetPeer(FakeEnetPeer):
+    roundTripTime = 40
+    roundTripTimeVariance = 5
+    packetLoss = 1 << 14
+    packetThrottle = 16
+
+
+class MetricsPacket(Packet):
+    fields = {"value": UINT8}
+
+    def __init__(self, value: int):
+        self.value = value
+
+    @property
+    def delivery_mode(self):
+        return DeliveryMode.UNRELIABLE
+
+
+def test_histogram_buckets_by_powers_of_two():
+    histogram = Histogram()
+    for value in (0, 1, 2, 3, 100):
+        histogram.add(value)
+
+    snapshot = histogram.snapshot()
+    assert snapshot["buckets"] == {0: 1, 1: 1, 3: 2, 127: 1}
+    assert snapshot["count"] == 5
+    assert snapshot["total"] == 106
+    assert snapshot["p50"] == 3
+
+
+def test_metrics_count_traffic_per_type_direction_and_mode(tmp_path):
+    register_packets([MultiPacket, MetricsPacket])
+    metrics = NetworkMetrics()
+
+    peer = NetPeer(_MeasuredEnetPeer())
+    peer._metrics = metrics
+    peer.send(MetricsPacket(1))
+    peer.send(MetricsPacket(2), DeliveryMode.RELIABLE)
+
+    sent = metrics.traffic(MetricsPacket, OUTBOUND, DeliveryMode.UNRELIABLE)
+    assert sent is not None and (sent.messages, sent.bytes) == (1, 2)
+    assert metrics.traffic(MetricsPacket, OUTBOUND, DeliveryMode.RELIABLE) is not None
+    assert metrics.encode_ns.count == 2
+
+    writer = ByteWriter()
+    MultiPacket([MetricsPacket(3), MetricsPacket(4)]).encode(writer)
+    decode_packet(writer.data, metrics)
+
+    received = metrics.traffic(MetricsPacket, INBOUND, DeliveryMode.UNRELIABLE)
+    assert received is not None and (received.messages, received.bytes) == (2, 4)
+    frames = metrics.traffic(MultiPacket, INBOUND, DeliveryMode.UNRELIABLE)
+    assert frames is not None and frames.bytes == len(writer.data)
+    assert metrics.decode_ns.count == 1
+
+    stats = peer.link_stats()
+    assert stats is not None
+    assert stats.round_trip_time == 40
+    assert stats.packet_loss == 0.25
+    assert stats.packet_throttle == 0.5
+
+    path = tmp_path / "metrics.jsonl"
+    exporter = MetricsExporter.from_target(str(path))
+    exporter.export(metrics.snapshot({"127.0.0.1:1234": stats}))
+    exporter.close()
+
+    snapshot = json.loads(path.read_text().splitlines()[0])
+    assert snapshot["peers"]["127.0.0.1:1234"]["round_trip_time"] == 40
+    assert {
+        (t["type"], t["direction"], t["mode"], t["messages"])
+        for t in snapshot["traffic"]
+        if t["type"] == "MetricsPacket"
+    } == {
+        ("MetricsPacket", "out", "UNRELIABLE", 1),
+        ("MetricsPacket", "out", "RELIABLE", 1),
+        ("MetricsPacket", "in", "UNRELIABLE", 2),
+    }
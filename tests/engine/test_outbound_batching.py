@@ -0,0 +1,67 @@
+from typing import cast
+
+from common.binary import ByteReader, ByteWriter
+from common.network import (
+    DeliveryMode,
+    MultiPacket,
+    NetPeer,
+    NullPacket,
+    OutboundStats,
+    Packet,
+    register_packets,
+)
+from common.schema import UINT16
+from tests.conftest import FakeEnetPeer
+
+
+class CounterPacket(Packet):
+    fields = {"value": UINT16}
+
+    def __init__(self, value: int):
+        self.value = value
+
+    @property
+    def delivery_mode(self):
+        return DeliveryMode.UNRELIABLE
+
+
+def test_flush_coalesces_queued_packets():
+    register_packets([MultiPacket, NullPacket, CounterPacket])
+    enet_peer = FakeEnetPeer(mtu=200)
+    peer = NetPeer(enet_peer)
+    stats = OutboundStats()
+
+    for i in range(300):
+        peer.send(CounterPacket(i))
+    peer.send(NullPacket(), DeliveryMode.RELIABLE_ORDERED)
+    peer.flush(stats)
+
+    assert stats.packets == 301
+    assert stats.frames == len(enet_peer.sent)
+    assert stats.frames < 301 // 10
+    assert stats.bytes_saved > 0
+
+    # Reliable packets are flushed before unreliable ones.
+    assert enet_peer.sent[0][0] == DeliveryMode.RELIABLE_ORDERED.to_enet()[0]
+
+    values = []
+    for _, frame in enet_peer.sent[1:]:
+        assert len(frame) <= peer.max_frame_size
+        decoded = Packet.decode(ByteReader(frame))
+        assert isinstance(decoded, MultiPacket)
+        values += [cast(CounterPacket, p).value for p in decoded.packets]
+    assert values == list(range(300))
+
+    enet_peer.sent.clear()
+    peer.flush(stats)
+    assert enet_peer.sent == []
+
+
+def test_multi_packet_holds_more_than_255_packets():
+    register_packets([MultiPacket, CounterPacket])
+    multi_packet = MultiPacket([CounterPacket(i) for i in range(1000)])
+
+    writer = ByteWriter()
+    multi_packet.encode(writer)
+    decoded = cast(MultiPacket, Packet.decode(ByteReader(writer.data)))
+    assert [cast(CounterPacket, p).value for p in decoded.packets] == list(range(1000))
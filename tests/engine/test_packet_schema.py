@@ -0,0 +1,149 @@
+from typing import cast
+
+import pytest
+
+from common.binary import ByteReader, ByteWriter
+from common.network import DeliveryMode, Packet, register_packets
+from common.primitives import Vector2
+from common.schema import (
+    BOOL,
+    INT32,
+    STR,
+    UINT8,
+    UINT32,
+    VARINT,
+    VECTOR2,
+    angle,
+    optional,
+    quantized,
+)
+
+
+class BaseSchemaPacket(Packet):
+    fields = {"entity_id": INT32, "tick_id": optional(UINT32)}
+
+    def __init__(self, entity_id: int, tick_id: int | None):
+        self.entity_id = entity_id
+        self.tick_id = tick_id
+
+    @property
+    def delivery_mode(self):
+        return DeliveryMode.RELIABLE
+
+
+class ChildSchemaPacket(BaseSchemaPacket):
+    fields = {
+        "name": STR,
+        "where": VECTOR2,
+        "flag": BOOL,
+        "label": optional(STR),
+        "level": UINT8,
+    }
+
+    def __init__(
+        self,
+        entity_id: int,
+        tick_id: int | None,
+        name: str,
+        where: Vector2,
+        flag: bool,
+        label: str | None,
+        level: int,
+    ):
+        super().__init__(entity_id, tick_id)
+        self.name = name
+        self.where = where
+        self.flag = flag
+        self.label = label
+        self.level = level
+
+
+def _round_trip(packet: Packet):
+    writer = ByteWriter()
+    packet.encode(writer)
+    reader = ByteReader(writer.data)
+    decoded = Packet.decode(reader)
+    assert reader.remaining == 0
+    return decoded
+
+
+def test_schema_round_trip():
+    register_packets([BaseSchemaPacket, ChildSchemaPacket])
+
+    packet = ChildSchemaPacket(7, None, "mage", Vector2(1.5, -3), True, "red", 3)
+
+    decoded = cast(ChildSchemaPacket, _round_trip(packet))
+    assert type(decoded) is ChildSchemaPacket
+    assert decoded.__dict__ == packet.__dict__
+
+    packet.tick_id = 99
+    packet.label = None
+    decoded = cast(ChildSchemaPacket, _round_trip(packet))
+    assert decoded.__dict__ == packet.__dict__
+
+
+def test_fixed_fields_share_one_prefix():
+    packet = BaseSchemaPacket(1, 2)
+
+    writer = ByteWriter()
+    packet.on_write(writer)
+    # Presence mask, entity id and then the present optional tick id.
+    assert writer.data == b"\x01" + b"\x01\x00\x00\x00" + b"\x02\x00\x00\x00"
+
+
+def test_fields_cannot_extend_hand_written_codec():
+    class HandWritten(Packet):
+        def on_write(self, writer: ByteWriter):
+            writer.write_uint8(1)
+
+        def on_read(self, reader: ByteReader):
+            reader.read_uint8()
+
+    with pytest.raises(TypeError):
+
+        class Extended(HandWritten):
+            fields = {"x": INT32}
+
+
+class CompactPacket(Packet):
+    fields = {
+        "delta": VARINT,
+        "x": quantized(1 / 16),
+        "heading": angle(256),
+        "alive": BOOL,
+        "visible": BOOL,
+    }
+
+    def __init__(
+        self, delta: int, x: float, heading: float, alive: bool, visible: bool
+    ):
+        self.delta = delta
+        self.x = x
+        self.heading = heading
+        self.alive = alive
+        self.visible = visible
+
+    @property
+    def delivery_mode(self):
+        return DeliveryMode.UNRELIABLE
+
+
+def test_compact_fields():
+    packet = CompactPacket(-3, 10.5, 90, True, False)
+
+    writer = ByteWriter()
+    packet.on_write(writer)
+    # Bool bits and the heading share the prefix, followed by both varints.
+    assert writer.data == b"\x01" + b"\x40" + b"\x05" + b"\xd0\x02"
+
+    decoded = CompactPacket(0, 0, 0, False, True)
+    decoded.on_read(ByteReader(writer.data))
+    assert decoded.__dict__ == packet.__dict__
+
+    packet = CompactPacket(0, 0.03, -90, False, True)
+    writer = ByteWriter()
+    packet.on_write(writer)
+    decoded.on_read(ByteReader(writer.data))
+    assert decoded.x == 0
+    assert decoded.heading == 270
+    assert decoded.visible and not decoded.alive
@@ -0,0 +1,31 @@
+from common.behaviours.physics_object import PhysicsObject
+from common.game import Game
+from common.primitives import Vector2
+
+
+def _physics_object(game: Game, x: float) -> PhysicsObject:
+    po = game.scene.add_child().add_behaviour(PhysicsObject)
+    po.transform.position = Vector2(x, 0)
+    po.on_pre_start()
+    po.collider.on_pre_start()
+    return po
+
+
+def test_predicted_motion_leaves_other_objects_alone():
+    game = Game()
+    game.scene.bind_to_game(game)
+    mover = _physics_object(game, 0)
+    other = _physics_object(game, 150)
+
+    # Predicted motion is replayed many times, and only stops at what it hits.
+    for _ in range(3):
+        mover.transform.position = Vector2(0, 0)
+        mover.move_and_collide_now(Vector2(100, 0), predicted=True)
+        assert mover.transform.position.x < 50
+    assert other._pending_motion == Vector2(0, 0)
+    assert not mover._contacts
+
+    mover.transform.position = Vector2(0, 0)
+    mover.move_and_collide_now(Vector2(100, 0))
+    assert other._pending_motion.x > 0
+    assert mover._contacts == {other.collider}
@@ -0,0 +1,65 @@
+from common.clock import VirtualClock
+from common.prediction import Prediction
+from common.simulation import Simulation
+
+# A point on a line, moving by its velocity every tick: (position, velocity).
+_State = tuple[int, int]
+
+
+def _step(state: _State, velocity: int | None) -> _State:
+    position, current = state
+    if velocity is not None:
+        current = velocity
+    return position + current, current
+
+
+def _predict(prediction: Prediction, inputs: dict[int, int], ticks: range):
+    for tick_id in ticks:
+        prediction.predict(tick_id, inputs.get(tick_id))
+
+
+def test_predicted_states_are_remembered_until_confirmed():
+    prediction = Prediction[_State, int]((0, 0), _step)
+    _predict(prediction, {10: 1, 13: 2}, range(10, 15))
+
+    assert prediction.state == (7, 2)
+    assert prediction.state_at(12) == (3, 1)
+    assert prediction.state_at(20) is None
+
+    prediction.confirm(12)
+    assert prediction.confirmed_tick == 12
+    assert prediction.state_at(12) is None
+    assert len(prediction) == 2
+
+
+def test_disagreements_replay_inputs_from_the_server_state():
+    prediction = Prediction[_State, int]((0, 0), _step)
+    _predict(prediction, {10: 1, 13: 2}, range(10, 15))
+
+    # The server was blocked at tick 11, but then got the order given at tick 13.
+    assert prediction.reconcile(11, (1, 1)) == (6, 2)
+    assert prediction.state_at(13) == (4, 2)
+    assert prediction.replays == 1
+
+    # Later predictions build on the replayed state.
+    prediction.predict(15)
+    assert prediction.state == (8, 2)
+
+
+def test_realigned_ticks_drop_the_history():
+    simulation = Simulation(tick_rate=10, clock=VirtualClock())
+    prediction = Prediction[_State, int]((0, 0), _step)
+    for tick_id in range(10, 15):
+        prediction.predict(tick_id, 1 if tick_id == 10 else None, simulation.tick_epoch)
+    prediction.confirm(12)
+
+    # Clock synchronization found the client far ahead of the server.
+    simulation.align_tick(6)
+    prediction.predict(simulation.tick_id, None, simulation.tick_epoch)
+
+    assert prediction.state == (6, 1)
+    assert len(prediction) == 1
+    assert prediction.state_at(12) is None
+    # Updates from the server for the new tick ids are no longer ignored.
+    assert prediction.confirmed_tick < 6
+    assert prediction.reconcile(6, (4, 1)) == (4, 1)
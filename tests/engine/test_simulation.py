@@ -0,0 +1,34 @@
+from common.behaviour import Behaviour
+from common.clock import VirtualClock
+from common.node import Node
+from common.simulation import Simulation
+
+
+class _Ticker(Behaviour):
+    def on_init(self):
+        self.ticks: list[int] = []
+
+    def on_tick(self, tick_id: int):
+        self.ticks.append(tick_id)
+
+
+def test_late_iterations_catch_up_then_drop_ticks():
+    clock = VirtualClock()
+    simulation = Simulation(tick_rate=4, max_catch_up_ticks=3, clock=clock)
+    ticker = Node().add_behaviour(_Ticker)
+    ticker._started = True
+    simulation.add_updatable(ticker)
+    simulation.start()
+
+    clock.advance(0.625)
+    simulation.iterate()
+    assert ticker.ticks == [0, 1]
+    assert simulation.stats.catch_up_ticks == 1
+    assert simulation.stats.overruns == 0
+
+    clock.advance(2.0)
+    simulation.iterate()
+    assert ticker.ticks == [0, 1, 2, 3, 4]
+    assert simulation.stats.overruns == 1
+    assert simulation.stats.dropped_ticks == 5
+    assert simulation.time_until_next_tick() == 0.125
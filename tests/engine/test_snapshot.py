@@ -0,0 +1,92 @@
+from typing import Collection, cast
+
+from common.behaviours.network_entity_manager import (
+    SNAPSHOT_HISTORY,
+    NetworkEntityManager,
+)
+from common.binary import ByteReader, ByteWriter
+from common.game import Game
+from common.network import NetPeer, NullNetwork, Packet, register_packets
+from common.node import Node
+from common.primitives import Vector2
+from common.snapshot import (
+    POSITION,
+    SYNC_VARS,
+    EntitySnapshot,
+    diff_snapshots,
+    merge_snapshot,
+)
+from tests.conftest import FakeEnetPeer
+
+
+class _ServerNetwork(NullNetwork):
+    def __init__(self):
+        super().__init__()
+        self.peer = NetPeer(FakeEnetPeer())
+
+    def is_client(self) -> bool:
+        return False
+
+    @property
+    def connected_peers(self) -> Collection[NetPeer]:
+        return [self.peer]
+
+
+def _transmit(snapshot: EntitySnapshot) -> EntitySnapshot:
+    writer = ByteWriter()
+    snapshot.encode(writer)
+    return cast(EntitySnapshot, Packet.decode(ByteReader(writer.data)))
+
+
+def test_delta_snapshots_rebuild_server_state():
+    register_packets([EntitySnapshot])
+
+    tick_0 = {
+        1: (0.0, 0.0, 0.0, 1.0, 1.0, (1, 500.0, True)),
+        2: (10.0, 5.0, 90.0, 1.0, 1.0, ("fireball", Vector2(1, 2))),
+    }
+    tick_1 = {
+        1: (4.0, 0.0, 0.0, 1.0, 1.0, (1, 499.5, True)),
+        3: (7.0, 7.0, 0.0, 2.0, 2.0, ()),
+    }
+
+    # Complete snapshot, as sent when the client has acknowledged nothing yet.
+    changes, removed = diff_snapshots(None, tick_0)
+    full = _transmit(EntitySnapshot(0, None, changes, removed))
+    assert full.baseline_tick is None
+    client_0 = merge_snapshot(None, full.changes, full.removed)
+    assert client_0 == tick_0
+
+    # Delta against the acknowledged snapshot only carries what changed.
+    changes, removed = diff_snapshots(tick_0, tick_1)
+    assert removed == [2]
+    entity_1 = next(c for c in changes if c[0] == 1)
+    assert entity_1[1] == POSITION | SYNC_VARS
+    assert entity_1[2] == 0b010
+
+    delta = _transmit(EntitySnapshot(1, 0, changes, removed))
+    assert delta.baseline_tick == 0
+    client_1 = merge_snapshot(client_0, delta.changes, delta.removed)
+    assert client_1 == tick_1
+
+
+def test_unchanged_snapshot_has_no_delta():
+    state = {1: (1.0, 2.0, 3.0, 1.0, 1.0, (False,))}
+    assert diff_snapshots(state, dict(state)) == ([], [])
+
+
+def test_snapshot_history_is_pruned_across_skipped_ticks():
+    network = _ServerNetwork()
+    manager = Node(Game(network=network)).add_behaviour(NetworkEntityManager)
+
+    # A loaded server catches up on ticks, and only publishes the last of them.
+    for tick_id in range(0, 400, 3):
+        manager._publish_snapshot(tick_id)
+
+    oldest = 399 - SNAPSHOT_HISTORY
+    for history in (
+        manager._snapshot_history,
+        manager._peer_sent_interest[network.peer],
+    ):
+        assert len(history) <= SNAPSHOT_HISTORY
+        assert min(history) > oldest
@@ -0,0 +1,67 @@
+import time
+from typing import cast
+
+import enet
+
+from common.game import Game
+from common.network import NetPeer, Packet, get_protocol_checksum
+from game.lobby import JoinGameRequest, JoinGameResponse
+from server.hosting import GameHost
+from server.supervisor import HEALTH_TIMEOUT, Supervisor
+from server.worker import WorkerHealth
+from tests.conftest import FakeEnetPeer
+
+
+class _Process:
+    def is_alive(self):
+        return True
+
+
+class _FakePeer:
+    def __init__(self):
+        self.sent: list[Packet] = []
+
+    def send(self, packet: Packet):
+        self.sent.append(packet)
+
+
+def _join(supervisor: Supervisor) -> JoinGameResponse:
+    peer = _FakePeer()
+    supervisor._handle_join_request(JoinGameRequest(), cast(NetPeer, peer))
+    return cast(JoinGameResponse, peer.sent[-1])
+
+
+def test_join_requests_go_to_the_least_loaded_healthy_worker():
+    supervisor = Supervisor(3, port=0)
+    now = time.monotonic()
+    for worker, peers in zip(supervisor.workers, (0, 1, 0)):
+        worker.process = _Process()  # type: ignore
+        worker.health = WorkerHealth(worker.index, worker.port, peers, 1, 0.1, 0, False)
+        worker.reported_at = now
+    idle, light, stale = supervisor.workers
+    stale.reported_at = now - HEALTH_TIMEOUT
+
+    # Players on their way count until the worker reports them.
+    ports = [_join(supervisor).redirect_port for _ in range(3)]
+    assert ports == [idle.port, idle.port, light.port]
+
+    supervisor.drain_worker(idle.index)
+    supervisor.drain_worker(light.index)
+    response = _join(supervisor)
+    assert not response.accepted and response.redirect_port is None
+
+
+def test_draining_host_turns_new_peers_away():
+    host = GameHost(lambda network: Game(network=network), port=0)
+    host.draining = True
+    enet_peer = FakeEnetPeer(1)
+    host._handle_event(
+        enet.EVENT_TYPE_CONNECT,
+        ("127.0.0.1", 1),
+        enet_peer,
+        None,
+        b"",
+        get_protocol_checksum(),
+    )
+    assert enet_peer.disconnected
+    assert host.peer_count == 0 and host.games == []
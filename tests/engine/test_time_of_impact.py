@@ -0,0 +1,97 @@
+import math
+
+import pytest
+
+from common.behaviours.collider import (
+    CircleCollisionShape,
+    RectCollisionShape,
+    shape_collides,
+    shape_time_of_impact,
+)
+from common.primitives import Vector2
+
+
+def _circle(x: float, y: float, radius: float):
+    return Vector2(x, y), CircleCollisionShape(radius)
+
+
+def _rect(x: float, y: float, w: float, h: float):
+    return Vector2(x, y), RectCollisionShape(Vector2(w, h))
+
+
+def _impact(a, motion: Vector2, b):
+    impact = shape_time_of_impact(a, motion, b)
+    assert impact is not None
+    time, normal = impact
+    return pytest.approx(time), (pytest.approx(normal.x), pytest.approx(normal.y))
+
+
+def test_moving_shapes_stop_where_they_touch():
+    assert _impact(_circle(0, 0, 1), Vector2(10, 0), _circle(6, 0, 1)) == (
+        0.4,
+        (-1, 0),
+    )
+    assert _impact(_rect(0, 0, 2, 2), Vector2(0, 10), _rect(0, 8, 4, 2)) == (
+        0.6,
+        (0, -1),
+    )
+    assert _impact(_circle(0, 0, 1), Vector2(0, -10), _rect(0, -6, 4, 2)) == (
+        0.4,
+        (0, 1),
+    )
+    assert _impact(_rect(0, 0, 2, 2), Vector2(-10, 0), _circle(-6, 0, 1)) == (
+        0.4,
+        (1, 0),
+    )
+
+
+def test_circles_round_the_corners_of_rects():
+    # Cuts the corner, which a rect of the size of the circle would hit.
+    a = _circle(-3, 0.9, 1)
+    assert shape_time_of_impact(a, Vector2(3, 3), _rect(0, 0, 2, 2)) is None
+    assert shape_time_of_impact(
+        (a[0], RectCollisionShape(Vector2(2, 2))), Vector2(3, 3), _rect(0, 0, 2, 2)
+    )
+
+    # Hits the corner head on.
+    a = _circle(-5, -5, math.sqrt(2))
+    time, normal = _impact(a, Vector2(10, 10), _rect(0, 0, 2, 2))
+    assert time == 0.3
+    assert normal == (-math.sqrt(0.5), -math.sqrt(0.5))
+
+
+def test_fast_shapes_do_not_tunnel_through_thin_ones():
+    wall = _rect(50, 0, 1, 100)
+    start = _circle(0, 0, 2)
+    motion = Vector2(100, 0)
+    assert not shape_collides((start[0] + motion, start[1]), wall)
+    assert _impact(start, motion, wall) == (0.475, (-1, 0))
+
+
+def test_overlapping_shapes_only_hit_when_going_deeper():
+    assert _impact(_circle(1, 0, 1), Vector2(-1, 0), _circle(0, 0, 1)) == (0, (1, 0))
+    assert (
+        shape_time_of_impact(_circle(1, 0, 1), Vector2(1, 0), _circle(0, 0, 1)) is None
+    )
+
+    # Shapes on top of each other, as projectiles leaving their caster, are free
+    # to go in any direction.
+    assert (
+        shape_time_of_impact(_rect(0, 0, 4, 4), Vector2(1, 1), _rect(0, 0, 4, 4))
+        is None
+    )
+    assert _impact(_rect(1, 0, 4, 4), Vector2(-1, 0), _rect(0, 0, 4, 4)) == (0, (1, 0))
+
+
+def test_missing_or_still_shapes_have_no_impact():
+    assert (
+        shape_time_of_impact(_circle(0, 0, 1), Vector2(1, 0), _circle(6, 0, 1)) is None
+    )
+    assert (
+        shape_time_of_impact(_rect(0, 0, 2, 2), Vector2(0, 0), _rect(3, 0, 2, 2))
+        is None
+    )
+    assert (
+        shape_time_of_impact(_rect(0, 0, 2, 2), Vector2(10, 0), _rect(5, 10, 2, 2))
+        is None
+    )
@@ -0,0 +1,74 @@
+from common.node import Node
+from common.primitives import Vector2
+
+
+def _chain():
+    root = Node()
+    child = root.add_child()
+    grandchild = child.add_child()
+    return root, child, grandchild
+
+
+def test_world_values_follow_changes_of_ancestors():
+    root, child, grandchild = _chain()
+    child.transform.local_position = Vector2(10, 0)
+    grandchild.transform.local_position = Vector2(0, 5)
+    assert grandchild.transform.position == Vector2(10, 5)
+
+    root.transform.local_rotation = 90
+    root.transform.local_scale = Vector2(2, 3)
+    root.transform.position = Vector2(1, 1)
+    assert child.transform.position == Vector2(1, 11)
+    assert grandchild.transform.rotation == 90
+    assert grandchild.transform.scale == Vector2(2, 3)
+
+    grandchild.transform.position = Vector2(0, 0)
+    assert grandchild.transform.position == Vector2(0, 0)
+    assert child.transform.position == Vector2(1, 11)
+
+
+def test_versions_change_with_the_world_transform():
+    root, child, grandchild = _chain()
+    versions = [n.transform.version for n in (root, child, grandchild)]
+
+    # Reading does not change anything.
+    assert grandchild.transform.position == Vector2(0, 0)
+    assert [n.transform.version for n in (root, child, grandchild)] == versions
+
+    child.transform.local_rotation = 45
+    assert root.transform.version == versions[0]
+    assert child.transform.version > versions[1]
+    assert grandchild.transform.version > versions[2]
+
+
+def test_reparenting_invalidates_the_subtree():
+    root, child, grandchild = _chain()
+    other = Node()
+    other.transform.local_position = Vector2(100, 0)
+    version = grandchild.transform.version
+
+    child.parent = other
+    assert grandchild.transform.version > version
+    assert grandchild.transform.position == Vector2(100, 0)
+
+    child.parent = None
+    assert grandchild.transform.position == Vector2(0, 0)
+
+
+def test_listeners_hear_of_changes_since_the_last_read():
+    root, child, grandchild = _chain()
+    changes: list[str] = []
+    child.transform.listen_changed(lambda: changes.append("child"))
+    grandchild.transform.listen_changed(lambda: changes.append("grandchild"))
+    grandchild.transform.position
+
+    root.transform.local_position = Vector2(5, 0)
+    assert changes == ["child", "grandchild"]
+
+    # Nothing read the new transform yet.
+    root.transform.local_position = Vector2(6, 0)
+    assert changes == ["child", "grandchild"]
+
+    assert grandchild.transform.position == Vector2(6, 0)
+    grandchild.transform.local_rotation = 10
+    assert changes == ["child", "grandchild", "grandchild"]
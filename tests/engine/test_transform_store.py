@@ -0,0 +1,111 @@
+import random
+
+import pytest
+
+from common.game import Game
+from common.node import Node
+from common.primitives import Vector2
+from common.transform_store import TransformStore
+
+
+def _world(node: Node):
+    t = node.transform
+    return (t.position.x, t.position.y, t.rotation, t.scale.x, t.scale.y)
+
+
+def _column(store: TransformStore, node: Node):
+    slot = node.transform._slot
+    return (
+        store.x[slot],
+        store.y[slot],
+        store.rotation[slot],
+        store.scale_x[slot],
+        store.scale_y[slot],
+    )
+
+
+def _game(store: TransformStore | None = None) -> Game:
+    game = Game(transform_store=store)
+    # As when the game starts.
+    game.scene.bind_to_game(game)
+    return game
+
+
+def _build(game: Game, rng: random.Random) -> list[Node]:
+    nodes = [game.scene]
+    for _ in range(40):
+        node = rng.choice(nodes).add_child()
+        nodes.append(node)
+    return nodes
+
+
+def _shuffle(nodes: list[Node], rng: random.Random):
+    for node in rng.sample(nodes, 10):
+        t = node.transform
+        t.local_position = Vector2(rng.uniform(-50, 50), rng.uniform(-50, 50))
+        t.local_rotation = rng.uniform(0, 360)
+        t.local_scale = Vector2(rng.uniform(0.5, 2), rng.uniform(0.5, 2))
+
+
+def test_stored_transforms_match_transforms_of_their_own():
+    store = TransformStore(capacity=4)
+    stored = _build(_game(store), random.Random(1))
+    plain = _build(_game(), random.Random(1))
+    assert len(store) == len(stored) and store.capacity >= len(stored)
+
+    for seed in range(5):
+        _shuffle(stored, random.Random(seed))
+        _shuffle(plain, random.Random(seed))
+        # Half of the stale transforms are refreshed one at a time.
+        for node in stored[::2]:
+            node.transform.position
+        store.refresh()
+        for a, b in zip(stored, plain):
+            assert _column(store, a) == pytest.approx(_world(b))
+            assert _world(a) == pytest.approx(_world(b))
+
+
+def test_transforms_follow_their_node_in_and_out_of_the_store():
+    store = TransformStore()
+    game = _game(store)
+    parent = game.scene.add_child()
+    child = parent.add_child()
+    parent.transform.local_position = Vector2(10, 0)
+    child.transform.local_position = Vector2(0, 5)
+    assert child.transform.position == Vector2(10, 5)
+
+    # Nodes outside of the game keep their transform to themselves.
+    outside = Node()
+    outside.transform.local_rotation = 90
+    parent.parent = outside
+    assert child.transform._store is None
+    assert child.transform.position == Vector2(-5, 10)
+    assert len(store) == 1
+
+    parent.parent = game.scene
+    assert child.transform._store is store
+    assert store.depth[child.transform._slot] == 2
+    store.refresh()
+    assert _column(store, child) == pytest.approx((10, 5, 0, 1, 1))
+
+    freed = {parent.transform._slot, child.transform._slot}
+    parent.destroy()
+    assert len(store) == 1
+    assert all(store.transform(slot) is None for slot in freed)
+    assert game.scene.add_child().transform._slot in freed
+
+
+def test_stored_transforms_tell_listeners_of_changes():
+    store = TransformStore()
+    game = _game(store)
+    node = game.scene.add_child()
+    changes: list[int] = []
+    node.transform.listen_changed(lambda: changes.append(node.transform._version))
+    node.transform.position
+
+    version = node.transform.version
+    game.scene.transform.local_position = Vector2(1, 2)
+    assert changes == [version + 1]
+    store.refresh()
+    assert node.transform.version == version + 1
+    assert node.transform.position == Vector2(1, 2)
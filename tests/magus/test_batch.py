@@ -0,0 +1,26 @@
+from server.batch import MatchResult, MatchSpec, run_match, summarize
+
+
+def test_match_runs_on_a_virtual_clock():
+    result = run_match(MatchSpec(seed=7, bot="idle", duration=1.0, tick_rate=24))
+
+    assert result.ticks == 24
+    assert result.simulated_seconds == 1.0
+    # Idle mages lose health at the same pace, so nobody wins.
+    assert result.winner is None
+    assert len(result.health) == 2 and result.health[0] == result.health[1]
+    assert result.behaviour_timings["Mage"] > 0
+
+
+def test_summarize_adds_up_matches():
+    results = [
+        MatchResult(1, 100, 4.0, 0.5, 0, [10, 0], {"Mage": 0.001}),
+        MatchResult(2, 300, 12.0, 1.5, None, [0, 0], {"Mage": 0.003}),
+    ]
+    report = summarize(results, workers=2, wall_seconds=1.0)
+
+    assert report.ticks == 400
+    assert report.ticks_per_second == 400
+    assert report.match_ticks_per_second == 200
+    assert report.outcomes == {"player 0": 1, "draw": 1}
+    assert report.behaviour_us_per_tick == {"Mage": 10.0}
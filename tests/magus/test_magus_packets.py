@@ -1,12 +1,28 @@
 from typing import cast
 
+from common.behaviours.network_entity import PositionUpdate, RotationUpdate
 from common.behaviours.network_entity_manager import SpawnEntity
 from common.binary import ByteReader, ByteWriter
 from common.network import Packet, register_packets
+from common.primitives import Vector2
+from game.lobby import JoinGameResponse, PlayerJoined, UpdateLobbyInfo
+from game.mage import AddSpell, CastPointTargetSpellOrder, MoveToOrder
 
 
 def test_packets_simmetry():
-    packets = [SpawnEntity(0, "mage")]
+    packets = [
+        SpawnEntity(0, "mage"),
+        SpawnEntity(3, None, 2),
+        PositionUpdate(12, 3, 1.5, -2.0),
+        RotationUpdate(12, 3, 90),
+        MoveToOrder(3, Vector2(10, 20)),
+        CastPointTargetSpellOrder(3, 4, Vector2(-5, 5)),
+        AddSpell(3, 4, "fireball"),
+        JoinGameResponse(True),
+        PlayerJoined(1, 2, False),
+        UpdateLobbyInfo("Lobby", None),
+        UpdateLobbyInfo(None, 8),
+    ]
 
     register_packets([packet.__class__ for packet in packets])
 
@@ -16,6 +32,8 @@ def test_packets_simmetry():
 
         reader = ByteReader(writer.data)
         decoded = Packet.decode(reader)
+        assert type(decoded) is type(packet)
+        assert reader.remaining == 0
         for (
             k,
             v,